@@ -0,0 +1,121 @@
+"""Aggregation and send-on-delta filtering of readings before the upload."""
+import credentials
+import metrics
+import rules
+
+from array import array
+from utime import time
+
+
+class Aggregator():
+    """
+    Rolling min, max and mean of every series over a window of samples.
+
+    A series is one value of one device, e.g. the humidity of the second
+    BME280, identified by its index in the values of the sensor backend.
+    At the end of every window of samples the mean of a series is uploaded,
+    together with the minimum and maximum of its samples, only if
+
+    - it moved by at least the deadband of its unit since the last
+      uploaded value (send on delta),
+    - the series was not uploaded for heartbeat seconds, or
+    - the window is urgent, e.g. because a critical value was broken.
+
+    Deadbands are given in hundredths per unitId, a heartbeat of 0 turns
+    the heartbeat off. With a window of 1 and no deadbands every reading is
+    uploaded, like without aggregation.
+
+    Samples are summed as differences to the first sample of the window,
+    so a pressure of about 10^7 hundredths stays a small int over long
+    windows. The uploaded and suppressed means are counted in metrics.py.
+    """
+
+    def __init__(self, units, tags, window=1, deadbands=None, heartbeat=0):
+        """Prepare the series of the given unitIds and sensor tags."""
+        series = len(units)
+        self.units = units
+        self.tags = tags
+        self.window = max(1, window)
+        self.heartbeat = heartbeat
+        if deadbands is None:
+            deadbands = {}
+        self.deadbands = array('i', [deadbands.get(unit_id, 0)
+                                     for unit_id in units])
+        self.samples = 0
+        self.count = array('i', bytes(4 * series))
+        self.base = array('i', bytes(4 * series))
+        self.sum = array('i', bytes(4 * series))
+        self.min = array('i', bytes(4 * series))
+        self.max = array('i', bytes(4 * series))
+        self.sent = array('i', bytes(4 * series))
+        self.sent_at = array('i', bytes(4 * series))
+        self.has_sent = bytearray(series)
+
+    def add(self, index, value):
+        """Add a sample of a series in hundredths."""
+        count = self.count[index]
+        if not count:
+            self.base[index] = value
+            self.min[index] = value
+            self.max[index] = value
+        elif value < self.min[index]:
+            self.min[index] = value
+        elif value > self.max[index]:
+            self.max[index] = value
+        self.sum[index] += value - self.base[index]
+        self.count[index] = count + 1
+
+    def end_sample(self, uploader, urgent=False):
+        """
+        Close a sample of all series.
+
+        At the end of a window the means worth sending are added to the
+        uploader. Returns True if a window was closed.
+        """
+        self.samples += 1
+        if self.samples < self.window and not urgent:
+            return False
+        now = time()
+        for index in range(len(self.units)):
+            count = self.count[index]
+            if not count:
+                continue
+            mean = self.base[index] + (self.sum[index] + count // 2) // count
+            if self._worth_sending(index, mean, now, urgent):
+                if count > 1:
+                    uploader.add(mean, self.units[index], now,
+                                 self.tags[index], self.min[index],
+                                 self.max[index])
+                else:
+                    uploader.add(mean, self.units[index], now,
+                                 self.tags[index])
+                self.sent[index] = mean
+                self.sent_at[index] = now
+                self.has_sent[index] = 1
+                metrics.increment(metrics.AGGREGATE_UPLOADED)
+            else:
+                metrics.increment(metrics.AGGREGATE_SUPPRESSED)
+            self.count[index] = 0
+            self.sum[index] = 0
+        self.samples = 0
+        return True
+
+    def _worth_sending(self, index, mean, now, urgent):
+        """Return True if the mean of a series should be uploaded."""
+        if urgent or not self.has_sent[index]:
+            return True
+        if abs(mean - self.sent[index]) >= self.deadbands[index]:
+            return True
+        return bool(self.heartbeat) and \
+            now - self.sent_at[index] >= self.heartbeat
+
+
+def create_aggregator(units, tags):
+    """Return an aggregator configured by the credentials."""
+    deadbands = {}
+    configured = getattr(credentials, 'deadbands', {})
+    for unit_id in configured:
+        deadbands[unit_id] = rules.to_hundredths(configured[unit_id])
+    return Aggregator(
+        units, tags, getattr(credentials, 'aggregate_samples', 1),
+        deadbands, getattr(credentials, 'heartbeat', 0))
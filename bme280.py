@@ -46,8 +46,35 @@ BME280_OSAMPLE_4 = 3
 BME280_OSAMPLE_8 = 4
 BME280_OSAMPLE_16 = 5
 
+# Power modes
+BME280_MODE_SLEEP = 0
+BME280_MODE_FORCED = 1
+BME280_MODE_NORMAL = 3
+
+# IIR filter coefficients
+BME280_FILTER_OFF = 0
+BME280_FILTER_2 = 1
+BME280_FILTER_4 = 2
+BME280_FILTER_8 = 3
+BME280_FILTER_16 = 4
+
+# Standby times between measurements in normal mode
+BME280_STANDBY_0_5 = 0
+BME280_STANDBY_62_5 = 1
+BME280_STANDBY_125 = 2
+BME280_STANDBY_250 = 3
+BME280_STANDBY_500 = 4
+BME280_STANDBY_1000 = 5
+BME280_STANDBY_10 = 6
+BME280_STANDBY_20 = 7
+
 BME280_REGISTER_CONTROL_HUM = 0xF2
+BME280_REGISTER_STATUS = 0xF3
 BME280_REGISTER_CONTROL = 0xF4
+BME280_REGISTER_CONFIG = 0xF5
+
+# measuring bit of the status register
+BME280_STATUS_MEASURING = 0x08
 
 
 class BME280:
@@ -56,39 +83,64 @@ class BME280:
                  mode=BME280_OSAMPLE_1,
                  address=BME280_I2CADDR,
                  i2c=None,
+                 calibration=None,
+                 compensator=None,
+                 temp_mode=None,
+                 press_mode=None,
+                 hum_mode=None,
+                 power_mode=BME280_MODE_FORCED,
+                 iir_filter=BME280_FILTER_OFF,
+                 standby=BME280_STANDBY_0_5,
                  **kwargs):
-        # Check that mode is valid.
-        if mode not in [BME280_OSAMPLE_1, BME280_OSAMPLE_2, BME280_OSAMPLE_4,
-                        BME280_OSAMPLE_8, BME280_OSAMPLE_16]:
+        # mode is the oversampling of every channel without its own setting
+        if temp_mode is None:
+            temp_mode = mode
+        if press_mode is None:
+            press_mode = mode
+        if hum_mode is None:
+            hum_mode = mode
+        # Check that the modes are valid.
+        for osample in (mode, temp_mode, press_mode, hum_mode):
+            if osample not in [BME280_OSAMPLE_1, BME280_OSAMPLE_2,
+                               BME280_OSAMPLE_4, BME280_OSAMPLE_8,
+                               BME280_OSAMPLE_16]:
+                raise ValueError(
+                    'Unexpected mode value {0}. Set mode to one of '
+                    'BME280_ULTRALOWPOWER, BME280_STANDARD, BME280_HIGHRES, '
+                    'or BME280_ULTRAHIGHRES'.format(osample))
+        if power_mode not in (BME280_MODE_FORCED, BME280_MODE_NORMAL):
             raise ValueError(
-                'Unexpected mode value {0}. Set mode to one of '
-                'BME280_ULTRALOWPOWER, BME280_STANDARD, BME280_HIGHRES, or '
-                'BME280_ULTRAHIGHRES'.format(mode))
+                'Unexpected power mode {0}. Set power_mode to '
+                'BME280_MODE_FORCED or BME280_MODE_NORMAL'.format(power_mode))
+        if iir_filter not in range(BME280_FILTER_16 + 1):
+            raise ValueError('Unexpected filter value {0}'.format(iir_filter))
+        if standby not in range(BME280_STANDBY_20 + 1):
+            raise ValueError('Unexpected standby value {0}'.format(standby))
         self._mode = mode
+        self._temp_mode = temp_mode
+        self._press_mode = press_mode
+        self._hum_mode = hum_mode
+        self._power_mode = power_mode
+        self._filter = iir_filter
+        self._standby = standby
         self.address = address
         if i2c is None:
             raise ValueError('An I2C object is required.')
         self.i2c = i2c
 
-        # load calibration data
-        dig_88_a1 = self.i2c.readfrom_mem(self.address, 0x88, 26)
-        dig_e1_e7 = self.i2c.readfrom_mem(self.address, 0xE1, 7)
+        if calibration is None:
+            calibration = self.read_calibration()
+        # calibration data, in the order of the calibration property
         self.dig_T1, self.dig_T2, self.dig_T3, self.dig_P1, \
             self.dig_P2, self.dig_P3, self.dig_P4, self.dig_P5, \
             self.dig_P6, self.dig_P7, self.dig_P8, self.dig_P9, \
-            _, self.dig_H1 = unpack("<HhhHhhhhhhhhBB", dig_88_a1)
-
-        self.dig_H2, self.dig_H3 = unpack("<hB", dig_e1_e7)
-        e4_sign = unpack_from("<b", dig_e1_e7, 3)[0]
-        self.dig_H4 = (e4_sign << 4) | (dig_e1_e7[4] & 0xF)
+            self.dig_H1, self.dig_H2, self.dig_H3, self.dig_H4, \
+            self.dig_H5, self.dig_H6 = calibration
+        # optional compensation engine, e.g. bme280_int.Compensator
+        self.compensator = None
+        if compensator is not None:
+            self.compensator = compensator(calibration)
 
-        e6_sign = unpack_from("<b", dig_e1_e7, 5)[0]
-        self.dig_H5 = (e6_sign << 4) | (dig_e1_e7[4] >> 4)
-
-        self.dig_H6 = unpack_from("<b", dig_e1_e7, 6)[0]
-
-        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
-                             bytearray([0x3F]))
         self.t_fine = 0
 
         # temporary data holders which stay allocated
@@ -96,26 +148,127 @@ class BME280:
         self._l8_barray = bytearray(8)
         self._l3_resultarray = array("i", [0, 0, 0])
 
-    def read_raw_data(self, result):
+        self.configure()
+
+    def configure(self):
+        """ Writes the oversampling, filter and standby settings.
+            In forced mode the sensor sleeps until read_raw_data triggers a
+            measurement. In normal mode it measures on its own every
+            standby time and read_raw_data returns the latest result.
+        """
+        ctrl_meas = self._temp_mode << 5 | self._press_mode << 2
+        # The config register is only written reliably in sleep mode.
+        self._l1_barray[0] = ctrl_meas | BME280_MODE_SLEEP
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
+                             self._l1_barray)
+        self._l1_barray[0] = self._standby << 5 | self._filter << 2
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONFIG,
+                             self._l1_barray)
+        # ctrl_hum becomes effective with the next write of ctrl_meas
+        self._l1_barray[0] = self._hum_mode
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL_HUM,
+                             self._l1_barray)
+        self._ctrl_meas = ctrl_meas | self._power_mode
+
+        # measurement times of the datasheet (appendix B) in us
+        osamples = ((1 << self._temp_mode) + (1 << self._press_mode) +
+                    (1 << self._hum_mode)) >> 1
+        self._typical_us = 2000 + 2000 * osamples
+        self._max_us = 2400 + 2300 * osamples
+
+        if self._power_mode == BME280_MODE_NORMAL:
+            self._l1_barray[0] = self._ctrl_meas
+            self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
+                                 self._l1_barray)
+            # wait for the first measurement
+            time.sleep_us(self._max_us)
+
+    @property
+    def measure_time_us(self):
+        """The typical time of a forced measurement in us."""
+        return self._typical_us
+
+    def is_measuring(self):
+        """ Returns True while the sensor is converting a measurement. """
+        self.i2c.readfrom_mem_into(self.address, BME280_REGISTER_STATUS,
+                                   self._l1_barray)
+        return self._l1_barray[0] & BME280_STATUS_MEASURING
+
+    def start_measurement(self):
+        """ Triggers a measurement in forced mode.
+            In normal mode the sensor measures on its own and nothing is
+            done.
+        """
+        if self._power_mode == BME280_MODE_FORCED:
+            # ctrl_hum is kept by the sensor, writing ctrl_meas is enough
+            self._l1_barray[0] = self._ctrl_meas
+            self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
+                                 self._l1_barray)
+
+    def wait_measurement(self, waited=0):
+        """ Waits until a triggered measurement is done.
+            The typical time is slept, then the status register is polled
+            until the measurement is done, at most for the maximum time.
+            Args:
+                waited: time in us already waited since the trigger
+        """
+        if self._power_mode != BME280_MODE_FORCED:
+            return
+        if waited < self._typical_us:
+            time.sleep_us(self._typical_us - waited)
+            waited = self._typical_us
+        while waited < self._max_us and self.is_measuring():
+            time.sleep_us(200)
+            waited += 200
+
+    def read_calibration(self):
+        """ Reads the calibration data from the sensor.
+            Returns:
+                tuple with dig_T1 to dig_T3, dig_P1 to dig_P9 and dig_H1 to
+                dig_H6, which may be passed as calibration to the
+                constructor to skip reading it again
+        """
+        dig_88_a1 = self.i2c.readfrom_mem(self.address, 0x88, 26)
+        dig_e1_e7 = self.i2c.readfrom_mem(self.address, 0xE1, 7)
+        dig_T1, dig_T2, dig_T3, dig_P1, dig_P2, dig_P3, dig_P4, dig_P5, \
+            dig_P6, dig_P7, dig_P8, dig_P9, \
+            _, dig_H1 = unpack("<HhhHhhhhhhhhBB", dig_88_a1)
+
+        dig_H2, dig_H3 = unpack_from("<hB", dig_e1_e7)
+        e4_sign = unpack_from("<b", dig_e1_e7, 3)[0]
+        dig_H4 = (e4_sign << 4) | (dig_e1_e7[4] & 0xF)
+
+        e6_sign = unpack_from("<b", dig_e1_e7, 5)[0]
+        dig_H5 = (e6_sign << 4) | (dig_e1_e7[4] >> 4)
+
+        dig_H6 = unpack_from("<b", dig_e1_e7, 6)[0]
+        return (dig_T1, dig_T2, dig_T3, dig_P1, dig_P2, dig_P3, dig_P4,
+                dig_P5, dig_P6, dig_P7, dig_P8, dig_P9, dig_H1, dig_H2,
+                dig_H3, dig_H4, dig_H5, dig_H6)
+
+    @property
+    def calibration(self):
+        """The calibration data, see read_calibration."""
+        return (self.dig_T1, self.dig_T2, self.dig_T3, self.dig_P1,
+                self.dig_P2, self.dig_P3, self.dig_P4, self.dig_P5,
+                self.dig_P6, self.dig_P7, self.dig_P8, self.dig_P9,
+                self.dig_H1, self.dig_H2, self.dig_H3, self.dig_H4,
+                self.dig_H5, self.dig_H6)
+
+    def read_raw_data(self, result, measure=True):
         """ Reads the raw (uncompensated) data from the sensor.
             Args:
                 result: array of length 3 or alike where the result will be
                 stored, in temperature, pressure, humidity order
+                measure: trigger a measurement and wait for it first. Pass
+                False if start_measurement and wait_measurement were called
             Returns:
                 None
         """
 
-        self._l1_barray[0] = self._mode
-        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL_HUM,
-                             self._l1_barray)
-        self._l1_barray[0] = self._mode << 5 | self._mode << 2 | 1
-        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
-                             self._l1_barray)
-
-        sleep_time = 1250 + 2300 * (1 << self._mode)
-        sleep_time = sleep_time + 2300 * (1 << self._mode) + 575
-        sleep_time = sleep_time + 2300 * (1 << self._mode) + 575
-        time.sleep_us(sleep_time)  # Wait the required time
+        if measure:
+            self.start_measurement()
+            self.wait_measurement()
 
         # burst readout from 0xF7 to 0xFE, recommended by datasheet
         self.i2c.readfrom_mem_into(self.address, 0xF7, self._l8_barray)
@@ -131,18 +284,46 @@ class BME280:
         result[1] = raw_press
         result[2] = raw_hum
 
-    def read_compensated_data(self, result=None):
+    def read_compensated_data(self, result=None, measure=True):
         """ Reads the data from the sensor and returns the compensated data.
             Args:
                 result: array of length 3 or alike where the result will be
                 stored, in temperature, pressure, humidity order. You may use
                 this to read out the sensor without allocating heap memory
+                measure: see read_raw_data
             Returns:
                 array with temperature, pressure, humidity. Will be the one from
                 the result parameter if not None
         """
-        self.read_raw_data(self._l3_resultarray)
-        raw_temp, raw_press, raw_hum = self._l3_resultarray
+        data = self._l3_resultarray
+        self.read_raw_data(data, measure)
+        raw_temp = data[0]
+        raw_press = data[1]
+        raw_hum = data[2]
+        compensator = self.compensator
+        if compensator is not None and compensator.compensate(
+                raw_temp, raw_press, raw_hum, data):
+            self.t_fine = compensator.t_fine
+            temp = data[0]
+            pressure = data[1]
+            humidity = data[2]
+        else:
+            temp, pressure, humidity = self._compensate(
+                raw_temp, raw_press, raw_hum)
+
+        if result:
+            result[0] = temp
+            result[1] = pressure
+            result[2] = humidity
+            return result
+
+        return array("i", (temp, pressure, humidity))
+
+    def _compensate(self, raw_temp, raw_press, raw_hum):
+        """ Compensates raw readings with long integer arithmetic.
+            Returns:
+                tuple with temperature, pressure, humidity
+        """
         # temperature
         var1 = ((raw_temp >> 3) - (self.dig_T1 << 1)) * (self.dig_T2 >> 11)
         var2 = (((((raw_temp >> 4) - self.dig_T1) *
@@ -179,13 +360,22 @@ class BME280:
         h = 419430400 if h > 419430400 else h
         humidity = h >> 12
 
-        if result:
-            result[0] = temp
-            result[1] = pressure
-            result[2] = humidity
-            return result
+        return temp, pressure, humidity
 
-        return array("i", (temp, pressure, humidity))
+    def read_values(self, result, measure=True):
+        """ Reads the sensor into result without allocating heap memory.
+            Args:
+                result: array of length 3 or alike where the temperature in
+                hundredths of degC, the pressure in hundredths of hPa and
+                the humidity in hundredths of %RH will be stored
+                measure: see read_raw_data
+            Returns:
+                the result parameter
+        """
+        self.read_compensated_data(result, measure)
+        result[1] = result[1] // 256
+        result[2] = result[2] * 100 // 1024
+        return result
 
     @property
     def values(self):
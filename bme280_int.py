@@ -0,0 +1,358 @@
+# Integer-only compensation for the BME280 driver in bme280.py
+#
+# The compensation formulas of the driver need up to 74 bit intermediates.
+# On the ESP8266 every value above 30 bits is a heap allocated long int. This
+# module computes the same formulas on fixed-width integers of 6 limbs with
+# 14 bits each in preallocated arrays, so a read allocates nothing.
+#
+# The constant terms of a sensor are precomputed once from its calibration,
+# and products with a calibration value are taken limb by limb with the
+# value as a small int. Still a read takes far longer than the long integer
+# formulas, see the bme280 compensation benchmark of host/bench_station.py.
+# On the ESP8266 it trades that time for a heap which does not fragment.
+# host/tests/test_bme280_int.py compares both over the whole range of the
+# raw values.
+
+from array import array
+from micropython import const
+
+_BITS = const(14)
+_MASK = const(0x3FFF)
+_SIGN = const(0x2000)
+_LIMBS = const(6)
+
+# Results are read back for values in [-2 ** 29, 2 ** 29).
+_SMALL = const(0x20000000)
+
+
+def _set(a, value):
+    """Set the wide integer a to a small integer."""
+    for i in range(_LIMBS):
+        a[i] = value & _MASK
+        value >>= _BITS
+
+
+def _wide(value):
+    """Return a new wide integer of a long or small integer."""
+    a = array("H", bytes(2 * _LIMBS))
+    _set(a, value)
+    return a
+
+
+# 1 << 47 of the pressure formula
+_P47 = _wide(1 << 47)
+
+
+def _get(a):
+    """Return the wide integer a as a small integer, see _small."""
+    value = a[0] | (a[1] << _BITS) | ((a[2] & 1) << 28)
+    if a[_LIMBS - 1] & _SIGN:
+        value -= _SMALL
+    return value
+
+
+def _small(a):
+    """Return True if a is within [-2 ** 29, 2 ** 29)."""
+    fill = _MASK if a[_LIMBS - 1] & _SIGN else 0
+    if a[2] >> 1 != fill >> 1:
+        return False
+    for i in range(3, _LIMBS):
+        if a[i] != fill:
+            return False
+    return True
+
+
+def _negative(a):
+    """Return True if a is negative."""
+    return a[_LIMBS - 1] & _SIGN
+
+
+def _zero(a):
+    """Return True if a is zero."""
+    for i in range(_LIMBS):
+        if a[i]:
+            return False
+    return True
+
+
+def _copy(a, b):
+    """Set a to b."""
+    for i in range(_LIMBS):
+        a[i] = b[i]
+
+
+def _add(a, b):
+    """Add b to a."""
+    carry = 0
+    for i in range(_LIMBS):
+        carry += a[i] + b[i]
+        a[i] = carry & _MASK
+        carry >>= _BITS
+
+
+def _sub(a, b):
+    """Subtract b from a."""
+    carry = 0
+    for i in range(_LIMBS):
+        carry += a[i] - b[i]
+        a[i] = carry & _MASK
+        carry >>= _BITS
+
+
+def _add_small(a, value):
+    """Add a not negative small integer to a."""
+    carry = value
+    for i in range(_LIMBS):
+        if not carry:
+            return
+        carry += a[i]
+        a[i] = carry & _MASK
+        carry >>= _BITS
+
+
+def _neg(a):
+    """Negate a."""
+    carry = 1
+    for i in range(_LIMBS):
+        carry += a[i] ^ _MASK
+        a[i] = carry & _MASK
+        carry >>= _BITS
+
+
+def _mul(dst, a, b):
+    """Set dst, which must not be a or b, to a * b."""
+    for i in range(_LIMBS):
+        dst[i] = 0
+    for i in range(_LIMBS):
+        ai = a[i]
+        carry = 0
+        for j in range(_LIMBS - i):
+            carry += dst[i + j] + ai * b[j]
+            dst[i + j] = carry & _MASK
+            carry >>= _BITS
+
+
+def _mul_small(dst, a, value):
+    """Set dst to a * value, value within [-2 ** 15, 2 ** 15)."""
+    carry = 0
+    for i in range(_LIMBS):
+        carry += a[i] * value
+        dst[i] = carry & _MASK
+        carry >>= _BITS
+
+
+def _shl(a, shift):
+    """Shift a to the left."""
+    limbs = shift // _BITS
+    shift -= limbs * _BITS
+    for i in range(_LIMBS - 1, -1, -1):
+        high = a[i - limbs] if i >= limbs else 0
+        low = a[i - limbs - 1] if i > limbs else 0
+        a[i] = ((high << shift) | (low >> (_BITS - shift))) & _MASK
+
+
+def _shr(a, shift):
+    """Shift a to the right, rounding towards negative infinity."""
+    fill = _MASK if a[_LIMBS - 1] & _SIGN else 0
+    limbs = shift // _BITS
+    shift -= limbs * _BITS
+    for i in range(_LIMBS):
+        low = a[i + limbs] if i + limbs < _LIMBS else fill
+        high = a[i + limbs + 1] if i + limbs + 1 < _LIMBS else fill
+        a[i] = ((low >> shift) | (high << (_BITS - shift))) & _MASK
+
+
+def _halve(a):
+    """Shift a not negative a to the right by one bit."""
+    for i in range(_LIMBS - 1):
+        a[i] = (a[i] >> 1) | ((a[i + 1] & 1) << (_BITS - 1))
+    a[_LIMBS - 1] >>= 1
+
+
+def _ge(a, b):
+    """Return True if a >= b, both not negative."""
+    for i in range(_LIMBS - 1, -1, -1):
+        if a[i] != b[i]:
+            return a[i] > b[i]
+    return True
+
+
+def _floordiv(q, n, d, tmp):
+    """
+    Set q to n // d, return False if the quotient has more than 40 bits.
+
+    n, d and tmp are overwritten.
+    """
+    negative = False
+    if _negative(n):
+        _neg(n)
+        negative = True
+    if _negative(d):
+        _neg(d)
+        negative = not negative
+    _copy(tmp, d)
+    _shl(tmp, 40)
+    if _ge(n, tmp):
+        return False
+    for i in range(_LIMBS):
+        q[i] = 0
+    for bit in range(39, -1, -1):
+        _halve(tmp)
+        if _ge(n, tmp):
+            _sub(n, tmp)
+            q[bit // _BITS] |= 1 << (bit % _BITS)
+    if negative:
+        _neg(q)
+        if not _zero(n):
+            _set(tmp, 1)
+            _sub(q, tmp)
+    return True
+
+
+class Compensator:
+    """
+    Compensation of raw BME280 readings without long integers.
+
+    Gives the same results as BME280.read_compensated_data, but keeps all
+    intermediates in preallocated arrays. Pass the class as compensator to
+    the BME280 constructor to use it. The calibration values fit in 16 bit
+    signed small ints, only dig_P1 and dig_T1 are unsigned and dig_P1 is
+    kept as a wide integer.
+    """
+
+    def __init__(self, calibration):
+        self.dig_T1, self.dig_T2, self.dig_T3, self.dig_P1, \
+            self.dig_P2, self.dig_P3, self.dig_P4, self.dig_P5, \
+            self.dig_P6, self.dig_P7, self.dig_P8, self.dig_P9, \
+            self.dig_H1, self.dig_H2, self.dig_H3, self.dig_H4, \
+            self.dig_H5, self.dig_H6 = calibration
+        self.t_fine = 0
+        # the constant terms of this sensor
+        self._p1 = _wide(self.dig_P1)
+        self._p4 = _wide(self.dig_P4 << 35)
+        self._h4 = _wide(16384 - (self.dig_H4 << 20))
+        self._a = array("H", bytes(2 * _LIMBS))
+        self._b = array("H", bytes(2 * _LIMBS))
+        self._c = array("H", bytes(2 * _LIMBS))
+        self._d = array("H", bytes(2 * _LIMBS))
+        self._e = array("H", bytes(2 * _LIMBS))
+
+    def compensate(self, raw_temp, raw_press, raw_hum, result):
+        """ Compensates raw readings.
+            Args:
+                raw_temp, raw_press, raw_hum: the raw readings
+                result: array of length 3 or alike where the result will be
+                stored, in temperature, pressure, humidity order
+            Returns:
+                False if the readings are out of the supported range and
+                have to be compensated with long integers, True otherwise
+        """
+        a = self._a
+        b = self._b
+        c = self._c
+        d = self._d
+        e = self._e
+
+        # temperature
+        var1 = ((raw_temp >> 3) - (self.dig_T1 << 1)) * (self.dig_T2 >> 11)
+        _set(a, (raw_temp >> 4) - self.dig_T1)
+        _mul(b, a, a)
+        _shr(b, 12)
+        _mul_small(c, b, self.dig_T3)
+        _shr(c, 14)
+        t_fine = var1 + _get(c)
+        temp = (t_fine * 5 + 128) >> 8
+
+        # pressure
+        # var2 = var1 * var1 * dig_P6 + ((var1 * dig_P5) << 17)
+        #        + (dig_P4 << 35) with var1 = t_fine - 128000
+        _set(a, t_fine - 128000)
+        _mul(b, a, a)
+        _mul_small(d, b, self.dig_P6)
+        _mul_small(e, a, self.dig_P5)
+        _shl(e, 17)
+        _add(d, e)
+        _add(d, self._p4)
+        # var1 = ((var1 * var1 * dig_P3) >> 8) + ((var1 * dig_P2) << 12)
+        _mul_small(e, b, self.dig_P3)
+        _shr(e, 8)
+        _mul_small(b, a, self.dig_P2)
+        _shl(b, 12)
+        _add(e, b)
+        # var1 = (((1 << 47) + var1) * dig_P1) >> 33
+        _add(e, _P47)
+        _mul(b, e, self._p1)
+        _shr(b, 33)
+        if _zero(b):
+            pressure = 0
+        else:
+            # p = (((p << 31) - var2) * 3125) // var1
+            _set(a, 1048576 - raw_press)
+            _shl(a, 31)
+            _sub(a, d)
+            _mul_small(e, a, 3125)
+            if not _floordiv(a, e, b, c):
+                return False
+            # var1 = (dig_P9 * (p >> 13) * (p >> 13)) >> 25
+            _copy(b, a)
+            _shr(b, 13)
+            _mul(c, b, b)
+            _mul_small(d, c, self.dig_P9)
+            _shr(d, 25)
+            # var2 = (dig_P8 * p) >> 19
+            _mul_small(e, a, self.dig_P8)
+            _shr(e, 19)
+            # pressure = ((p + var1 + var2) >> 8) + (dig_P7 << 4)
+            _add(d, e)
+            _add(d, a)
+            _shr(d, 8)
+            if not _small(d):
+                return False
+            pressure = _get(d) + (self.dig_P7 << 4)
+
+        # humidity
+        # h = (((raw_hum << 14) - (dig_H4 << 20) - (dig_H5 * h))
+        #      + 16384) >> 15 with h = t_fine - 76800
+        _set(a, raw_hum)
+        _shl(a, 14)
+        _add(a, self._h4)
+        _set(d, t_fine - 76800)
+        _mul_small(e, d, self.dig_H5)
+        _sub(a, e)
+        _shr(a, 15)
+        # h *= (((((h * dig_H6) >> 10) * (((h * dig_H3) >> 11) + 32768))
+        #        >> 10) + 2097152) * dig_H2 + 8192) >> 14
+        _mul_small(e, d, self.dig_H6)
+        _shr(e, 10)
+        _mul_small(b, d, self.dig_H3)
+        _shr(b, 11)
+        _add_small(b, 32768)
+        _mul(c, e, b)
+        _shr(c, 10)
+        _add_small(c, 2097152)
+        _mul_small(e, c, self.dig_H2)
+        _add_small(e, 8192)
+        _shr(e, 14)
+        _mul(b, a, e)
+        # h -= ((((h >> 15) * (h >> 15)) >> 7) * dig_H1) >> 4
+        _copy(a, b)
+        _shr(a, 15)
+        _mul(c, a, a)
+        _shr(c, 7)
+        _mul_small(d, c, self.dig_H1)
+        _shr(d, 4)
+        _sub(b, d)
+        if _negative(b):
+            h = 0
+        elif not _small(b):
+            h = 419430400
+        else:
+            h = _get(b)
+            h = 419430400 if h > 419430400 else h
+        humidity = h >> 12
+
+        self.t_fine = t_fine
+        result[0] = temp
+        result[1] = pressure
+        result[2] = humidity
+        return True
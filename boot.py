@@ -1,14 +1,15 @@
 """This file is executed on every boot (including wake-boot from deepsleep)."""
 # import esp
 # esp.osdebug(None)
-from utime import sleep
 from wifi import wifi_stat
 import gc
+import supervisor
 import tempstation
 # import webrepl\n
 # webrepl.start()\n
 gc.collect()
+# Without WiFi the station starts anyway, the SDK keeps reconnecting in the
+# background and the readings are kept until they can be uploaded.
 wifi_stat.connect()
-while not wifi_stat.station.isconnected():
-    sleep(1)
-tempstation.main()
+# A crash resets the board instead of stopping it, see supervisor.py.
+supervisor.run(tempstation.main)
@@ -0,0 +1,162 @@
+"""Controller configuration of the Tempstation API, cached on flash."""
+import credentials
+import metrics
+import ujson
+import uos
+
+from httpclient import client
+from utime import time
+
+
+class ControllerConfig():
+    """
+    The parsed controller data of a station.
+
+    The station ID, critical values and measuring interval are cached in a
+    small file on flash, so a station boots with its last known values and
+    keeps measuring if the API is down. The cache is revalidated with a
+    conditional request (ETag / Last-Modified) once it is older than the
+    TTL given by credentials.config_ttl in seconds.
+    """
+
+    FILE = 'controller.json'
+    TTL = 3600
+    RETRY = 300
+
+    def __init__(self, hardware_id, path=FILE, ttl=None):
+        """Prepare the configuration of the station with the hardware ID."""
+        self.url = credentials.get_controller_data.format(
+            hardware_id=hardware_id)
+        self.path = path
+        if ttl is None:
+            ttl = getattr(credentials, 'config_ttl', self.TTL)
+        self.ttl = ttl
+        self.id = None
+        self.interval = 0
+        self.critical_values = {}
+        self.etag = None
+        self.last_modified = None
+        self.fetched = 0
+
+    @property
+    def expired(self):
+        """Return True if the configuration needs to be revalidated."""
+        age = time() - self.fetched
+        # The clock of the board starts over after a reset.
+        return age < 0 or age >= self.ttl
+
+    def load(self):
+        """Load the cached configuration, return False if there is none."""
+        try:
+            with open(self.path) as cache:
+                data = ujson.load(cache)
+            self.id = data['id']
+            self.interval = data['interval']
+            self.critical_values = {}
+            for unit_id, min_value, max_value in data['critical']:
+                self.critical_values[unit_id] = (min_value, max_value)
+            self.etag = data['etag']
+            self.last_modified = data['modified']
+            self.fetched = data['fetched']
+        except (OSError, ValueError, KeyError):
+            return False
+        print("Loaded cached controller data.")
+        return True
+
+    def save(self):
+        """Write the configuration to the cache file."""
+        critical = []
+        for unit_id in self.critical_values:
+            min_value, max_value = self.critical_values[unit_id]
+            critical.append([unit_id, min_value, max_value])
+        data = {
+            'id': self.id,
+            'interval': self.interval,
+            'critical': critical,
+            'etag': self.etag,
+            'modified': self.last_modified,
+            'fetched': self.fetched,
+        }
+        # Replace the cache in one step, a power loss keeps the old one.
+        with open(self.path + '.tmp', 'w') as cache:
+            ujson.dump(data, cache)
+        uos.rename(self.path + '.tmp', self.path)
+
+    def refresh(self, force=False):
+        """
+        Revalidate the configuration with the API if it is expired.
+
+        Returns True if the values changed. Without a cached configuration
+        errors are raised, otherwise the cached values are kept.
+        """
+        if not force and not self.expired:
+            return False
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        try:
+            resp = client.get(self.url, headers=headers)
+        except OSError as err:
+            if self.id is None:
+                raise
+            print("Controller data not revalidated:", err)
+            self._retry_later()
+            return False
+        if resp.status_code == 304:
+            self.fetched = time()
+            self.save()
+            return False
+        if resp.status_code != 200:
+            if self.id is None:
+                raise OSError('Controller data: HTTP {}'.format(
+                    resp.status_code))
+            print("Controller data not revalidated:", resp.status_code)
+            self._retry_later()
+            return False
+        try:
+            new = self._parse(resp.json())
+        except (KeyError, TypeError, ValueError) as err:
+            if self.id is None:
+                raise
+            # Keep the validators, so the next request gets the data again.
+            print("Ignored incomplete controller data:", repr(err))
+            self._retry_later()
+            return False
+        self.etag = resp.headers.get('etag')
+        self.last_modified = resp.headers.get('last-modified')
+        return self._store(new)
+
+    def apply(self, api_data):
+        """
+        Take the controller data of the API, e.g. pushed by MQTT.
+
+        The configuration is cached and counts as fresh. Returns True if
+        the values changed, incomplete data raises KeyError or TypeError
+        and keeps the values.
+        """
+        return self._store(self._parse(api_data))
+
+    def _parse(self, api_data):
+        """Return the ID, interval and critical values of API data."""
+        print("Received following API data: ", api_data)
+        critical_values = {}
+        for values in api_data['location']['criticalValues']:
+            critical_values[values['id']] = (
+                values['minValue'], values['maxValue'])
+        return (api_data['id'], api_data['settings']['measureDuration'],
+                critical_values)
+
+    def _store(self, new):
+        """Take and cache parsed values, return True if they changed."""
+        old = (self.id, self.interval, self.critical_values)
+        self.id, self.interval, self.critical_values = new
+        self.fetched = time()
+        self.save()
+        return old != new
+
+    def _retry_later(self):
+        """Revalidate again after RETRY seconds instead of every cycle."""
+        metrics.increment(metrics.CONFIG_FAILURES)
+        self.fetched = time() - max(0, self.ttl - self.RETRY)
@@ -0,0 +1,129 @@
+"""All DS18B20 temperature probes on a 1-Wire bus, measured at once."""
+import onewire
+
+from array import array
+from micropython import const
+from utime import sleep_ms
+
+_SKIP_ROM = const(0xCC)
+_CONVERT_T = const(0x44)
+_READ_SCRATCHPAD = const(0xBE)
+
+# Family code of the DS18B20 in the first byte of its ROM.
+FAMILY_CODE = 0x28
+
+# Temperature register after power-on, before any conversion.
+POWER_ON_VALUE = 0x0550
+
+
+def probe_tags(roms):
+    """
+    Return the tags of the probes with the ROMs.
+
+    The high byte of a tag is the first byte of the serial number of a
+    probe, lowest first, which no probe before it has in its tag, the low
+    byte the family code, see uploadformat.format_tag. A tag stays with
+    its probe when probes are added or removed as long as the lowest
+    serial bytes differ. A probe whose lowest byte is taken by a probe
+    before it is retagged when that probe is removed, and a probe with
+    all six bytes taken repeats the tag of its highest byte.
+    """
+    tags = []
+    for rom in roms:
+        for i in range(1, 7):
+            tag = rom[i] << 8 | FAMILY_CODE
+            if tag not in tags:
+                break
+        tags.append(tag)
+    return tags
+
+
+class DS18B20Bus():
+    """
+    A bus of DS18B20 probes.
+
+    The ROMs of the probes are scanned once and cached. A measuring cycle
+    starts the conversion of every probe at once with SKIP_ROM and
+    CONVERT_T, waits until the bus reports the conversions done and then
+    reads the scratchpad of each probe with select_rom. Every scratchpad is
+    checked with its CRC and only the bad reads are repeated, so a cycle
+    over many probes takes about one conversion time of 750 ms.
+    """
+
+    CONVERSION_MS = 750
+    POLL_MS = 10
+    RETRIES = 2
+
+    def __init__(self, pin, roms=None):
+        """Set up the bus on the pin, known ROMs skip the scan."""
+        self.ow = onewire.OneWire(pin)
+        self.scratchpad = bytearray(9)
+        if roms is None:
+            roms = self.scan()
+        if not roms:
+            raise OSError('No DS18B20 found on the 1-Wire bus.')
+        self.roms = roms
+        # temperatures in hundredths of degC, 0 if a probe failed
+        self.results = array('i', bytes(4 * len(roms)))
+        self.valid = bytearray(len(roms))
+        self.tags = probe_tags(roms)
+        print("Found", len(roms), "DS18B20.")
+
+    def __len__(self):
+        """Return the number of probes."""
+        return len(self.roms)
+
+    def scan(self):
+        """Return the ROMs of all DS18B20 on the bus."""
+        return [rom for rom in self.ow.scan() if rom[0] == FAMILY_CODE]
+
+    def convert(self):
+        """Start the temperature conversion of all probes."""
+        self.ow.reset(True)
+        self.ow.writebyte(_SKIP_ROM)
+        self.ow.writebyte(_CONVERT_T)
+
+    def wait(self):
+        """Wait until the conversions are done, at most CONVERSION_MS."""
+        # The probes hold the bus low while they convert.
+        waited = 0
+        while waited < self.CONVERSION_MS and not self.ow.readbit():
+            sleep_ms(self.POLL_MS)
+            waited += self.POLL_MS
+
+    def read(self, index):
+        """Read the scratchpad of a probe, return False if the CRC fails."""
+        self.ow.select_rom(self.roms[index])
+        self.ow.writebyte(_READ_SCRATCHPAD)
+        self.ow.readinto(self.scratchpad)
+        return self.ow.crc8(self.scratchpad) == 0
+
+    def measure(self):
+        """
+        Measure with all probes.
+
+        Returns the results, the temperature of every probe in hundredths
+        of degC. valid[i] is 0 if probe i could not be read.
+        """
+        self.convert()
+        self.wait()
+        scratchpad = self.scratchpad
+        for i in range(len(self.roms)):
+            self.valid[i] = 0
+            self.results[i] = 0
+            for attempt in range(1 + self.RETRIES):
+                if self.read(i):
+                    break
+            else:
+                print("DS18B20", i, "failed the CRC check.")
+                continue
+            raw = scratchpad[1] << 8 | scratchpad[0]
+            if raw == POWER_ON_VALUE:
+                print("DS18B20", i, "did not convert.")
+                continue
+            if raw & 0x8000:
+                raw -= 0x10000
+            # 1/16 degC to hundredths, rounded
+            self.results[i] = (raw * 25 + 2) >> 2
+            self.valid[i] = 1
+        return self.results
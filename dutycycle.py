@@ -0,0 +1,198 @@
+"""Deep-sleep duty cycling for battery powered tempstations.
+
+In this mode a station measures and uploads once per wake and then sleeps
+until its next slot. GPIO16 has to be wired to RST to wake the board up.
+"""
+import machine
+import upload
+import ustruct
+
+from utime import sleep_ms, ticks_diff, ticks_ms
+
+MAGIC = 0x5453
+VERSION = 4
+
+# LED blinks of a wake, and the longest wait for them before sleeping
+BLINK_MS = 100
+SIGNAL_WAIT_MS = 2000
+
+# magic, version, number of BME280, station ID, interval in seconds,
+# pending upload cycles, number of readings, number of rule channels
+HEAD_FORMAT = '<HBBiIHBB'
+# critical values in hundredths
+THRESHOLD_FORMAT = '<6i'
+# multiplexer channel, address and calibration of a BME280
+DEVICE_FORMAT = '<BBHhhHhhhhhhhhBhBhhb'
+# timestamp, unitId, sensor tag, value in hundredths
+READING_FORMAT = '<IHHi'
+# state of an alert rule channel, see rules.Evaluator.state
+RULE_FORMAT = '<BBiii'
+
+THRESHOLDS = (
+    'TEMP_MIN', 'TEMP_MAX', 'HUM_MIN', 'HUM_MAX', 'PRES_MIN', 'PRES_MAX'
+)
+
+
+class RTCState():
+    """
+    Station state kept in the RTC memory across deep sleeps.
+
+    Holds the station ID, the critical values, the interval, the channels,
+    addresses and calibrations of the BME280 sensors, the state of the
+    alert rules and the readings not uploaded yet, so a wake needs neither
+    the API nor the I2C scan and calibration reads, and hysteresis and
+    hold times of the rules work across wakes.
+    """
+
+    SIZE = 492
+
+    def __init__(self, rtc=None):
+        """Use the given RTC or the one of the board."""
+        self.rtc = rtc or machine.RTC()
+        self.devices = None
+        self.rules = None
+
+    def load(self, station):
+        """Restore the state into the station, return False if invalid."""
+        data = self.rtc.memory()
+        head_size = ustruct.calcsize(HEAD_FORMAT)
+        if len(data) < head_size + 2:
+            return False
+        if ustruct.unpack_from('<H', data, len(data) - 2)[0] != \
+                _checksum(data, len(data) - 2):
+            return False
+        magic, version, device_count, station_id, interval, \
+            pending_cycles, count, rule_count = ustruct.unpack_from(
+                HEAD_FORMAT, data)
+        if magic != MAGIC or version != VERSION:
+            return False
+
+        offset = head_size
+        thresholds = ustruct.unpack_from(THRESHOLD_FORMAT, data, offset)
+        offset += ustruct.calcsize(THRESHOLD_FORMAT)
+        for name, value in zip(THRESHOLDS, thresholds):
+            setattr(station, name, value)
+        self.devices = None
+        if device_count:
+            self.devices = []
+        for i in range(device_count):
+            device = ustruct.unpack_from(DEVICE_FORMAT, data, offset)
+            self.devices.append((device[0], device[1], device[2:]))
+            offset += ustruct.calcsize(DEVICE_FORMAT)
+        self.rules = []
+        for i in range(rule_count):
+            self.rules.append(ustruct.unpack_from(RULE_FORMAT, data, offset))
+            offset += ustruct.calcsize(RULE_FORMAT)
+
+        station.ID = station_id
+        station.INTERVAL = interval
+        station.UPLOADER = upload.create_uploader(
+            station_id, station.MAC_ADDRESS)
+        station.UPLOADER.pending_cycles = pending_cycles
+        size = ustruct.calcsize(READING_FORMAT)
+        for i in range(count):
+            timestamp, unit_id, sensor, value = ustruct.unpack_from(
+                READING_FORMAT, data, offset)
+            offset += size
+            station.UPLOADER.add(value, unit_id, timestamp, sensor)
+        print("Restored station state from the RTC memory.")
+        return True
+
+    def restore_rules(self, station):
+        """Restore the alert rules of a station set up like before."""
+        evaluator = station.RULES
+        if not self.rules or len(self.rules) != len(evaluator.critical_ids):
+            return
+        for index in range(len(self.rules)):
+            evaluator.restore(index, self.rules[index])
+
+    def save(self, station):
+        """Store the state of the station."""
+        sensor = getattr(station, 'SENSOR', None)
+        devices = sensor.devices if sensor else ()
+        uploader = station.UPLOADER
+        first, count = 0, uploader.count
+        size = ustruct.calcsize(HEAD_FORMAT) + \
+            ustruct.calcsize(THRESHOLD_FORMAT) + 2
+        if size + len(devices) * ustruct.calcsize(DEVICE_FORMAT) > \
+                self.SIZE // 2:
+            # Keep room for the readings, the bus is scanned again instead.
+            print("RTC memory too small for", len(devices), "sensors.")
+            devices = ()
+        size += len(devices) * ustruct.calcsize(DEVICE_FORMAT)
+        evaluator = getattr(station, 'RULES', None)
+        rule_count = len(evaluator.critical_ids) if evaluator else 0
+        if size + rule_count * ustruct.calcsize(RULE_FORMAT) > \
+                self.SIZE // 2:
+            print("RTC memory too small for", rule_count, "rule channels.")
+            rule_count = 0
+        size += rule_count * ustruct.calcsize(RULE_FORMAT)
+        reading_size = ustruct.calcsize(READING_FORMAT)
+        room = (self.SIZE - size) // reading_size
+        if count > room:
+            print("RTC memory full, dropping", count - room, "readings.")
+            first, count = count - room, room
+
+        data = bytearray(size + count * reading_size)
+        ustruct.pack_into(
+            HEAD_FORMAT, data, 0, MAGIC, VERSION, len(devices), station.ID,
+            station.INTERVAL, uploader.pending_cycles, count, rule_count)
+        offset = ustruct.calcsize(HEAD_FORMAT)
+        ustruct.pack_into(THRESHOLD_FORMAT, data, offset,
+                          *[getattr(station, name, 0) for name in THRESHOLDS])
+        offset += ustruct.calcsize(THRESHOLD_FORMAT)
+        for channel, address, calibration in devices:
+            ustruct.pack_into(DEVICE_FORMAT, data, offset, channel, address,
+                              *calibration)
+            offset += ustruct.calcsize(DEVICE_FORMAT)
+        for index in range(rule_count):
+            ustruct.pack_into(RULE_FORMAT, data, offset,
+                              *evaluator.state(index))
+            offset += ustruct.calcsize(RULE_FORMAT)
+        readings = uploader.readings
+        for i in range(4 * first, 4 * (first + count), 4):
+            ustruct.pack_into(READING_FORMAT, data, offset, readings[i],
+                              readings[i + 1], readings[i + 3],
+                              readings[i + 2])
+            offset += reading_size
+        ustruct.pack_into('<H', data, offset, _checksum(data, offset))
+        self.rtc.memory(data)
+
+    def clear(self):
+        """Forget the stored state."""
+        self.rtc.memory(b'')
+
+
+def _checksum(data, length):
+    """Return a 16 bit Fletcher checksum of the first length bytes."""
+    a = b = 0
+    for i in range(length):
+        a = (a + data[i]) % 255
+        b = (b + a) % 255
+    return (b << 8) | a
+
+
+def woke_from_deepsleep():
+    """Return True if the board was woken up from deep sleep."""
+    return machine.reset_cause() == machine.DEEPSLEEP_RESET
+
+
+def deepsleep(station, state):
+    """
+    Save the station state and sleep for the rest of the interval.
+
+    A signal still playing gets up to SIGNAL_WAIT_MS, the timers stop in
+    deep sleep anyway.
+    """
+    signal = getattr(station, 'SIGNAL', None)
+    if signal is not None:
+        start = ticks_ms()
+        while signal.busy and \
+                ticks_diff(ticks_ms(), start) < SIGNAL_WAIT_MS:
+            sleep_ms(BLINK_MS)
+        signal.stop()
+    state.save(station)
+    station.UPLOADER.close()
+    remaining = station.INTERVAL * 1000 - ticks_ms()
+    print("Sleeping for", remaining, "ms.")
+    machine.deepsleep(max(1, remaining))
@@ -0,0 +1,121 @@
+"""
+The alert rules of the stations for a whole fleet on the server.
+
+FleetRules evaluates the rules of rules.py, the same code the stations
+run, for every reading as it arrives. Each station has its own
+rules.Evaluator and a channel per unitId and sensor. The state of a channel
+is updated in constant time, so no history is read again. A change of the
+flags of a channel is an alert. The last alerts are kept in memory for
+polling with since(), older ones are only in the store. New alerts are
+also fanned out to subscribers, each with a bounded asyncio queue. A slow
+subscriber loses its oldest alerts instead of holding up the ingestion.
+"""
+import asyncio
+import collections
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import rules  # noqa: E402
+
+FLAGS = ((rules.LOW, 'low'), (rules.HIGH, 'high'), (rules.RATE, 'rate'))
+KEPT = 10000
+
+
+def flag_names(flags):
+    """Return the names of the flags of a channel."""
+    return [name for bit, name in FLAGS if flags & bit]
+
+
+class FleetRules():
+    """
+    Evaluators of all stations with the same critical values.
+
+    critical_values and alert_rules are in the units of the API like on a
+    station, by critical value id, see rules.py.
+    """
+
+    def __init__(self, critical_values, alert_rules=None, kept=KEPT):
+        """Compile the limits and rules for all stations."""
+        self.limits = rules.limits(critical_values)
+        self.rules = rules.settings(alert_rules or {})
+        self.stations = {}
+        self.recent = collections.deque(maxlen=kept)
+        self.subscribers = []
+        self.next_id = 1
+        self.evaluated = 0
+        self.dropped = 0
+
+    def _channel(self, station, unit, sensor):
+        """Return the evaluator and channel of a series, -1 if unknown."""
+        entry = self.stations.get(station)
+        if entry is None:
+            entry = self.stations[station] = (rules.Evaluator(), {})
+        evaluator, channels = entry
+        index = channels.get((unit, sensor))
+        if index is None:
+            critical_id = rules.CRITICAL_IDS.get(unit)
+            if critical_id is None:
+                index = -1
+            else:
+                index = evaluator.add_channel(
+                    critical_id, self.limits.get(critical_id),
+                    self.rules.get(critical_id))
+            channels[(unit, sensor)] = index
+        return evaluator, index
+
+    def evaluate(self, rows):
+        """
+        Evaluate (station, unit, sensor, timestamp, value) rows.
+
+        Returns the alerts of the channels whose flags changed, as dicts.
+        """
+        alerts = []
+        for station, unit, sensor, timestamp, value in rows:
+            evaluator, index = self._channel(station, unit, sensor)
+            if index < 0:
+                continue
+            before = evaluator.active[index]
+            flags = evaluator.update(index, value, timestamp)
+            if flags == before:
+                continue
+            alerts.append({
+                'id': self.next_id,
+                'station': station,
+                'unitId': unit,
+                'sensor': sensor,
+                'timestamp': timestamp,
+                'value': value / 100,
+                'flags': flag_names(flags),
+                'raised': flag_names(flags & ~before),
+                'cleared': flag_names(before & ~flags),
+            })
+            self.next_id += 1
+        self.evaluated += len(rows)
+        return alerts
+
+    def publish(self, alerts):
+        """Keep the stored alerts and give them to all subscribers."""
+        self.recent.extend(alerts)
+        for queue in self.subscribers:
+            for alert in alerts:
+                if queue.full():
+                    queue.get_nowait()
+                    self.dropped += 1
+                queue.put_nowait(alert)
+
+    def subscribe(self, size=1000):
+        """Return a queue which receives every new alert."""
+        queue = asyncio.Queue(size)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        """Stop giving alerts to a queue."""
+        self.subscribers.remove(queue)
+
+    def since(self, alert_id):
+        """Return the kept alerts after the one with the given id."""
+        return [alert for alert in self.recent if alert['id'] > alert_id]
@@ -0,0 +1,277 @@
+"""
+Load test of the ingestion server with a simulated fleet of stations.
+
+Every station opens a kept-alive connection like httpclient.py, gets its
+controller data and then uploads every interval, at a random phase:
+
+- data: every reading in its own request, like the stations before
+  batching
+- batch: one JSON array of the readings of batch cycles
+- frame: one binary telemetry frame of the same readings
+- mix: a third of the stations each
+
+Requests are sent on a fixed schedule. The latency is counted from the
+time a request was due, so a server that falls behind shows in the
+percentiles instead of slowing the fleet down.
+
+    python host/bench_ingest.py --stations 2000 --interval 1 \\
+        --duration 30 --mode mix
+
+starts host/ingest_server.py in its own process unless --url is given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from array import array
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HOST))
+sys.path.insert(0, HOST)
+
+import telemetry  # noqa: E402
+
+from uploadformat import EPOCH_OFFSET  # noqa: E402
+
+MODES = ('data', 'batch', 'frame')
+# unitId, start value in hundredths of the BME280 readings.
+UNITS = ((1, 2150), (3, 101325), (2, 4500))
+
+
+class Fleet():
+    """The counters and latencies of all stations of a run."""
+
+    def __init__(self):
+        """Start with empty counters."""
+        self.latencies = []
+        self.readings = 0
+        self.rejected = 0
+        self.errors = 0
+        self.late = 0
+        self.measuring = False
+
+    def count(self, due, status, readings):
+        """Count a response to a request due at the perf_counter due."""
+        if not self.measuring:
+            return
+        self.latencies.append(time.perf_counter() - due)
+        if 200 <= status < 300:
+            self.readings += readings
+        elif status == 503:
+            self.rejected += 1
+        else:
+            self.errors += 1
+
+
+class Station():
+    """A simulated station talking to the server over one connection."""
+
+    def __init__(self, number, mode, host, port, prefix, cycles):
+        """Prepare the station with a hardware ID of its number."""
+        self.hardware_id = 'sim-{:06d}'.format(number)
+        self.mode = mode
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.cycles = cycles
+        self.station_id = None
+        self.reader = None
+        self.writer = None
+        self.values = [value for _, value in UNITS]
+        self.timestamp = int(time.time()) - EPOCH_OFFSET
+        self.frame = bytearray(telemetry.frame_size(len(UNITS) * cycles))
+
+    async def request(self, method, path, body=b'', content_type=None):
+        """Send a request, return the status and body of the response."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port)
+        head = '{} {} HTTP/1.1\r\nHost: {}\r\n'.format(
+            method, path, self.host)
+        if content_type:
+            head += 'Content-Type: {}\r\n'.format(content_type)
+        head += 'Content-Length: {}\r\n\r\n'.format(len(body))
+        try:
+            self.writer.write(head.encode() + body)
+            response = await self.reader.readuntil(b'\r\n\r\n')
+            lines = response.decode('latin-1').split('\r\n')
+            status = int(lines[0].split(' ', 2)[1])
+            length = 0
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            content = await self.reader.readexactly(length)
+        except (OSError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+        return status, content
+
+    def close(self):
+        """Close the connection."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def measure(self):
+        """Return the flat readings of the next upload."""
+        readings = array('i')
+        for _ in range(self.cycles):
+            self.timestamp += 60
+            for k, (unit_id, _) in enumerate(UNITS):
+                self.values[k] += random.randint(-8, 8)
+                readings.extend((self.timestamp, unit_id, self.values[k],
+                                 0x76))
+        return readings
+
+    def uploads(self, readings):
+        """Return the requests of an upload as (path, body, type)."""
+        base = '{}/stations/{}/'.format(self.prefix, self.station_id)
+        if self.mode == 'frame':
+            length = telemetry.encode(self.frame, self.station_id,
+                                      readings, len(readings) // 4)
+            return [(base + 'telemetry', bytes(self.frame[:length]),
+                     'application/octet-stream')]
+        objects = []
+        for i in range(0, len(readings), 4):
+            objects.append(
+                '{{"value":{:.2f},"unitId":{},"timestamp":{},'
+                '"sensor":"0x76"}}'.format(
+                    readings[i + 2] / 100, readings[i + 1],
+                    readings[i] + EPOCH_OFFSET))
+        if self.mode == 'batch':
+            body = '[' + ','.join(objects) + ']'
+            return [(base + 'batch', body.encode(), 'application/json')]
+        return [(base + 'data', body.encode(), 'application/json')
+                for body in objects]
+
+    async def run(self, fleet, interval, end):
+        """Upload every interval until the perf_counter end."""
+        status, content = await self.request(
+            'GET', '{}/controller/{}'.format(self.prefix, self.hardware_id))
+        self.station_id = json.loads(content)['id']
+        due = time.perf_counter() + random.uniform(0, interval)
+        while due < end:
+            await asyncio.sleep(max(0, due - time.perf_counter()))
+            readings = self.measure()
+            count = 1 if self.mode == 'data' else len(readings) // 4
+            for path, body, content_type in self.uploads(readings):
+                try:
+                    status, _ = await self.request('POST', path, body,
+                                                   content_type)
+                except (OSError, asyncio.IncompleteReadError):
+                    status = 0
+                fleet.count(due, status, count)
+            due += interval
+            if due < time.perf_counter():
+                fleet.late += 1
+        self.close()
+
+
+def percentile(values, share):
+    """Return the value below which share of the sorted values are."""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+async def load(args, host, port):
+    """Run the fleet against the server, return the results."""
+    fleet = Fleet()
+    stations = []
+    for number in range(args.stations):
+        mode = args.mode
+        if mode == 'mix':
+            mode = MODES[number % len(MODES)]
+        stations.append(Station(number, mode, host, port, args.prefix,
+                                args.cycles))
+    start = time.perf_counter()
+    end = start + args.warmup + args.duration
+    tasks = [asyncio.ensure_future(station.run(fleet, args.interval, end))
+             for station in stations]
+    await asyncio.sleep(args.warmup)
+    fleet.measuring = True
+    measured = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - measured
+    latencies = sorted(fleet.latencies)
+    return {
+        'stations': args.stations,
+        'mode': args.mode,
+        'requests/s': round(len(latencies) / elapsed),
+        'readings/s': round(fleet.readings / elapsed),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'max_ms': round(percentile(latencies, 1.0) * 1000, 1),
+        'rejected': fleet.rejected,
+        'errors': fleet.errors,
+        'late_uploads': fleet.late,
+    }
+
+
+def start_server(args):
+    """Start the ingestion server in a process, return it and its port."""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    database = os.path.join(tempfile.mkdtemp(prefix='ingest-'),
+                            'readings.sqlite')
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(HOST, 'ingest_server.py'),
+         '--host', '127.0.0.1', '--port', str(port), '--db', database,
+         '--report', '0'] + args.server_args)
+    deadline = time.time() + 10
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return server, port
+        except OSError:
+            if time.time() > deadline or server.poll() is not None:
+                server.kill()
+                raise
+            time.sleep(0.05)
+
+
+def main():
+    """Run the load test and print its results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--stations', type=int, default=1000)
+    parser.add_argument('--mode', choices=MODES + ('mix',), default='mix')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds between the uploads of a station')
+    parser.add_argument('--cycles', type=int, default=1,
+                        help='measuring cycles in a batch or frame')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--url', help='a running server, e.g. '
+                        'http://127.0.0.1:8080')
+    parser.add_argument('--prefix', default='/api')
+    parser.add_argument('--server-args', nargs=argparse.REMAINDER,
+                        default=[], help='options of ingest_server.py')
+    args = parser.parse_args()
+    server = None
+    if args.url:
+        host, _, port = args.url.split('//', 1)[-1].partition(':')
+        port = int(port or 80)
+    else:
+        server, port = start_server(args)
+        host = '127.0.0.1'
+    try:
+        results = asyncio.run(load(args, host, port))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    for name, value in results.items():
+        print('{:14} {:>10}'.format(name, value))
+
+
+if __name__ == '__main__':
+    main()
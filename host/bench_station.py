@@ -0,0 +1,217 @@
+"""
+Benchmarks of the station code on the simulated hardware.
+
+Every benchmark reports the simulated time, the time the code took on the
+host and the peak of the memory it allocated on the host:
+
+- bme280: a measurement with 1 to 4 sensors at x1 and x16 oversampling,
+  the compensation of a reading with long integers and with bme280_int
+- onewire: a ROM scan of 10 and 40 devices, a DS18B20 cycle
+- variants: every tempstation variant for simulated minutes, with cycle
+  time, bytes sent and requests
+
+The simulated time only counts the modelled waits, conversions, bus
+transfers and network, so it is the same on every host and every run.
+Results can be saved and compared with an earlier run:
+
+    python host/bench_station.py --save before.json
+    python host/bench_station.py --baseline before.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulator import VARIANTS, Simulation  # noqa: E402
+
+X16 = {'mode': 5}
+
+
+def measure(sim, operation, rounds):
+    """Run an operation, return its mean times and allocation peak."""
+    clock = sim.world.clock
+    with contextlib.redirect_stdout(sim.log):
+        operation()
+        return _measure(clock, operation, rounds)
+
+
+def _measure(clock, operation, rounds):
+    """Time rounds of an operation on the clock and the host."""
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    start_sim = clock.now_us()
+    start_host = time.perf_counter()
+    for _ in range(rounds):
+        operation()
+    host_us = (time.perf_counter() - start_host) * 1e6 / rounds
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {
+        'sim_ms': round((clock.now_us() - start_sim) / rounds / 1000, 2),
+        'host_us': round(host_us),
+        'alloc_b': peak,
+    }
+
+
+def bench_bme280(sensors, settings, rounds):
+    """Measure with all BME280 of a bus through sensor_bme280."""
+    credentials = {'bme280_settings': settings}
+    if sensors > 2:
+        credentials['bme280_mux'] = 0x70
+    sim = Simulation(credentials, cpu_scale=0, devices={'bme280': sensors})
+    try:
+        sim.prepare()
+        import sensor_bme280
+        with contextlib.redirect_stdout(sim.log):
+            sensor = sensor_bme280.Sensor()
+        bus = sim.world.i2c
+        transferred = bus.bytes
+        result = measure(sim, sensor.measure, rounds)
+        result['i2c_b'] = (bus.bytes - transferred) // (rounds + 1)
+        return result
+    finally:
+        sim.close()
+
+
+def bench_compensation(engine, rounds):
+    """Compensate a raw reading with the 'long' or 'int' formulas."""
+    sim = Simulation(cpu_scale=0, devices={'bme280': 1})
+    try:
+        sim.prepare()
+        import sensor_bme280
+        with contextlib.redirect_stdout(sim.log):
+            device = sensor_bme280.Sensor().array.sensors[0]
+        raw = array('i', (0, 0, 0))
+        device.read_raw_data(raw)
+        result = array('i', (0, 0, 0))
+        if engine == 'long':
+            def operation():
+                device._compensate(raw[0], raw[1], raw[2])
+        else:
+            def operation():
+                device.compensator.compensate(raw[0], raw[1], raw[2],
+                                              result)
+        return measure(sim, operation, rounds)
+    finally:
+        sim.close()
+
+
+def bench_onewire(probes, rounds):
+    """Scan the ROMs of a 1-Wire bus."""
+    sim = Simulation(cpu_scale=0, devices={'ds18b20': probes})
+    try:
+        sim.prepare()
+        import onewire
+        from machine import Pin
+        bus = onewire.OneWire(Pin(4))
+        return measure(sim, bus.scan, rounds)
+    finally:
+        sim.close()
+
+
+def bench_ds18b20(probes, rounds):
+    """Measure with all DS18B20 of a bus."""
+    sim = Simulation(cpu_scale=0, devices={'ds18b20': probes})
+    try:
+        sim.prepare()
+        import ds18b20
+        from machine import Pin
+        with contextlib.redirect_stdout(sim.log):
+            bus = ds18b20.DS18B20Bus(Pin(4))
+        return measure(sim, bus.measure, rounds)
+    finally:
+        sim.close()
+
+
+def bench_variant(variant, minutes, credentials=None):
+    """Run a variant, return the cycle time, traffic and allocations."""
+    sim = Simulation(credentials, cpu_scale=0, devices=VARIANTS[variant])
+    try:
+        tracemalloc.start()
+        start_host = time.perf_counter()
+        sim.run(variant, minutes * 60)
+        host_s = time.perf_counter() - start_host
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        sim.close()
+    report = sim.report()
+    cycle = report['phases'].get('cycle', {'count': 0, 'mean_us': 0,
+                                           'max_us': 0})
+    readings = max(1, report['readings'])
+    return {
+        'cycles': cycle['count'],
+        'cycle_ms': round(cycle['mean_us'] / 1000, 2),
+        'cycle_max_ms': round(cycle['max_us'] / 1000, 2),
+        'readings': report['readings'],
+        'requests': report['requests'],
+        'sent_b_per_reading': round(report['bytes_sent'] / readings, 1),
+        'http_retries': report['counters'].get('http_retries', 0),
+        'boots': report['boots'],
+        'host_ms': round(host_s * 1000),
+        'alloc_b': peak,
+    }
+
+
+def run(minutes, rounds):
+    """Run all benchmarks, return the results by name."""
+    results = {}
+    for sensors in (1, 4):
+        for name, settings in (('x1', {}), ('x16', X16)):
+            results['bme280 {} sensors {}'.format(sensors, name)] = \
+                bench_bme280(sensors, settings, rounds)
+    for engine in ('long', 'int'):
+        results['bme280 compensation ' + engine] = \
+            bench_compensation(engine, rounds)
+    for probes in (10, 40):
+        results['onewire scan {}'.format(probes)] = \
+            bench_onewire(probes, max(1, rounds // 10))
+    results['ds18b20 measure 4'] = bench_ds18b20(4, max(1, rounds // 10))
+    for variant in sorted(VARIANTS):
+        results[variant] = bench_variant(variant, minutes)
+    results['tempstation_DHT22 deep sleep'] = bench_variant(
+        'tempstation_DHT22', minutes, {'deep_sleep': True})
+    return results
+
+
+def print_results(results, baseline=None):
+    """Print the results, with the change against a baseline."""
+    for name, values in results.items():
+        print(name)
+        for key, value in values.items():
+            line = '    {:20} {:>12}'.format(key, value)
+            old = (baseline or {}).get(name, {}).get(key)
+            if old:
+                line += '  {:+.1f}%'.format(100.0 * (value - old) / old)
+            print(line)
+
+
+def main():
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--minutes', type=float, default=30,
+                        help='simulated minutes of every variant')
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--save', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE')
+    args = parser.parse_args()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as old:
+            baseline = json.load(old)
+    results = run(args.minutes, args.rounds)
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as new:
+            json.dump(results, new, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Compare the upload encodings of the station on the host.
+
+For a day of readings of a station it prints the bytes sent over the air,
+HTTP request heads included as httpclient.py writes them, the number of
+requests and the encoding time per reading of
+
+- json: one request per reading, like the stations before batching
+- batch: one JSON array per upload, see upload.BatchUploader
+- frame: one binary telemetry frame per upload, see telemetry.py
+
+    python host/bench_telemetry.py --devices 2 --readings 32
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import telemetry  # noqa: E402
+
+from telemetry_bridge import decode  # noqa: E402
+from uploadformat import EPOCH_OFFSET, format_tag  # noqa: E402
+
+HOST = 'api.example.org'
+PATH = '/api/stations/12/data'
+
+
+def request_head(content_type, length):
+    """Return the size of the head of a POST request of httpclient.py."""
+    return len('POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: {}\r\n'
+               'Content-Length: {}\r\n\r\n'.format(
+                   PATH, HOST, content_type, length))
+
+
+def make_readings(count, devices, interval=60):
+    """Return flat (timestamp, unitId, value, sensor) readings."""
+    readings = []
+    units = ((1, 2150), (3, 101325), (2, 4500))
+    series = [[value for _, value in units] for _ in range(devices)]
+    timestamp = 720000000
+    while len(readings) < 4 * count:
+        for device in range(devices):
+            tag = (device + 1) << 8 | 0x76 if devices > 1 else 0
+            for k, (unit_id, _) in enumerate(units):
+                series[device][k] += random.randint(-8, 8)
+                readings += [timestamp, unit_id, series[device][k], tag]
+        timestamp += interval
+    return readings[:4 * count]
+
+
+def _reading(readings, i, with_time):
+    """Return reading i as a JSON object of the station."""
+    reading = {'value': round(readings[i + 2] / 100, 2),
+               'unitId': readings[i + 1]}
+    if with_time:
+        reading['timestamp'] = readings[i] + EPOCH_OFFSET
+    if readings[i + 3]:
+        reading['sensor'] = format_tag(readings[i + 3])
+    return reading
+
+
+def encode_json(readings, count):
+    """Return the bodies of the requests of one reading each."""
+    return [json.dumps(_reading(readings, i, False),
+                       separators=(',', ':')).encode()
+            for i in range(0, 4 * count, 4)]
+
+
+def encode_batch(readings, count):
+    """Return the body of one JSON batch."""
+    return [json.dumps([_reading(readings, i, True)
+                        for i in range(0, 4 * count, 4)],
+                       separators=(',', ':')).encode()]
+
+
+def encode_frame(readings, count):
+    """Return one telemetry frame."""
+    buf = bytearray(telemetry.frame_size(count))
+    length = telemetry.encode(buf, 12, readings, count)
+    return [bytes(buf[:length])]
+
+
+ENCODINGS = (
+    ('json', encode_json, 'application/json'),
+    ('batch', encode_batch, 'application/json'),
+    ('frame', encode_frame, 'application/octet-stream'),
+)
+
+
+def main():
+    """Run the comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--devices', type=int, default=1)
+    parser.add_argument('--readings', type=int, default=32,
+                        help='readings per upload')
+    parser.add_argument('--uploads', type=int, default=45,
+                        help='uploads per day')
+    args = parser.parse_args()
+    random.seed(1)
+    readings = make_readings(args.readings, args.devices)
+
+    # The frame has to decode to the batch.
+    _, decoded = decode(encode_frame(readings, args.readings)[0])
+    assert decoded == json.loads(encode_batch(readings, args.readings)[0])
+
+    print('{:6} {:>9} {:>9} {:>9} {:>11}'.format(
+        'format', 'body B', 'air B/day', 'req/day', 'us/reading'))
+    for name, encode, content_type in ENCODINGS:
+        start = time.perf_counter()
+        rounds = 200
+        for _ in range(rounds):
+            bodies = encode(readings, args.readings)
+        elapsed = time.perf_counter() - start
+        body = sum(len(b) for b in bodies)
+        air = body + sum(request_head(content_type, len(b)) for b in bodies)
+        print('{:6} {:9} {:9} {:9} {:11.1f}'.format(
+            name, body, air * args.uploads, len(bodies) * args.uploads,
+            elapsed / rounds / args.readings * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark of the column store with months of readings of a fleet.
+
+Readings of every station are generated every interval seconds for the
+given days, written to a ColumnStore and queried like a dashboard would:
+
+- raw: a day of readings of one station
+- hourly / daily: a month of rollups of one station, from the tiers
+- fleet: the hourly rollup of a day of every station
+- odd: a week at 10 minutes of one station, from the raw readings
+
+With --sqlite the same readings are also put into the readings table of
+the ingestion server and the month of hourly rollups is queried there.
+
+    python host/bench_tsstore.py --stations 200 --days 90
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ingest_server import SCHEMA  # noqa: E402
+from tsstore import ColumnStore  # noqa: E402
+
+UNIT = 1
+
+
+def generate(rng, days, interval, end):
+    """Return timestamps and temperature values in hundredths."""
+    times = np.arange(end - days * 86400, end, interval, dtype=np.int64)
+    daily = 400 * np.sin(2 * np.pi * (times % 86400) / 86400)
+    drift = np.cumsum(rng.integers(-3, 4, len(times)))
+    return times, (2000 + daily + drift).astype(np.int32)
+
+
+def timed(function, repeat=20):
+    """Return the result and the best time of a call in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def disk_size(root):
+    """Return the bytes of all files below root."""
+    size = 0
+    for path, _, files in os.walk(root):
+        for name in files:
+            size += os.path.getsize(os.path.join(path, name))
+    return size
+
+
+def main():
+    """Fill a store and time the queries."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--stations', type=int, default=200)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--interval', type=int, default=60)
+    parser.add_argument('--sqlite', action='store_true')
+    args = parser.parse_args()
+    rng = np.random.default_rng(1)
+    end = int(time.time()) // 86400 * 86400
+    root = tempfile.mkdtemp(prefix='tsstore-')
+    try:
+        store = ColumnStore(os.path.join(root, 'tsdb'))
+        database = None
+        if args.sqlite:
+            database = sqlite3.connect(os.path.join(root, 'readings.sqlite'))
+            database.executescript(SCHEMA)
+        readings = 0
+        written = 0.0
+        for station in range(1, args.stations + 1):
+            times, values = generate(rng, args.days, args.interval, end)
+            start = time.perf_counter()
+            store.write(station, UNIT, times, values)
+            written += time.perf_counter() - start
+            readings += len(times)
+            if database is not None:
+                with database:
+                    database.executemany(
+                        'INSERT INTO readings VALUES (?, ?, ?, ?, ?)',
+                        zip([station] * len(times), [UNIT] * len(times),
+                            [''] * len(times), times.tolist(),
+                            values.tolist()))
+        start = time.perf_counter()
+        store.close()
+        written += time.perf_counter() - start
+        size = disk_size(os.path.join(root, 'tsdb'))
+        print('{:24} {:>12}'.format('readings', readings))
+        print('{:24} {:>12.0f}'.format('written/s', readings / written))
+        print('{:24} {:>12.2f}'.format('bytes/reading', size / readings))
+
+        store = ColumnStore(os.path.join(root, 'tsdb'))
+        day = 86400
+        queries = {
+            'raw day': lambda: store.range(1, UNIT, end - day, end),
+            'hourly month': lambda: store.rollup(
+                1, UNIT, end - 30 * day, end, 3600),
+            'daily month': lambda: store.rollup(
+                1, UNIT, end - 30 * day, end, day),
+            'odd 10 min week': lambda: store.rollup(
+                1, UNIT, end - 7 * day, end, 600),
+            'fleet hourly day': lambda: [
+                store.rollup(station, UNIT, end - day, end, 3600)
+                for station in range(1, args.stations + 1)],
+        }
+        for name, query in queries.items():
+            _, elapsed = timed(query)
+            print('{:24} {:>9.2f} ms'.format(name, elapsed))
+        if database is not None:
+            _, elapsed = timed(lambda: database.execute(
+                'SELECT timestamp / 3600, COUNT(*), MIN(value), MAX(value),'
+                ' AVG(value) FROM readings WHERE station = 1 AND unit = ?'
+                ' AND sensor = \'\' AND timestamp >= ? AND timestamp < ?'
+                ' GROUP BY timestamp / 3600',
+                (UNIT, end - 30 * day, end)).fetchall(), 5)
+            print('{:24} {:>9.2f} ms'.format('sqlite hourly month',
+                                             elapsed))
+            database.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
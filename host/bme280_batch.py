@@ -0,0 +1,258 @@
+"""
+Compensation of logged raw BME280 readings with NumPy.
+
+compensate() gives the same integers as BME280.read_compensated_data of
+bme280.py for arrays of raw temperature, pressure and humidity readings:
+the 64 bit integer formulas of the datasheet on int64 arrays, in chunks of
+CHUNK samples to bound the memory. Like bme280.py the temperature uses
+dig_T2 >> 11, not the (... * dig_T2) >> 11 of the datasheet, so old and
+reprocessed readings agree.
+
+int64 overflows are impossible for readings of a working sensor, but not
+for every calibration and raw value. Samples whose intermediates leave
+the safe ranges are recompensated with the long integers of bme280.py, so
+every sample is exact.
+
+The calibration is the tuple of BME280.calibration (dig_T1 to dig_H6), a
+JSON list of it or a JSON object of the dig_* names. Raw readings are an
+(N, 3) .npy file of raw temperature, pressure and humidity:
+
+    python host/bme280_batch.py reprocess raw.npy values.npy \\
+        --calibration calibration.json
+    python host/bme280_batch.py check --samples 10000000
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+# bme280.py runs on CPython with the struct module.
+sys.modules.setdefault('ustruct', struct)
+
+from bme280 import BME280  # noqa: E402
+
+CHUNK = 1 << 18
+NAMES = ('dig_T1', 'dig_T2', 'dig_T3', 'dig_P1', 'dig_P2', 'dig_P3',
+         'dig_P4', 'dig_P5', 'dig_P6', 'dig_P7', 'dig_P8', 'dig_P9',
+         'dig_H1', 'dig_H2', 'dig_H3', 'dig_H4', 'dig_H5', 'dig_H6')
+
+
+def load_calibration(path):
+    """Return the calibration tuple of a JSON file."""
+    with open(path) as source:
+        data = json.load(source)
+    if isinstance(data, dict):
+        data = [data[name] for name in NAMES]
+    if len(data) != len(NAMES):
+        raise ValueError('A calibration has {} values'.format(len(NAMES)))
+    return tuple(int(value) for value in data)
+
+
+class _Calibration():
+    """The dig_* attributes the compensation of bme280.py uses."""
+
+    def __init__(self, calibration):
+        """Set the attributes from a calibration tuple."""
+        for name, value in zip(NAMES, calibration):
+            setattr(self, name, value)
+        self.t_fine = 0
+
+
+def compensate_one(calibration, raw_temp, raw_press, raw_hum):
+    """Return the compensated values of one sample with bme280.py."""
+    return BME280._compensate(_Calibration(calibration), int(raw_temp),
+                              int(raw_press), int(raw_hum))
+
+
+def _compensate_chunk(cal, raw_temp, raw_press, raw_hum, out):
+    """
+    Compensate one chunk into out, return the indexes to redo.
+
+    The indexes are of the samples whose intermediates may have overflowed.
+    """
+    raw_temp = raw_temp.astype(np.int64)
+    raw_press = raw_press.astype(np.int64)
+    raw_hum = raw_hum.astype(np.int64)
+
+    # temperature
+    var1 = ((raw_temp >> 3) - (cal.dig_T1 << 1)) * (cal.dig_T2 >> 11)
+    var2 = (raw_temp >> 4) - cal.dig_T1
+    var2 = (((var2 * var2) >> 12) * cal.dig_T3) >> 14
+    t_fine = var1 + var2
+    out[:, 0] = (t_fine * 5 + 128) >> 8
+    # The pressure and humidity products need a small t_fine.
+    safe = np.abs(t_fine) < (1 << 22)
+
+    # pressure
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * cal.dig_P6
+    var2 += (var1 * cal.dig_P5) << 17
+    var2 += cal.dig_P4 << 35
+    var1 = ((var1 * var1 * cal.dig_P3) >> 8) + ((var1 * cal.dig_P2) << 12)
+    var1 += 1 << 47
+    safe &= np.abs(var1) < (1 << 63) // max(1, cal.dig_P1)
+    var1 = (var1 * cal.dig_P1) >> 33
+    zero = var1 == 0
+    p = ((1048576 - raw_press) << 31) - var2
+    safe &= np.abs(p) < (1 << 51)
+    p = (p * 3125) // np.where(zero, 1, var1)
+    safe &= np.abs(p) < (1 << 37)
+    var1 = (cal.dig_P9 * (p >> 13) * (p >> 13)) >> 25
+    var2 = (cal.dig_P8 * p) >> 19
+    pressure = ((p + var1 + var2) >> 8) + (cal.dig_P7 << 4)
+    out[:, 1] = np.where(zero, 0, pressure)
+
+    # humidity
+    h = t_fine - 76800
+    h = ((((raw_hum << 14) - (cal.dig_H4 << 20) - (cal.dig_H5 * h)) +
+          16384) >> 15) * (((((((h * cal.dig_H6) >> 10) *
+                               (((h * cal.dig_H3) >> 11) + 32768)) >> 10) +
+                             2097152) * cal.dig_H2 + 8192) >> 14)
+    # The correction is not negative, a negative h ends up as 0.
+    negative = h < 0
+    safe &= h < (1 << 45)
+    h -= ((((h >> 15) * (h >> 15)) >> 7) * cal.dig_H1) >> 4
+    out[:, 2] = np.where(negative, 0, np.clip(h, 0, 419430400) >> 12)
+    return np.flatnonzero(~safe)
+
+
+def compensate(calibration, raw_temp, raw_press, raw_hum, out=None,
+               chunk=CHUNK):
+    """
+    Return the compensated readings of raw readings.
+
+    The result is an (N, 3) int64 array of the temperature in hundredths
+    of degC, the pressure in Pa / 256 and the humidity in %RH / 1024, like
+    BME280.read_compensated_data. out may be an (N, 3) array to fill, e.g.
+    a memory map.
+    """
+    raw_temp = np.asarray(raw_temp)
+    raw_press = np.asarray(raw_press)
+    raw_hum = np.asarray(raw_hum)
+    count = len(raw_temp)
+    if out is None:
+        out = np.empty((count, 3), np.int64)
+    cal = _Calibration(calibration)
+    buffer = np.empty((min(chunk, count), 3), np.int64)
+    for start in range(0, count, chunk):
+        end = min(start + chunk, count)
+        part = buffer[:end - start]
+        redo = _compensate_chunk(cal, raw_temp[start:end],
+                                 raw_press[start:end], raw_hum[start:end],
+                                 part)
+        for i in redo:
+            part[i] = compensate_one(
+                calibration, raw_temp[start + i], raw_press[start + i],
+                raw_hum[start + i])
+        out[start:end] = part
+    return out
+
+
+def to_values(compensated):
+    """
+    Return compensated readings in hundredths like BME280.read_values.
+
+    The temperature is in hundredths of degC, the pressure in hundredths
+    of hPa and the humidity in hundredths of %RH.
+    """
+    values = compensated.copy()
+    values[:, 1] //= 256
+    values[:, 2] = values[:, 2] * 100 // 1024
+    return values
+
+
+def reprocess(calibration, raw_path, out_path, chunk=CHUNK):
+    """Compensate an (N, 3) .npy file of raw readings into values."""
+    raw = np.load(raw_path, mmap_mode='r')
+    out = np.lib.format.open_memmap(out_path, 'w+', np.int32, raw.shape)
+    part = np.empty((min(chunk, len(raw)), 3), np.int64)
+    for start in range(0, len(raw), chunk):
+        rows = raw[start:start + chunk]
+        done = compensate(calibration, rows[:, 0], rows[:, 1], rows[:, 2],
+                          part[:len(rows)], chunk)
+        out[start:start + len(rows)] = to_values(done)
+    out.flush()
+    return len(raw)
+
+
+def random_raw(rng, count):
+    """Return raw readings of a sensor between -40 and 85 degC."""
+    return (rng.integers(380000, 660000, count),
+            rng.integers(200000, 700000, count),
+            rng.integers(0, 65536, count))
+
+
+# The calibration of the datasheet example, typical humidity values.
+EXAMPLE = (27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7, 15500,
+           -14600, 6000, 75, 362, 0, 313, 50, 30)
+
+
+def check(samples, seed=1):
+    """Compare with bme280.py and time the compensation."""
+    rng = np.random.default_rng(seed)
+    calibrations = [EXAMPLE]
+    for _ in range(3):
+        calibrations.append(tuple(int(rng.integers(low, high)) for low, high
+                                  in ((1, 65536), (-32768, 32768),
+                                      (-32768, 32768), (1, 65536),
+                                      (-32768, 32768), (-32768, 32768),
+                                      (-32768, 32768), (-32768, 32768),
+                                      (-32768, 32768), (-32768, 32768),
+                                      (-32768, 32768), (-32768, 32768),
+                                      (0, 256), (-32768, 32768), (0, 256),
+                                      (-2048, 2048), (-2048, 2048),
+                                      (-128, 128))))
+    for calibration in calibrations:
+        raw = random_raw(rng, 20000)
+        # The edges of the raw ranges.
+        raw = [np.concatenate([column, [0, 1, (1 << 20) - 1, 1 << 19]])
+               for column in raw]
+        result = compensate(calibration, *raw, chunk=4096)
+        for i in range(len(raw[0])):
+            expected = compensate_one(calibration, raw[0][i], raw[1][i],
+                                      raw[2][i])
+            if tuple(result[i]) != expected:
+                raise AssertionError('Sample {} of {}: {} != {}'.format(
+                    i, calibration, tuple(result[i]), expected))
+    print("Exact for", len(calibrations), "calibrations")
+    raw = random_raw(rng, samples)
+    start = time.perf_counter()
+    compensate(EXAMPLE, *raw)
+    elapsed = time.perf_counter() - start
+    count = 20000
+    begin = time.perf_counter()
+    for i in range(count):
+        compensate_one(EXAMPLE, raw[0][i], raw[1][i], raw[2][i])
+    one = (time.perf_counter() - begin) / count
+    print('{} samples in {:.2f} s, {:.1f} M/s, {:.0f}x the samples one by '
+          'one'.format(samples, elapsed, samples / elapsed / 1e6,
+                       one * samples / elapsed))
+
+
+def main():
+    """Reprocess a file or check the compensation."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    reprocessing = commands.add_parser('reprocess')
+    reprocessing.add_argument('raw')
+    reprocessing.add_argument('values')
+    reprocessing.add_argument('--calibration', required=True)
+    checking = commands.add_parser('check')
+    checking.add_argument('--samples', type=int, default=1000000)
+    args = parser.parse_args()
+    if args.command == 'check':
+        check(args.samples)
+        return
+    count = reprocess(load_calibration(args.calibration), args.raw,
+                      args.values)
+    print("Reprocessed", count, "readings")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,556 @@
+"""
+Receiving side of the station uploads, writing to a SQLite store.
+
+An asyncio HTTP/1.1 server for a fleet of stations. It answers the
+requests of httpclient.py on kept-alive connections:
+
+- GET  .../controller/<hardware_id>: the controller data with an ETag,
+  a new station ID is registered for an unknown hardware ID
+- POST .../stations/<id>/data: one reading, stamped on arrival
+- POST .../stations/<id>/batch: a JSON array of readings
+- POST with Content-Type application/octet-stream: a telemetry frame,
+  see telemetry.py
+- POST .../stations/<id>/metrics: a summary of metrics.py
+- GET  .../alerts?since=<id>&wait=<s>: the alerts after the given one as
+  JSON; with wait, a request without them is held until the next alert
+  is stored, for at most wait (up to MAX_WAIT) seconds
+
+Readings are not written per request. They are queued and a single writer
+inserts them in bulk, one transaction per FLUSH_ROWS readings or
+FLUSH_MS milliseconds. A request is answered after its readings are
+committed, so a station only drops readings the store has. The queue is
+bounded: when the writer falls behind, requests wait for room and are
+answered with 503 and Retry-After after QUEUE_TIMEOUT seconds, which the
+stations take as a reason to keep their readings. The requests of a
+failed write are answered with 503 as well, the writer goes on.
+
+    python host/ingest_server.py --port 8080 --db readings.sqlite
+
+Stations point post_data, post_batch_data and get_controller_data to
+http://<host>:8080/api/stations/{station_ID}/data and so on, see
+host/bench_ingest.py for a load test. With --columns the readings are
+also written to a column store for dashboards, see tsstore.py.
+
+Every reading is evaluated against the alert rules of the stations as it
+is written, see alerts.py. --rules is a JSON file of the hysteresis, hold
+time and rate per critical value id, like credentials.alert_rules:
+
+    {"1": [0.5, 120, 2.0], "11": [1, 0, 0]}
+
+Alerts are stored with the readings that raised them.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from alerts import FleetRules  # noqa: E402
+from telemetry_bridge import decode  # noqa: E402
+
+FLUSH_ROWS = 5000
+FLUSH_MS = 20
+QUEUE_REQUESTS = 10000
+QUEUE_TIMEOUT = 5.0
+MAX_BODY = 64 * 1024
+MAX_WAIT = 60
+# Timestamps and values in hundredths are 32 bit, like on the station.
+MAX_INT = 2 ** 31 - 1
+
+INTERVAL = 60
+CRITICAL_VALUES = {1: (10, 30), 2: (20, 70), 11: (900, 1100)}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    station INTEGER NOT NULL,
+    unit INTEGER NOT NULL,
+    sensor TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (station, unit, sensor, timestamp)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stations (
+    id INTEGER PRIMARY KEY,
+    hardware_id TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    station INTEGER NOT NULL,
+    received INTEGER NOT NULL,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    station INTEGER NOT NULL,
+    unit INTEGER NOT NULL,
+    sensor TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    flags TEXT NOT NULL
+);
+"""
+
+REASONS = {200: 'OK', 201: 'Created', 204: 'No Content',
+           304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large',
+           503: 'Service Unavailable'}
+
+
+class BadRequest(Exception):
+    """A request the server cannot take, answered with 400."""
+
+
+def parse_reading(station_id, reading, now):
+    """
+    Return a reading of the JSON API as a row of the store.
+
+    Values are stored in hundredths like on the station, a reading without
+    timestamp is stamped with now. Timestamps before 1970 and numbers
+    beyond 32 bit are rejected.
+    """
+    try:
+        row = (station_id, int(reading['unitId']),
+               str(reading.get('sensor', '')),
+               int(reading.get('timestamp', now)),
+               int(round(float(reading['value']) * 100)))
+    except (AttributeError, KeyError, OverflowError, TypeError,
+            ValueError) as err:
+        raise BadRequest('Invalid reading: {!r}'.format(err))
+    if not (0 <= row[1] <= MAX_INT and 0 <= row[3] <= MAX_INT and
+            -MAX_INT <= row[4] <= MAX_INT):
+        raise BadRequest('Reading out of range: {!r}'.format(reading))
+    return row
+
+
+class Store():
+    """
+    The SQLite store of readings, stations and metrics.
+
+    All methods block and run on the one thread of the writer, so the
+    connection is never shared. A reading uploaded twice, e.g. after a lost
+    response, is stored once.
+    """
+
+    def __init__(self, path, columns=None):
+        """
+        Open or create the database at path.
+
+        Committed readings are also written to columns, a
+        tsstore.ColumnStore, if it is given.
+        """
+        self.path = path
+        self.columns = columns
+        self.db = None
+
+    def open(self):
+        """Connect and create the tables."""
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        # WAL commits survive a crash of the process, fsync on checkpoint.
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        """Close the connection."""
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+        if self.columns is not None:
+            self.columns.close()
+
+    def write(self, rows, summaries, alerts=()):
+        """Insert readings, metrics and alerts in one transaction."""
+        inserted = rows
+        with self.db:
+            if self.columns is None:
+                self.db.executemany(
+                    'INSERT OR IGNORE INTO readings VALUES (?, ?, ?, ?, ?)',
+                    rows)
+            else:
+                # Only new readings go to the columns, a repeated upload
+                # would be counted twice there.
+                inserted = [row for row in rows if self.db.execute(
+                    'INSERT OR IGNORE INTO readings VALUES (?, ?, ?, ?, ?)',
+                    row).rowcount]
+            if summaries:
+                self.db.executemany(
+                    'INSERT INTO metrics VALUES (?, ?, ?)', summaries)
+            if alerts:
+                self.db.executemany(
+                    'INSERT INTO alerts VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(alert['id'], alert['station'], alert['unitId'],
+                      alert['sensor'], alert['timestamp'],
+                      int(round(alert['value'] * 100)),
+                      ','.join(alert['flags'])) for alert in alerts])
+        if self.columns is not None:
+            self.columns.write_rows(inserted)
+
+    def station_id(self, hardware_id):
+        """Return the station ID of a hardware ID, register it if new."""
+        with self.db:
+            self.db.execute(
+                'INSERT OR IGNORE INTO stations (hardware_id) VALUES (?)',
+                (hardware_id,))
+            return self.db.execute(
+                'SELECT id FROM stations WHERE hardware_id = ?',
+                (hardware_id,)).fetchone()[0]
+
+    def last_alert_id(self):
+        """Return the id of the last stored alert, 0 without alerts."""
+        return self.db.execute(
+            'SELECT COALESCE(MAX(id), 0) FROM alerts').fetchone()[0]
+
+    def count(self):
+        """Return the number of stored readings."""
+        return self.db.execute('SELECT COUNT(*) FROM readings').fetchone()[0]
+
+
+class IngestServer():
+    """
+    The HTTP server with the write queue in front of the store.
+
+    Counters of requests, readings, flushes, alerts and rejected requests
+    are kept in stats and printed every report_s seconds if it is set.
+    alert_rules are the rules of the critical values, see alerts.py.
+    """
+
+    def __init__(self, store, flush_rows=FLUSH_ROWS, flush_ms=FLUSH_MS,
+                 queue_requests=QUEUE_REQUESTS, queue_timeout=QUEUE_TIMEOUT,
+                 interval=INTERVAL, critical_values=None, report_s=0,
+                 alert_rules=None):
+        """Prepare the server, nothing runs before start."""
+        self.store = store
+        self.flush_rows = flush_rows
+        self.flush_s = flush_ms / 1000
+        self.queue_requests = queue_requests
+        self.queue_timeout = queue_timeout
+        self.interval = interval
+        if critical_values is None:
+            critical_values = CRITICAL_VALUES
+        self.critical_values = critical_values
+        self.rules = FleetRules(critical_values, alert_rules)
+        self.report_s = report_s
+        self.stats = dict.fromkeys((
+            'requests', 'readings', 'flushes', 'alerts', 'rejected',
+            'errors', 'connections'), 0)
+        self.queue = None
+        self.server = None
+        self.port = None
+        self._executor = ThreadPoolExecutor(1, 'ingest-store')
+        self._stations = {}
+        self._tasks = []
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Open the store, start the writer and listen."""
+        self.queue = asyncio.Queue(self.queue_requests)
+        await self._run(self.store.open)
+        self.rules.next_id = await self._run(self.store.last_alert_id) + 1
+        self._tasks.append(asyncio.ensure_future(self._writer()))
+        if self.report_s:
+            self._tasks.append(asyncio.ensure_future(self._reporter()))
+        self.server = await asyncio.start_server(
+            self._serve, host, port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop listening, write the queued readings and close the store."""
+        self.server.close()
+        await self.server.wait_closed()
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._run(self.store.close)
+        self._executor.shutdown()
+
+    def _run(self, function, *args):
+        """Run a store method on the writer thread."""
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, function, *args)
+
+    async def _serve(self, reader, writer):
+        """Answer the requests of one connection."""
+        self.stats['connections'] += 1
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    return
+                method, path, headers = self._parse_head(head)
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    self._reply(writer, 413, close=True)
+                    return
+                body = await reader.readexactly(length)
+                self.stats['requests'] += 1
+                try:
+                    status, extra, content = await self._handle(
+                        method, path, headers, body)
+                except BadRequest as err:
+                    print("Bad request", method, path, err)
+                    self.stats['errors'] += 1
+                    status, extra, content = 400, {}, b''
+                close = headers.get('connection', '').lower() == 'close'
+                self._reply(writer, status, extra, content, close)
+                await writer.drain()
+                if close:
+                    return
+        except (asyncio.LimitOverrunError, ConnectionError, ValueError):
+            return
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_head(head):
+        """Return the method, path and lower-case headers of a request."""
+        lines = head.decode('latin-1').split('\r\n')
+        method, path, _ = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+        return method, path, headers
+
+    @staticmethod
+    def _reply(writer, status, headers=None, content=b'', close=False):
+        """Write a response."""
+        lines = ['HTTP/1.1 {} {}'.format(status, REASONS.get(status, '')),
+                 'Content-Length: {}'.format(len(content))]
+        for name, value in (headers or {}).items():
+            lines.append('{}: {}'.format(name, value))
+        if close:
+            lines.append('Connection: close')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + content)
+
+    async def _handle(self, method, path, headers, body):
+        """Return the status, headers and body of the response."""
+        parts = path.split('?', 1)[0].strip('/').split('/')
+        if method == 'GET':
+            if len(parts) >= 2 and parts[-2] == 'controller':
+                return await self._controller(parts[-1], headers)
+            if parts[-1] == 'alerts':
+                return await self._alerts(path)
+            return 404, {}, b''
+        if method != 'POST':
+            return 405, {}, b''
+        now = int(time.time())
+        if headers.get('content-type') == 'application/octet-stream':
+            try:
+                station_id, readings = decode(body)
+            except ValueError as err:
+                raise BadRequest(err)
+            rows = [parse_reading(station_id, reading, now)
+                    for reading in readings]
+            return await self._queue(rows)
+        if len(parts) < 3 or parts[-3] != 'stations':
+            return 404, {}, b''
+        try:
+            station_id = int(parts[-2])
+            data = json.loads(body)
+        except ValueError as err:
+            raise BadRequest(err)
+        if parts[-1] == 'data':
+            return await self._queue([parse_reading(station_id, data, now)])
+        if parts[-1] == 'batch':
+            if not isinstance(data, list):
+                raise BadRequest('A batch is a JSON array')
+            return await self._queue([parse_reading(station_id, reading, now)
+                                      for reading in data])
+        if parts[-1] == 'metrics':
+            summary = (station_id, now, json.dumps(data))
+            return await self._queue([], summary)
+        return 404, {}, b''
+
+    async def _controller(self, hardware_id, headers):
+        """Return the controller data of a station with its ETag."""
+        if hardware_id not in self._stations:
+            station_id = await self._run(self.store.station_id, hardware_id)
+            data = {
+                'id': station_id,
+                'settings': {'measureDuration': self.interval},
+                'location': {'criticalValues': [
+                    {'id': unit_id, 'minValue': low, 'maxValue': high}
+                    for unit_id, (low, high) in
+                    sorted(self.critical_values.items())]},
+            }
+            content = json.dumps(data).encode()
+            etag = '"{}"'.format(hashlib.sha1(content).hexdigest()[:16])
+            self._stations[hardware_id] = (etag, content)
+        etag, content = self._stations[hardware_id]
+        if headers.get('if-none-match') == etag:
+            return 304, {'ETag': etag}, b''
+        return 200, {'ETag': etag,
+                     'Content-Type': 'application/json'}, content
+
+    async def _alerts(self, path):
+        """
+        Return the kept alerts after the since parameter.
+
+        Without any, the request waits for the next alert up to the wait
+        parameter in seconds, as a subscriber of the rules.
+        """
+        since = 0
+        wait = 0
+        for parameter in path.partition('?')[2].split('&'):
+            name, _, value = parameter.partition('=')
+            try:
+                if name == 'since':
+                    since = int(value)
+                elif name == 'wait':
+                    wait = min(float(value), MAX_WAIT)
+            except ValueError as err:
+                raise BadRequest(err)
+        alerts = self.rules.since(since)
+        if not alerts and wait > 0:
+            queue = self.rules.subscribe()
+            try:
+                await asyncio.wait_for(queue.get(), wait)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.rules.unsubscribe(queue)
+            alerts = self.rules.since(since)
+        content = json.dumps(alerts).encode()
+        return 200, {'Content-Type': 'application/json'}, content
+
+    async def _queue(self, rows, summary=None):
+        """Queue rows for the writer and wait until they are committed."""
+        done = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(
+                self.queue.put((rows, summary, done)), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats['rejected'] += 1
+            return 503, {'Retry-After': '{:.0f}'.format(
+                self.queue_timeout)}, b''
+        try:
+            await done
+        except OSError:
+            # The write failed, the station keeps the readings.
+            return 503, {'Retry-After': '{:.0f}'.format(
+                self.queue_timeout)}, b''
+        return 201, {'Content-Type': 'application/json'}, b'{}'
+
+    async def _writer(self):
+        """Write the queued readings in bulk transactions."""
+        loop = asyncio.get_running_loop()
+        queue = self.queue
+        alerts = []
+        while True:
+            items = [await queue.get()]
+            rows = list(items[0][0])
+            deadline = loop.time() + self.flush_s
+            while len(rows) < self.flush_rows:
+                if queue.empty():
+                    left = deadline - loop.time()
+                    if left <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), left)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = queue.get_nowait()
+                items.append(item)
+                rows.extend(item[0])
+            summaries = [item[1] for item in items if item[1]]
+            try:
+                # The rules have seen the readings of a failed write, its
+                # alerts are kept for the next one.
+                alerts.extend(self.rules.evaluate(rows))
+                await self._run(self.store.write, rows, summaries, alerts)
+            except Exception as err:
+                # Only the requests of this batch fail, the writer goes on.
+                print("Write failed:", repr(err))
+                for _, _, done in items:
+                    if not done.done():
+                        done.set_exception(OSError(err))
+            else:
+                self.stats['flushes'] += 1
+                self.stats['readings'] += len(rows)
+                self.stats['alerts'] += len(alerts)
+                self.rules.publish(alerts)
+                alerts = []
+                for _, _, done in items:
+                    if not done.done():
+                        done.set_result(None)
+            for _ in items:
+                queue.task_done()
+
+    async def _reporter(self):
+        """Print the counters every report_s seconds."""
+        last = dict(self.stats)
+        while True:
+            await asyncio.sleep(self.report_s)
+            stats = dict(self.stats)
+            print("{:.0f} requests/s, {:.0f} readings/s, {} flushes, "
+                  "{} alerts, {} queued, {} rejected".format(
+                      (stats['requests'] - last['requests']) / self.report_s,
+                      (stats['readings'] - last['readings']) / self.report_s,
+                      stats['flushes'] - last['flushes'],
+                      stats['alerts'] - last['alerts'], self.queue.qsize(),
+                      stats['rejected']))
+            last = stats
+
+
+async def serve(args):
+    """Run the server until it is interrupted."""
+    columns = None
+    if args.columns:
+        # NumPy is only needed for the column store.
+        import tsstore
+        columns = tsstore.ColumnStore(args.columns)
+    alert_rules = None
+    if args.rules:
+        with open(args.rules) as source:
+            alert_rules = {int(critical_id): rule for critical_id, rule
+                           in json.load(source).items()}
+    server = IngestServer(Store(args.db, columns), args.flush_rows,
+                          args.flush_ms, args.queue, args.queue_timeout,
+                          args.interval, report_s=args.report,
+                          alert_rules=alert_rules)
+    await server.start(args.host, args.port)
+    print("Ingesting on port", server.port, "into", args.db)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    """Run the ingestion server."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--db', default='readings.sqlite')
+    parser.add_argument('--columns', metavar='DIR',
+                        help='also write to a column store, see tsstore.py')
+    parser.add_argument('--flush-rows', type=int, default=FLUSH_ROWS)
+    parser.add_argument('--flush-ms', type=float, default=FLUSH_MS)
+    parser.add_argument('--queue', type=int, default=QUEUE_REQUESTS,
+                        help='requests waiting for the writer at most')
+    parser.add_argument('--queue-timeout', type=float,
+                        default=QUEUE_TIMEOUT)
+    parser.add_argument('--interval', type=int, default=INTERVAL,
+                        help='measuring interval of new stations')
+    parser.add_argument('--rules', metavar='FILE',
+                        help='JSON alert rules by critical value id')
+    parser.add_argument('--report', type=float, default=10,
+                        help='seconds between printed counters, 0 for none')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
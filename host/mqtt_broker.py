@@ -0,0 +1,277 @@
+"""
+A small MQTT 3.1.1 broker to test the MQTT transport of the stations.
+
+It knows what mqtttransport.py uses: persistent sessions, QoS 0 and 1,
+retained messages, the + and # wildcards and keepalive pings. It is no
+replacement for a real broker like Mosquitto.
+
+    python host/mqtt_broker.py --port 1883 \\
+        --config 12 controller.json
+
+prints every message and publishes the controller data in
+controller.json retained to tempstation/12/config.
+"""
+import argparse
+import socket
+import struct
+import threading
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+def topic_matches(pattern, topic):
+    """Return True if a topic matches a subscription pattern."""
+    pattern = pattern.split('/')
+    topic = topic.split('/')
+    for i, level in enumerate(pattern):
+        if level == '#':
+            return True
+        if i >= len(topic) or level not in ('+', topic[i]):
+            return False
+    return len(pattern) == len(topic)
+
+
+def _read_exactly(sock, size):
+    """Read size bytes, raise ConnectionError if the client is gone."""
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Client disconnected')
+        data += chunk
+    return data
+
+
+def read_packet(sock):
+    """Return the type, flags and body of the next packet."""
+    header = _read_exactly(sock, 1)[0]
+    length = 0
+    shift = 0
+    while True:
+        byte = _read_exactly(sock, 1)[0]
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return header >> 4, header & 0x0F, _read_exactly(sock, length)
+
+
+def packet(kind, flags, body):
+    """Return a packet with its fixed header."""
+    head = bytearray([kind << 4 | flags])
+    length = len(body)
+    while True:
+        byte = length & 0x7F
+        length >>= 7
+        head.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(head) + body
+
+
+def _string(data, pos):
+    """Return a length prefixed string and the position after it."""
+    size = struct.unpack_from('!H', data, pos)[0]
+    return data[pos + 2:pos + 2 + size].decode(), pos + 2 + size
+
+
+class Session():
+    """Subscriptions and undelivered QoS 1 messages of a client."""
+
+    def __init__(self):
+        """Start an empty session."""
+        self.subscriptions = {}
+        self.queue = []
+        self.connection = None
+        self.clean = True
+
+
+class Broker():
+    """
+    Route messages between clients.
+
+    Every client is served by its own thread. The messages are kept in
+    messages as (topic, payload, qos, retain) for tests.
+    """
+
+    def __init__(self, host='127.0.0.1', port=1883):
+        """Listen on the address, port 0 picks a free port."""
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(8)
+        self.port = self.server.getsockname()[1]
+        self.sessions = {}
+        self.retained = {}
+        self.messages = []
+        self.lock = threading.Lock()
+        self._packet_id = 0
+
+    def start(self):
+        """Serve in a daemon thread and return the broker."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        """Accept clients."""
+        while True:
+            sock, _ = self.server.accept()
+            threading.Thread(target=self._serve, args=(sock,),
+                             daemon=True).start()
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish a message, e.g. the config of a station."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        with self.lock:
+            self.messages.append((topic, payload, qos, retain))
+            if retain:
+                if payload:
+                    self.retained[topic] = (payload, qos)
+                else:
+                    self.retained.pop(topic, None)
+            for session in self.sessions.values():
+                for pattern, granted in session.subscriptions.items():
+                    if topic_matches(pattern, topic):
+                        self._deliver(session, topic, payload,
+                                      min(qos, granted), False)
+                        break
+
+    def _deliver(self, session, topic, payload, qos, retain):
+        """Send a message to a session, queue it while it is offline."""
+        if session.connection is None:
+            if qos:
+                session.queue.append((topic, payload))
+            return
+        name = topic.encode()
+        body = struct.pack('!H', len(name)) + name
+        if qos:
+            self._packet_id = self._packet_id % 0xFFFF + 1
+            body += struct.pack('!H', self._packet_id)
+        flags = qos << 1 | int(retain)
+        try:
+            session.connection.sendall(packet(PUBLISH, flags, body + payload))
+        except OSError:
+            session.connection = None
+            if qos:
+                session.queue.append((topic, payload))
+
+    def _serve(self, sock):
+        """Serve one client until it disconnects."""
+        session = None
+        try:
+            kind, _, body = read_packet(sock)
+            if kind != CONNECT:
+                return
+            session = self._connect(sock, body)
+            while True:
+                kind, flags, body = read_packet(sock)
+                if kind == PUBLISH:
+                    self._publish(sock, flags, body)
+                elif kind == SUBSCRIBE:
+                    self._subscribe(sock, session, body)
+                elif kind == UNSUBSCRIBE:
+                    pos = 2
+                    while pos < len(body):
+                        pattern, pos = _string(body, pos)
+                        session.subscriptions.pop(pattern, None)
+                    sock.sendall(packet(UNSUBACK, 0, body[:2]))
+                elif kind == PINGREQ:
+                    sock.sendall(packet(PINGRESP, 0, b''))
+                elif kind == DISCONNECT:
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self.lock:
+                if session is not None and session.connection is sock:
+                    session.connection = None
+                    if session.clean:
+                        # A clean session ends with its connection.
+                        self.sessions = {
+                            key: value for key, value
+                            in self.sessions.items() if value is not session}
+            sock.close()
+
+    def _connect(self, sock, body):
+        """Open or resume the session of a client."""
+        _, pos = _string(body, 0)
+        flags = body[pos + 1]
+        client_id, _ = _string(body, pos + 4)
+        clean = bool(flags & 0x02)
+        with self.lock:
+            present = not clean and client_id in self.sessions
+            if not present:
+                self.sessions[client_id] = Session()
+            session = self.sessions[client_id]
+            session.clean = clean
+            session.connection = sock
+            sock.sendall(packet(CONNACK, 0, bytes([int(present), 0])))
+            queue, session.queue = session.queue, []
+            for topic, payload in queue:
+                self._deliver(session, topic, payload, 1, False)
+        print("Client", client_id, "connected, session present:", present)
+        return session
+
+    def _publish(self, sock, flags, body):
+        """Take a message of a client."""
+        qos = flags >> 1 & 0x03
+        topic, pos = _string(body, 0)
+        if qos:
+            sock.sendall(packet(PUBACK, 0, body[pos:pos + 2]))
+            pos += 2
+        payload = body[pos:]
+        print("Message on", topic, "QoS", qos, ":", payload[:200])
+        self.publish(topic, payload, qos, bool(flags & 0x01))
+
+    def _subscribe(self, sock, session, body):
+        """Subscribe a client and send the matching retained messages."""
+        pos = 2
+        granted = []
+        patterns = []
+        while pos < len(body):
+            pattern, pos = _string(body, pos)
+            qos = min(body[pos], 1)
+            pos += 1
+            session.subscriptions[pattern] = qos
+            granted.append(qos)
+            patterns.append((pattern, qos))
+        with self.lock:
+            sock.sendall(packet(SUBACK, 0, body[:2] + bytes(granted)))
+            for pattern, qos in patterns:
+                for topic, (payload, retained_qos) in self.retained.items():
+                    if topic_matches(pattern, topic):
+                        self._deliver(session, topic, payload,
+                                      min(qos, retained_qos), True)
+
+
+def main():
+    """Run the broker."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--prefix', default='tempstation')
+    parser.add_argument('--config', nargs=2, metavar=('STATION', 'FILE'),
+                        help='publish controller data retained')
+    args = parser.parse_args()
+    broker = Broker(args.host, args.port)
+    if args.config:
+        station_id, path = args.config
+        with open(path, 'rb') as config:
+            broker.publish('{}/{}/config'.format(args.prefix, station_id),
+                           config.read(), 1, True)
+    print("MQTT broker on port", broker.port)
+    broker.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+_onewire of the host simulator, a 1-Wire bus with the probes of the world.
+
+The bus is simulated bit by bit with the timing of the standard speed: a
+reset takes 960 us and every time slot 70 us. A temperature conversion of
+all probes takes 750 ms, the bus reads 0 until it is done.
+"""
+import hardware
+
+RESET_US = 960
+SLOT_US = 70
+CONVERSION_US = 750000
+
+_state = {'mode': None}
+
+
+def crc8(data):
+    """Return the Dallas CRC-8 of the data."""
+    return hardware.crc8(data)
+
+
+def _clock():
+    """Return the clock of the world."""
+    return hardware.world.clock
+
+
+def reset(pin):
+    """Reset the bus, return True if a device answered."""
+    _clock().advance_us(RESET_US)
+    probes = hardware.world.onewire
+    _state.update(mode='rom', active=list(probes), out=[], bits=[],
+                  search=None)
+    return bool(probes)
+
+
+def _rom_bit(probe, index):
+    """Return bit index of the ROM of a probe."""
+    return probe.rom[index // 8] >> (index % 8) & 1
+
+
+def readbit(pin):
+    """Read a bit."""
+    _clock().advance_us(SLOT_US)
+    state = _state
+    mode = state['mode']
+    if mode == 'search':
+        index, phase = state['search']
+        active = state['active']
+        if phase < 2:
+            state['search'] = (index, phase + 1)
+            wanted = 1 - phase
+            # Open drain: a 0 of any device wins.
+            return int(all(_rom_bit(probe, index) == wanted
+                           for probe in active))
+    if mode == 'convert':
+        return int(_clock().now_us() >= state['done_us'])
+    if state['out']:
+        return state['out'].pop(0)
+    return 1
+
+
+def writebit(pin, value):
+    """Write a bit."""
+    _clock().advance_us(SLOT_US)
+    state = _state
+    if state['mode'] == 'search':
+        index, _ = state['search']
+        state['active'] = [probe for probe in state['active']
+                           if _rom_bit(probe, index) == value]
+        if index == 63:
+            state['mode'] = 'function'
+        else:
+            state['search'] = (index + 1, 0)
+        return
+    state['bits'].append(value)
+    if len(state['bits']) == 8:
+        byte = sum(bit << i for i, bit in enumerate(state['bits']))
+        state['bits'] = []
+        _command(byte)
+
+
+def readbyte(pin):
+    """Read a byte, LSB first."""
+    value = 0
+    for i in range(8):
+        value |= readbit(pin) << i
+    return value
+
+
+def writebyte(pin, value):
+    """Write a byte, LSB first."""
+    _clock().advance_us(8 * SLOT_US)
+    _command(value)
+
+
+def _command(byte):
+    """Handle a byte written to the bus."""
+    state = _state
+    mode = state['mode']
+    if mode == 'rom':
+        if byte in (0xF0, 0xEC):
+            state['mode'] = 'search'
+            state['search'] = (0, 0)
+            if byte == 0xEC:
+                state['active'] = [probe for probe in state['active']
+                                   if probe.alarm]
+        elif byte == 0x55:
+            state['mode'] = 'match'
+            state['match'] = bytearray()
+        elif byte == 0xCC:
+            state['mode'] = 'function'
+    elif mode == 'match':
+        state['match'].append(byte)
+        if len(state['match']) == 8:
+            rom = bytes(state['match'])
+            state['active'] = [probe for probe in state['active']
+                               if probe.rom == rom]
+            state['mode'] = 'function'
+    elif mode == 'function':
+        if byte == 0x44:
+            for probe in state['active']:
+                probe.convert()
+            state['mode'] = 'convert'
+            state['done_us'] = _clock().now_us() + CONVERSION_US
+        elif byte == 0xBE and len(state['active']) == 1:
+            data = state['active'][0].scratchpad()
+            state['out'] = [data[i // 8] >> (i % 8) & 1 for i in range(72)]
+            state['mode'] = 'read'
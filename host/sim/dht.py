@@ -0,0 +1,58 @@
+"""
+dht of the host simulator, a DHT22 on the environment of the world.
+
+A read takes about 5 ms on the wire, like on the board. With the failure
+rate of the world a read times out, with the checksum rate its data is
+corrupted and rejected like the driver of the board does.
+"""
+import hardware
+
+
+class DHT22():
+    """A DHT22 temperature and humidity sensor."""
+
+    READ_US = 4800
+
+    def __init__(self, pin):
+        """A sensor on the pin."""
+        self.pin = pin
+        self.buf = bytearray(5)
+        self.reads = 0
+
+    def measure(self):
+        """Read the sensor into buf."""
+        world = hardware.world
+        world.clock.advance_us(self.READ_US)
+        if not world.dht22 or (world.dht_failure_rate and
+                               world.rng.random() < world.dht_failure_rate):
+            raise OSError(110, 'ETIMEDOUT')
+        self.reads += 1
+        temperature, humidity, _ = world.environment.values(
+            world.clock.real_time())
+        humidity = int(round(humidity * 10))
+        raw = int(round(abs(temperature) * 10))
+        if temperature < 0:
+            raw |= 0x8000
+        buf = self.buf
+        buf[0] = humidity >> 8
+        buf[1] = humidity & 0xFF
+        buf[2] = raw >> 8
+        buf[3] = raw & 0xFF
+        buf[4] = (buf[0] + buf[1] + buf[2] + buf[3]) & 0xFF
+        if world.dht_checksum_rate and \
+                world.rng.random() < world.dht_checksum_rate:
+            buf[4] ^= 0x01
+            raise Exception('checksum error')
+
+    def temperature(self):
+        """Return the temperature in degC."""
+        value = ((self.buf[2] & 0x7F) << 8 | self.buf[3]) * 0.1
+        return -value if self.buf[2] & 0x80 else value
+
+    def humidity(self):
+        """Return the humidity in %RH."""
+        return (self.buf[0] << 8 | self.buf[1]) * 0.1
+
+
+class DHT11(DHT22):
+    """A DHT11, simulated like a DHT22."""
@@ -0,0 +1,560 @@
+"""
+The simulated world of the host simulator.
+
+The fake MicroPython modules next to this file share one world: a virtual
+clock, the devices on the buses, the WiFi and the API. Waiting on the
+board, like sleeps, bus transfers, sensor conversions and network
+latency, only moves the virtual clock forward, so simulated hours take
+seconds on the host. The time the station code runs on the host is added
+to the clock, scaled by Clock.cpu_scale.
+
+simulator.Simulation sets up a world and runs the station code in it.
+"""
+import json
+import math
+import random
+import struct
+import time as _time
+
+# Reset causes of machine.reset_cause(), the values of the ESP8266 port.
+PWRON_RESET = 0
+WDT_RESET = 1
+SOFT_RESET = 4
+DEEPSLEEP_RESET = 5
+HARD_RESET = 6
+
+
+class SimulationEnd(BaseException):
+    """The simulated time is over."""
+
+
+class BoardReset(BaseException):
+    """The board resets, e.g. by machine.reset() or the watchdog."""
+
+    def __init__(self, cause, sleep_ms=0):
+        """Reset with the cause, after a deep sleep of sleep_ms."""
+        super().__init__(cause, sleep_ms)
+        self.cause = cause
+        self.sleep_ms = sleep_ms
+
+
+class Clock():
+    """
+    The monotonic time of the board in microseconds.
+
+    The host time spent running the station code, times cpu_scale, plus the
+    simulated waits. The real time of the world starts at the epoch. The
+    RTC of the board starts at 2000-01-01 until it is set, e.g. by
+    ntptime, and keeps running over resets, but not over a power loss.
+    The ticks start at 0 with every boot. A sleep past the deadline
+    raises SimulationEnd, so a simulation stops between two steps of the
+    station. Timers are fired when the clock passes their deadline.
+    """
+
+    def __init__(self, cpu_scale=1.0, epoch=820454400):
+        """Start the real time at the epoch, in seconds since 2000-01-01."""
+        self.cpu_scale = cpu_scale
+        self.epoch = epoch
+        self.rtc_s = 0
+        self.offset_us = 0
+        self.boot_us = 0
+        self.waited_us = 0
+        self.deadline_us = None
+        self.timers = []
+        self._host_start = _time.perf_counter()
+
+    def now_us(self):
+        """Return the time since the power-on in microseconds."""
+        host = _time.perf_counter() - self._host_start
+        return int(host * 1e6 * self.cpu_scale) + self.offset_us
+
+    def ticks_us(self):
+        """Return the time since the last boot, the ticks start at 0."""
+        return self.now_us() - self.boot_us
+
+    def boot(self):
+        """Start the ticks of a new boot."""
+        self.boot_us = self.now_us()
+        self.timers = []
+
+    def time(self):
+        """Return the time of the RTC in seconds since 2000-01-01."""
+        return self.rtc_s + self.now_us() // 1000000
+
+    def real_time(self):
+        """Return the real time in seconds since 2000-01-01."""
+        return self.epoch + self.now_us() // 1000000
+
+    def set_time(self, seconds):
+        """Set the RTC to seconds since 2000-01-01."""
+        self.rtc_s = seconds - self.now_us() // 1000000
+
+    def advance_us(self, duration_us):
+        """Let time pass without a chance to stop, e.g. in a transfer."""
+        if duration_us > 0:
+            self.offset_us += int(duration_us)
+            self.waited_us += int(duration_us)
+        self.fire_timers()
+
+    def sleep_us(self, duration_us):
+        """Sleep, raise SimulationEnd when the deadline is passed."""
+        self.advance_us(duration_us)
+        if self.deadline_us is not None and \
+                self.now_us() >= self.deadline_us:
+            raise SimulationEnd()
+
+    def fire_timers(self):
+        """Call the callbacks of the timers which are due."""
+        while self.timers:
+            due = min(self.timers, key=lambda timer: timer.deadline_us)
+            if due.deadline_us > self.now_us():
+                return
+            due.fire()
+
+
+class Environment():
+    """Slowly changing temperature, humidity and pressure with noise."""
+
+    def __init__(self, rng, temperature=21.0, humidity=45.0,
+                 pressure=101325.0, daily=3.0, noise=0.05):
+        """The mean values, the daily swing in degC and the noise."""
+        self.rng = rng
+        self.mean = (temperature, humidity, pressure)
+        self.daily = daily
+        self.noise = noise
+
+    def values(self, seconds, offset=0.0):
+        """Return temperature (degC), humidity (%RH) and pressure (Pa)."""
+        phase = math.sin(2 * math.pi * seconds / 86400)
+        temperature = self.mean[0] + offset + self.daily * phase + \
+            self.rng.gauss(0, self.noise)
+        humidity = self.mean[1] - 2 * self.daily * phase + \
+            self.rng.gauss(0, 4 * self.noise)
+        pressure = self.mean[2] + 50 * phase + \
+            self.rng.gauss(0, 40 * self.noise)
+        return temperature, min(100.0, max(0.0, humidity)), pressure
+
+
+# BME280 calibration of a real sensor, see the datasheet section 4.2.2.
+CALIBRATION = (27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7,
+               15500, -14600, 6000, 75, 362, 0, 313, 50, 30)
+
+
+class BME280Device():
+    """
+    A BME280 on the I2C bus, in sleep, forced or normal mode.
+
+    A forced measurement takes the typical time of the datasheet for the
+    oversampling set in ctrl_meas and ctrl_hum. The raw values are found
+    by inverting the compensation of the datasheet for the values of the
+    environment.
+    """
+
+    CHIP_ID = 0x60
+
+    def __init__(self, world, offset=0.0, calibration=CALIBRATION):
+        """Place the sensor, offset is its temperature error in degC."""
+        self.world = world
+        self.offset = offset
+        self.cal = calibration
+        self.registers = bytearray(256)
+        self.registers[0xD0] = self.CHIP_ID
+        (t1, t2, t3, p1, p2, p3, p4, p5, p6, p7, p8, p9, h1, h2, h3, h4,
+         h5, h6) = calibration
+        self.registers[0x88:0xA0] = struct.pack(
+            '<HhhHhhhhhhhh', t1, t2, t3, p1, p2, p3, p4, p5, p6, p7, p8, p9)
+        self.registers[0xA1] = h1
+        self.registers[0xE1:0xE8] = struct.pack(
+            '<hBbBbb', h2, h3, h4 >> 4, (h4 & 0xF) | (h5 & 0xF) << 4,
+            h5 >> 4, h6)
+        self.busy_until_us = 0
+        self.pending = False
+        self.measurements = 0
+        self._convert()
+
+    def read(self, register, count):
+        """Read registers."""
+        self._update()
+        if register == 0xF3:
+            busy = self.world.clock.now_us() < self.busy_until_us
+            self.registers[0xF3] = 0x08 if busy else 0
+        return bytes(self.registers[register:register + count])
+
+    def write(self, register, data):
+        """Write registers, ctrl_meas may start a measurement."""
+        self._update()
+        self.registers[register:register + len(data)] = data
+        if register == 0xE0 and data[0] == 0xB6:
+            self.registers[0xF2:0xF6] = bytes(4)
+        if register <= 0xF4 < register + len(data):
+            mode = self.registers[0xF4] & 0x03
+            if mode in (1, 2):
+                self.busy_until_us = self.world.clock.now_us() + \
+                    self.measure_time_us()
+                self.pending = True
+
+    def measure_time_us(self):
+        """Return the typical measurement time of the datasheet."""
+        def samples(setting):
+            return 0 if not setting else 1 << min(setting - 1, 4)
+        ctrl_meas = self.registers[0xF4]
+        time_us = 1000 + 2000 * samples(ctrl_meas >> 5)
+        if ctrl_meas >> 2 & 0x07:
+            time_us += 2000 * samples(ctrl_meas >> 2 & 0x07) + 500
+        if self.registers[0xF2] & 0x07:
+            time_us += 2000 * samples(self.registers[0xF2] & 0x07) + 500
+        return time_us
+
+    def _update(self):
+        """Finish a forced measurement or follow the normal mode."""
+        now = self.world.clock.now_us()
+        if self.pending and now >= self.busy_until_us:
+            self.pending = False
+            self._convert()
+            # Back to sleep after a forced measurement.
+            self.registers[0xF4] &= 0xFC
+        elif self.registers[0xF4] & 0x03 == 0x03:
+            self._convert()
+
+    def _convert(self):
+        """Store the raw values of the environment in the data registers."""
+        self.measurements += 1
+        temperature, humidity, pressure = self.world.environment.values(
+            self.world.clock.real_time(), self.offset)
+        adc_t, t_fine = self._raw_temperature(temperature)
+        adc_p = self._raw_pressure(pressure, t_fine)
+        adc_h = self._raw_humidity(humidity, t_fine)
+        self.registers[0xF7:0xFF] = bytes((
+            adc_p >> 12, adc_p >> 4 & 0xFF, (adc_p & 0xF) << 4,
+            adc_t >> 12, adc_t >> 4 & 0xFF, (adc_t & 0xF) << 4,
+            adc_h >> 8, adc_h & 0xFF))
+
+    def _t_fine(self, adc_t):
+        """Compensate a raw temperature, return t_fine."""
+        t1, t2, t3 = self.cal[:3]
+        var1 = (adc_t / 16384.0 - t1 / 1024.0) * t2
+        var2 = (adc_t / 131072.0 - t1 / 8192.0) ** 2 * t3
+        return var1 + var2
+
+    def _pressure(self, adc_p, t_fine):
+        """Compensate a raw pressure in Pa."""
+        p1, p2, p3, p4, p5, p6, p7, p8, p9 = self.cal[3:12]
+        var1 = t_fine / 2.0 - 64000.0
+        var2 = var1 * var1 * p6 / 32768.0
+        var2 = var2 + var1 * p5 * 2.0
+        var2 = var2 / 4.0 + p4 * 65536.0
+        var1 = (p3 * var1 * var1 / 524288.0 + p2 * var1) / 524288.0
+        var1 = (1.0 + var1 / 32768.0) * p1
+        pressure = 1048576.0 - adc_p
+        pressure = (pressure - var2 / 4096.0) * 6250.0 / var1
+        var1 = p9 * pressure * pressure / 2147483648.0
+        var2 = pressure * p8 / 32768.0
+        return pressure + (var1 + var2 + p7) / 16.0
+
+    def _humidity(self, adc_h, t_fine):
+        """Compensate a raw humidity in %RH."""
+        h1, h2, h3, h4, h5, h6 = self.cal[12:]
+        var = t_fine - 76800.0
+        var = (adc_h - (h4 * 64.0 + h5 / 16384.0 * var)) * (
+            h2 / 65536.0 * (1.0 + h6 / 67108864.0 * var * (
+                1.0 + h3 / 67108864.0 * var)))
+        return var * (1.0 - h1 * var / 524288.0)
+
+    def _raw_temperature(self, temperature):
+        """Return the raw temperature and t_fine of a temperature."""
+        adc_t = _bisect(lambda adc: self._t_fine(adc) / 5120.0,
+                        temperature, 0, 0xFFFFF)
+        return adc_t, self._t_fine(adc_t)
+
+    def _raw_pressure(self, pressure, t_fine):
+        """Return the raw pressure, which falls with the pressure."""
+        return _bisect(lambda adc: -self._pressure(adc, t_fine),
+                       -pressure, 0, 0xFFFFF)
+
+    def _raw_humidity(self, humidity, t_fine):
+        """Return the raw humidity."""
+        return _bisect(lambda adc: self._humidity(adc, t_fine), humidity,
+                       0, 0xFFFF)
+
+
+def _bisect(function, target, low, high):
+    """Return the smallest int in low..high with function >= target."""
+    while low < high:
+        middle = (low + high) // 2
+        if function(middle) < target:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class TCA9548A():
+    """An I2C multiplexer with 8 channels of devices behind it."""
+
+    def __init__(self):
+        """Start with empty channels, none selected."""
+        self.channels = [{} for _ in range(8)]
+        self.selected = 0
+
+
+class I2CBus():
+    """
+    The devices on the I2C bus and the time of its transfers.
+
+    A transfer costs 9 bit times per byte plus start and stop at the
+    frequency of the bus.
+    """
+
+    OVERHEAD_US = 20
+
+    def __init__(self, world, freq=400000):
+        """An empty bus."""
+        self.world = world
+        self.freq = freq
+        self.devices = {}
+        self.mux_address = None
+        self.transfers = 0
+        self.bytes = 0
+
+    def add_mux(self, address=0x70):
+        """Put a TCA9548A on the bus and return it."""
+        mux = TCA9548A()
+        self.devices[address] = mux
+        self.mux_address = address
+        return mux
+
+    def transfer(self, count):
+        """Let the time of a transfer of count bytes pass."""
+        self.transfers += 1
+        self.bytes += count
+        self.world.clock.advance_us(
+            self.OVERHEAD_US + count * 9 * 1000000 // self.freq)
+
+    def visible(self):
+        """Return the devices reachable now, through the multiplexer."""
+        devices = dict(self.devices)
+        if self.mux_address is not None:
+            mux = self.devices[self.mux_address]
+            for channel in range(8):
+                if mux.selected & 1 << channel:
+                    devices.update(mux.channels[channel])
+        return devices
+
+    def device(self, address):
+        """Return the device at the address, OSError if it is missing."""
+        device = self.visible().get(address)
+        if device is None:
+            raise OSError(19, 'ENODEV')
+        return device
+
+
+class Probe():
+    """A 1-Wire device, e.g. a DS18B20 with its ROM and temperature."""
+
+    def __init__(self, world, serial, family=0x28, offset=0.0, alarm=False):
+        """A probe with the serial number in its ROM."""
+        self.world = world
+        rom = bytearray([family]) + serial.to_bytes(6, 'little')
+        rom.append(crc8(rom))
+        self.rom = bytes(rom)
+        self.offset = offset
+        self.alarm = alarm
+        self.raw = 0x0550
+        self.bad_reads = 0
+
+    def convert(self):
+        """Convert the temperature of the environment."""
+        temperature = self.world.environment.values(
+            self.world.clock.real_time(), self.offset)[0]
+        self.raw = int(round(temperature * 16)) & 0xFFFF
+
+    def scratchpad(self):
+        """Return the scratchpad, damaged while bad_reads are left."""
+        data = bytearray([self.raw & 0xFF, self.raw >> 8, 0x4B, 0x46, 0x7F,
+                          0xFF, 0x0C, 0x10])
+        data.append(crc8(data))
+        if self.bad_reads:
+            self.bad_reads -= 1
+            data[8] ^= 0xFF
+        return data
+
+
+def crc8(data):
+    """Return the Dallas CRC-8 of the data."""
+    crc = 0
+    for byte in data:
+        for _ in range(8):
+            mix = (crc ^ byte) & 1
+            crc >>= 1
+            if mix:
+                crc ^= 0x8C
+            byte >>= 1
+    return crc
+
+
+class AccessPoint():
+    """An access point of the WLAN."""
+
+    def __init__(self, ssid, bssid, channel, rssi):
+        """An access point with its SSID, BSSID, channel and signal."""
+        self.ssid = ssid
+        self.bssid = bssid
+        self.channel = channel
+        self.rssi = rssi
+
+
+class API():
+    """
+    The Tempstation API on the other end of the simulated network.
+
+    The controller data is served with an ETag, readings are counted per
+    endpoint. Set batch to False for a server without a batch endpoint.
+    """
+
+    def __init__(self, station_id=12, interval=60, critical_values=None):
+        """Serve the controller data of one station."""
+        if critical_values is None:
+            critical_values = {1: (10, 30), 2: (20, 70), 11: (900, 1100)}
+        self.config = {
+            'id': station_id,
+            'settings': {'measureDuration': interval},
+            'location': {'criticalValues': [
+                {'id': unit_id, 'minValue': low, 'maxValue': high}
+                for unit_id, (low, high) in critical_values.items()]},
+        }
+        self.etag = '"1"'
+        self.batch = True
+        self.requests = {}
+        self.readings = 0
+        self.received = []
+
+    def handle(self, method, path, headers, body):
+        """Return the status, headers and body of the response."""
+        endpoint = path.rstrip('/').rsplit('/', 1)[-1]
+        key = '{} {}'.format(method, endpoint if method == 'POST' else path)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if method == 'GET':
+            if headers.get('if-none-match') == self.etag:
+                return 304, {'ETag': self.etag}, b''
+            return 200, {'ETag': self.etag, 'Content-Type':
+                         'application/json'}, json.dumps(self.config).encode()
+        if endpoint == 'batch' and not self.batch:
+            return 404, {}, b''
+        if endpoint in ('batch', 'data'):
+            try:
+                data = json.loads(body)
+            except ValueError:
+                return 400, {}, b''
+            self.readings += len(data) if isinstance(data, list) else 1
+            self.received.append((endpoint, data))
+            return 201, {'Content-Type': 'application/json'}, b'{}'
+        self.received.append((endpoint, body))
+        return 204, {}, b''
+
+
+class Network():
+    """
+    The WLAN and the way to the API.
+
+    Every request costs the round trip latency, the transfer of its bytes
+    at the bandwidth and the processing of the server. With the failure
+    rate a connection attempt or a request fails. A kept connection is
+    closed by the server after keepalive_s without requests.
+    """
+
+    def __init__(self, world, latency_ms=40, bandwidth=50000,
+                 server_ms=15, failure_rate=0.0, keepalive_s=5,
+                 ssid='tempstation', password='secret'):
+        """A WLAN with one access point and the API behind it."""
+        self.world = world
+        self.latency_us = latency_ms * 1000
+        self.bandwidth = bandwidth
+        self.server_us = server_ms * 1000
+        self.failure_rate = failure_rate
+        self.keepalive_us = keepalive_s * 1000000
+        self.ssid = ssid
+        self.password = password
+        self.access_points = [
+            AccessPoint(ssid, bytes.fromhex('aabbccddee01'), 6, -62)]
+        self.scan_us = 2100000
+        self.associate_us = 120000
+        self.dhcp_us = 1200000
+        self.dns_us = 30000
+        self.api = API()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.connects = 0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def up(self):
+        """Return True if an access point of the SSID is in range."""
+        return any(ap.ssid == self.ssid for ap in self.access_points)
+
+    def fails(self):
+        """Return True if the next operation fails."""
+        if self.failure_rate and \
+                self.world.rng.random() < self.failure_rate:
+            self.failures += 1
+            return True
+        return False
+
+    def transfer(self, sent, received):
+        """Let the time of a request and its response pass."""
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.world.clock.advance_us(
+            self.latency_us + self.server_us +
+            (sent + received) * 1000000 // self.bandwidth)
+
+
+class World():
+    """Everything around the board: clock, environment, buses, network."""
+
+    def __init__(self, seed=1, cpu_scale=1.0):
+        """Create an empty world, see simulator.Simulation to fill it."""
+        self.rng = random.Random(seed)
+        self.clock = Clock(cpu_scale)
+        self.environment = Environment(self.rng)
+        self.i2c = I2CBus(self)
+        self.onewire = []
+        self.dht22 = True
+        self.dht_failure_rate = 0.0
+        self.dht_checksum_rate = 0.0
+        self.network = Network(self)
+        self.rtc_memory = b''
+        self.reset_cause = PWRON_RESET
+        self.mac = bytes.fromhex('5ccf7f0a0b0c')
+        # The ESP8266 port takes no timeout for machine.WDT, True lets it
+        # take one like the ESP32 port.
+        self.wdt_timeout = False
+        self.heap_free = 28000
+        self.pins = {}
+        self.resets = []
+
+    def power_loss(self):
+        """Cut the power: the RTC and its memory start over."""
+        self.clock.set_time(0)
+        self.rtc_memory = b''
+        raise BoardReset(PWRON_RESET)
+
+    def add_bme280(self, address=0x76, channel=None, offset=0.0):
+        """Add a BME280, on a channel of the multiplexer if given."""
+        device = BME280Device(self, offset)
+        if channel is None:
+            self.i2c.devices[address] = device
+        else:
+            mux = self.i2c.devices.get(0x70) or self.i2c.add_mux()
+            mux.channels[channel][address] = device
+        return device
+
+    def add_ds18b20(self, count=1, offset=0.0):
+        """Add DS18B20 probes with consecutive serial numbers."""
+        for _ in range(count):
+            self.onewire.append(Probe(
+                self, 0x1000 + len(self.onewire), offset=offset))
+
+
+# The world of the running simulation, replaced by simulator.Simulation.
+world = World()
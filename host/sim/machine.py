@@ -0,0 +1,256 @@
+"""
+machine of the host simulator: Pin, I2C, Timer, RTC, WDT and resets.
+
+I2C transfers take their time on the bus of the world, timers fire on its
+virtual clock and the RTC memory survives a simulated deep sleep.
+"""
+import hardware
+
+from hardware import (DEEPSLEEP_RESET, HARD_RESET, PWRON_RESET,  # noqa
+                      SOFT_RESET, WDT_RESET, BoardReset)
+
+DEEPSLEEP = 4
+
+
+class Pin():
+    """A GPIO, its level is kept in the world."""
+
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, number, mode=-1, pull=-1, value=None):
+        """Set up the pin."""
+        self.number = number
+        self.mode = mode
+        if value is not None:
+            self.value(value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        """Change the mode."""
+        self.mode = mode
+        if value is not None:
+            self.value(value)
+
+    def value(self, level=None):
+        """Return or set the level."""
+        pins = hardware.world.pins
+        if level is None:
+            return pins.get(self.number, 1)
+        pins[self.number] = 1 if level else 0
+        return None
+
+    def on(self):
+        """Set the pin high."""
+        self.value(1)
+
+    def off(self):
+        """Set the pin low."""
+        self.value(0)
+
+    def __call__(self, level=None):
+        """Return or set the level."""
+        return self.value(level)
+
+    def irq(self, handler=None, trigger=IRQ_RISING):
+        """Interrupts are not simulated."""
+
+
+class I2C():
+    """The I2C bus of the world."""
+
+    def __init__(self, id=-1, scl=None, sda=None, freq=400000):
+        """Use the bus at the given frequency."""
+        self.bus = hardware.world.i2c
+        self.bus.freq = freq
+
+    def scan(self):
+        """Return the addresses of the devices which answer."""
+        # Every address is probed with a write of its address byte.
+        for address in range(0x08, 0x78):
+            self.bus.transfer(1)
+        return sorted(self.bus.visible())
+
+    def readfrom_mem(self, address, register, count):
+        """Read registers of a device."""
+        self.bus.transfer(2 + count)
+        return self.bus.device(address).read(register, count)
+
+    def readfrom_mem_into(self, address, register, buf):
+        """Read registers of a device into a buffer."""
+        self.bus.transfer(2 + len(buf))
+        buf[:] = self.bus.device(address).read(register, len(buf))
+
+    def writeto_mem(self, address, register, buf):
+        """Write registers of a device."""
+        self.bus.transfer(2 + len(buf))
+        self.bus.device(address).write(register, bytes(buf))
+
+    def writeto(self, address, buf):
+        """Write to a device, e.g. select the channels of a multiplexer."""
+        self.bus.transfer(1 + len(buf))
+        device = self.bus.device(address)
+        if isinstance(device, hardware.TCA9548A):
+            device.selected = buf[-1]
+        return len(buf)
+
+    def readfrom(self, address, count):
+        """Read from a device without a register."""
+        self.bus.transfer(1 + count)
+        self.bus.device(address)
+        return bytes(count)
+
+
+class Timer():
+    """A software timer on the virtual clock."""
+
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1):
+        """A stopped timer."""
+        self.deadline_us = None
+        self.period_us = 0
+        self.mode = self.ONE_SHOT
+        self.callback = None
+
+    def init(self, period=-1, mode=PERIODIC, callback=None, freq=-1):
+        """Start the timer with a period in ms or a frequency."""
+        clock = hardware.world.clock
+        self.deinit()
+        self.period_us = period * 1000 if period > 0 else 1000000 // freq
+        self.mode = mode
+        self.callback = callback
+        self.deadline_us = clock.now_us() + self.period_us
+        clock.timers.append(self)
+
+    def deinit(self):
+        """Stop the timer."""
+        timers = hardware.world.clock.timers
+        if self in timers:
+            timers.remove(self)
+        self.deadline_us = None
+
+    def fire(self):
+        """Call the callback, called by the clock when the timer is due."""
+        timers = hardware.world.clock.timers
+        if self.mode == self.PERIODIC:
+            self.deadline_us += self.period_us
+        else:
+            timers.remove(self)
+            self.deadline_us = None
+        if self.callback is not None:
+            self.callback(self)
+
+
+class RTC():
+    """The RTC memory of the board, kept over a deep sleep."""
+
+    def __init__(self, id=0):
+        """Use the RTC of the world."""
+        self._alarm_ms = 0
+
+    def memory(self, data=None):
+        """Return or set the RTC memory, 492 bytes on the ESP8266."""
+        if data is None:
+            return hardware.world.rtc_memory
+        if len(data) > 492:
+            raise ValueError('buffer too long')
+        hardware.world.rtc_memory = bytes(data)
+        return None
+
+    def irq(self, trigger=None, wake=None):
+        """The alarm wakes the board from a deep sleep."""
+
+    def alarm(self, alarm_id, time_ms):
+        """Wake after time_ms in the next deep sleep."""
+        self._alarm_ms = time_ms
+
+    def datetime(self, datetime=None):
+        """The calendar time is the virtual clock."""
+        import utime
+        return utime.localtime()
+
+
+class WDT():
+    """
+    The watchdog, it resets the board if it is not fed within timeout.
+
+    Like on the ESP8266 the timeout is fixed, a timeout argument raises
+    TypeError unless world.wdt_timeout is set. It is checked whenever the
+    virtual clock passes its deadline.
+    """
+
+    FIXED_MS = 3200
+
+    def __init__(self, id=0, **kwargs):
+        """Start the watchdog."""
+        timeout = self.FIXED_MS
+        if kwargs:
+            if not hardware.world.wdt_timeout or set(kwargs) != {'timeout'}:
+                raise TypeError('extra keyword arguments given')
+            timeout = kwargs['timeout']
+        self.timeout_us = timeout * 1000
+        self._timer = Timer()
+        self.feed()
+
+    def feed(self):
+        """Restart the timeout."""
+        self._timer.init(period=self.timeout_us // 1000,
+                         mode=Timer.ONE_SHOT, callback=self._expire)
+
+    def _expire(self, timer):
+        """Reset the board."""
+        raise BoardReset(WDT_RESET)
+
+
+def reset_cause():
+    """Return the cause of the last reset."""
+    return hardware.world.reset_cause
+
+
+def reset():
+    """Reset the board."""
+    raise BoardReset(HARD_RESET)
+
+
+def soft_reset():
+    """Restart the interpreter."""
+    raise BoardReset(SOFT_RESET)
+
+
+def deepsleep(time_ms=0):
+    """Sleep until the RTC alarm, the board boots again on wake."""
+    raise BoardReset(DEEPSLEEP_RESET, time_ms)
+
+
+def lightsleep(time_ms=0):
+    """Sleep on the virtual clock."""
+    hardware.world.clock.sleep_us(time_ms * 1000)
+
+
+def idle():
+    """Let a millisecond pass."""
+    hardware.world.clock.sleep_us(1000)
+
+
+def freq(value=None):
+    """Return the CPU frequency."""
+    return 80000000
+
+
+def unique_id():
+    """Return the chip ID."""
+    return hardware.world.mac[3:]
+
+
+def disable_irq():
+    """Interrupts are not simulated."""
+    return 0
+
+
+def enable_irq(state=0):
+    """Interrupts are not simulated."""
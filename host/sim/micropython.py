@@ -0,0 +1,43 @@
+"""micropython of the host simulator, the decorators do nothing."""
+
+
+def const(value):
+    """Return the value."""
+    return value
+
+
+def native(function):
+    """Return the function, it runs as bytecode on the host."""
+    return function
+
+
+viper = native
+
+
+def opt_level(level=None):
+    """Return 0, there is no optimisation level on the host."""
+    return 0
+
+
+def alloc_emergency_exception_buf(size):
+    """Do nothing."""
+
+
+def schedule(function, arg):
+    """Call the function at once."""
+    function(arg)
+
+
+def mem_info(verbose=False):
+    """Print the modelled heap."""
+    import gc
+    print('mem: free', gc.mem_free())
+
+
+def heap_lock():
+    """Do nothing, allocations are not locked on the host."""
+
+
+def heap_unlock():
+    """Do nothing."""
+    return 0
@@ -0,0 +1,132 @@
+"""
+network of the host simulator, a WLAN station.
+
+Connecting takes the time of a scan (unless a BSSID is given), the
+association and DHCP (unless a static IP is configured) on the virtual
+clock of the world.
+"""
+import hardware
+
+STA_IF = 0
+AP_IF = 1
+
+# status codes of the ESP8266 port
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = 2
+STAT_NO_AP_FOUND = 3
+STAT_CONNECT_FAIL = 4
+STAT_GOT_IP = 5
+
+_interfaces = {}
+
+
+def WLAN(interface=STA_IF):
+    """Return the interface, the same object for every call."""
+    key = (id(hardware.world), interface)
+    if key not in _interfaces:
+        _interfaces[key] = _WLAN(interface)
+    return _interfaces[key]
+
+
+class _WLAN():
+    """A WLAN interface."""
+
+    DHCP_IP = ('192.168.178.42', '255.255.255.0', '192.168.178.1',
+               '192.168.178.1')
+
+    def __init__(self, interface):
+        """An inactive interface."""
+        self.interface = interface
+        self._active = False
+        self._static = None
+        self._ip = self.DHCP_IP
+        self._ready_us = None
+        self._failure = None
+        self._ap = None
+
+    def active(self, is_active=None):
+        """Return or set the state of the interface."""
+        if is_active is None:
+            return self._active
+        self._active = bool(is_active)
+        if not is_active:
+            self.disconnect()
+        return None
+
+    def scan(self):
+        """Scan for access points, it takes a few seconds."""
+        net = hardware.world.network
+        hardware.world.clock.advance_us(net.scan_us)
+        return [(ap.ssid.encode(), ap.bssid, ap.channel, ap.rssi, 3, False)
+                for ap in net.access_points]
+
+    def connect(self, ssid=None, password=None, bssid=None):
+        """Start to connect, isconnected() tells when it is done."""
+        net = hardware.world.network
+        clock = hardware.world.clock
+        cost = net.associate_us
+        candidates = [ap for ap in net.access_points if ap.ssid == ssid]
+        if bssid is None:
+            cost += net.scan_us
+        else:
+            candidates = [ap for ap in candidates if ap.bssid == bssid]
+        self._ap = max(candidates, key=lambda ap: ap.rssi, default=None)
+        self._failure = None
+        if self._ap is None:
+            self._failure = STAT_NO_AP_FOUND
+        elif password != net.password:
+            self._failure = STAT_WRONG_PASSWORD
+        elif net.fails():
+            self._failure = STAT_CONNECT_FAIL
+        if self._static is None:
+            cost += net.dhcp_us
+            self._ip = self.DHCP_IP
+        self._ready_us = clock.now_us() + cost
+
+    def disconnect(self):
+        """Leave the access point."""
+        self._ready_us = None
+        self._ap = None
+
+    def isconnected(self):
+        """Return True once the connection has an IP address."""
+        return self.status() == STAT_GOT_IP
+
+    def status(self, param=None):
+        """Return the connection state or the signal with 'rssi'."""
+        if param == 'rssi':
+            return self._ap.rssi if self._ap else 0
+        if param is not None:
+            raise ValueError('unknown status param')
+        if self._ready_us is None:
+            return STAT_IDLE
+        if hardware.world.clock.now_us() < self._ready_us:
+            return STAT_CONNECTING
+        if self._failure is not None:
+            return self._failure
+        if not hardware.world.network.up:
+            return STAT_NO_AP_FOUND
+        return STAT_GOT_IP
+
+    def ifconfig(self, config=None):
+        """Return or set a static IP configuration."""
+        if config is None:
+            return self._static or self._ip
+        self._static = tuple(config)
+        return None
+
+    def ipconfig(self, dhcp4=None):
+        """Switch back to DHCP."""
+        if dhcp4:
+            self._static = None
+
+    def config(self, name=None, **settings):
+        """Return a setting, e.g. the MAC address."""
+        if name == 'mac':
+            return hardware.world.mac
+        if name == 'essid':
+            return self._ap.ssid if self._ap else ''
+        if name == 'channel':
+            return self._ap.channel if self._ap else 1
+        return None
@@ -0,0 +1,26 @@
+"""
+ntptime of the host simulator, setting the RTC to the time of the world.
+
+A request takes the round trip of the network and fails like the API
+does, with the failure rate of the network or without WiFi.
+"""
+import hardware
+import usocket
+
+host = 'pool.ntp.org'
+timeout = 1
+
+
+def time():
+    """Return the real time in seconds since 2000-01-01."""
+    world = hardware.world
+    usocket.getaddrinfo(host, 123)
+    world.clock.advance_us(world.network.latency_us)
+    if world.network.fails():
+        raise OSError(110, 'ETIMEDOUT')
+    return world.clock.real_time()
+
+
+def settime():
+    """Set the RTC to the real time."""
+    hardware.world.clock.set_time(time())
@@ -0,0 +1,10 @@
+"""ubinascii of the host simulator."""
+from binascii import a2b_base64, b2a_base64, crc32, unhexlify  # noqa
+from binascii import hexlify as _hexlify
+
+
+def hexlify(data, sep=None):
+    """Return the data as hex, MicroPython takes the separator as str."""
+    if sep is None:
+        return _hexlify(data)
+    return _hexlify(data, sep)
@@ -0,0 +1,2 @@
+"""ujson of the host simulator."""
+from json import dump, dumps, load, loads  # noqa: F401
@@ -0,0 +1,12 @@
+"""
+uos of the host simulator.
+
+The flash of the board is the working directory, simulator.Simulation
+changes into a directory of its own.
+"""
+from os import listdir, mkdir, remove, rename, rmdir, stat  # noqa: F401
+
+
+def uname():
+    """Return the names of the simulated board."""
+    return ('esp8266', 'esp8266', '1.22.0', 'host simulator', 'ESP module')
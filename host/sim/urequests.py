@@ -0,0 +1,81 @@
+"""urequests of the host simulator, one connection per request."""
+import usocket
+
+
+class Response():
+    """A response of the API."""
+
+    def __init__(self, status_code, headers, content):
+        """Store the status code, headers and body."""
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        """Return the body as a string."""
+        return self.content.decode()
+
+    def json(self):
+        """Return the parsed JSON body."""
+        import ujson
+        return ujson.loads(self.content)
+
+    def close(self):
+        """Nothing to close, the body is read."""
+
+
+def request(method, url, data=None, json=None, headers=None):
+    """Send a request over a new connection and read the response."""
+    if headers is None:
+        headers = {}
+    if json is not None:
+        import ujson
+        data = ujson.dumps(json)
+        headers['Content-Type'] = 'application/json'
+    if isinstance(data, str):
+        data = data.encode()
+    _, _, host, path = (url.split('/', 3) + [''])[:4]
+    port = 80
+    if ':' in host:
+        host, port = host.split(':', 1)
+        port = int(port)
+    address = usocket.getaddrinfo(host, port)[0][-1]
+    sock = usocket.socket()
+    try:
+        sock.connect(address)
+        head = '{} /{} HTTP/1.0\r\nHost: {}\r\n'.format(method, path, host)
+        for key in headers:
+            head += '{}: {}\r\n'.format(key, headers[key])
+        if data is not None:
+            head += 'Content-Length: {}\r\n'.format(len(data))
+        sock.write(head.encode() + b'\r\n' + (data or b''))
+        line = sock.readline()
+        if not line:
+            raise OSError(104, 'ECONNRESET')
+        status = int(line.split(None, 2)[1])
+        response_headers = {}
+        while True:
+            line = sock.readline()
+            if not line or line == b'\r\n':
+                break
+            key, _, value = line.decode().partition(':')
+            response_headers[key.strip()] = value.strip()
+        return Response(status, response_headers, sock.read())
+    finally:
+        sock.close()
+
+
+def get(url, **kw):
+    """Send a GET request."""
+    return request('GET', url, **kw)
+
+
+def post(url, **kw):
+    """Send a POST request."""
+    return request('POST', url, **kw)
+
+
+def put(url, **kw):
+    """Send a PUT request."""
+    return request('PUT', url, **kw)
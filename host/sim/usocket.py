@@ -0,0 +1,159 @@
+"""
+usocket of the host simulator, TCP connections to the API of the world.
+
+The bytes written to a socket are parsed as HTTP requests and answered by
+hardware.API. Every connection and request takes its time on the virtual
+clock, fails with the failure rate of the network and is counted. A kept
+connection is closed by the server after its keepalive time.
+"""
+import hardware
+import network
+
+AF_INET = 2
+SOCK_STREAM = 1
+SOCK_DGRAM = 2
+IPPROTO_TCP = 6
+SOL_SOCKET = 1
+SO_REUSEADDR = 4
+
+_REASONS = {200: 'OK', 201: 'Created', 204: 'No Content',
+            304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+            500: 'Internal Server Error'}
+
+
+def _check_link():
+    """Raise OSError without a WiFi connection."""
+    if not network.WLAN(network.STA_IF).isconnected():
+        raise OSError(113, 'EHOSTUNREACH')
+
+
+def getaddrinfo(host, port, af=0, type=0, proto=0, flags=0):
+    """Resolve a host, every host is the API."""
+    _check_link()
+    hardware.world.clock.advance_us(hardware.world.network.dns_us)
+    return [(AF_INET, SOCK_STREAM, IPPROTO_TCP, '', ('10.0.0.2', port))]
+
+
+class socket():
+    """A TCP connection to the API."""
+
+    def __init__(self, af=AF_INET, type=SOCK_STREAM, proto=IPPROTO_TCP):
+        """An unconnected socket."""
+        self._in = b''
+        self._out = b''
+        self._connected = False
+        self._closed_by_server = False
+        self._reset = False
+        self._used_us = 0
+
+    def settimeout(self, timeout):
+        """Timeouts are not simulated, failures are."""
+
+    def setblocking(self, flag):
+        """Sockets always block."""
+
+    def setsockopt(self, level, option, value):
+        """Options are ignored."""
+
+    def connect(self, address):
+        """Connect, one round trip on the virtual clock."""
+        _check_link()
+        net = hardware.world.network
+        hardware.world.clock.advance_us(net.latency_us)
+        if net.fails():
+            raise OSError(110, 'ETIMEDOUT')
+        net.connects += 1
+        self._connected = True
+        self._used_us = hardware.world.clock.now_us()
+
+    def write(self, data):
+        """Send data, complete requests are answered at once."""
+        if not self._connected:
+            raise OSError(107, 'ENOTCONN')
+        self._in += bytes(data)
+        while self._handle():
+            pass
+        return len(data)
+
+    send = write
+    sendall = write
+
+    def _handle(self):
+        """Answer the next complete request, return False if there is none."""
+        end = self._in.find(b'\r\n\r\n')
+        if end < 0:
+            return False
+        head = self._in[:end].decode().split('\r\n')
+        headers = {}
+        for line in head[1:]:
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if len(self._in) < end + 4 + length:
+            return False
+        body = self._in[end + 4:end + 4 + length]
+        sent = end + 4 + length
+        self._in = self._in[sent:]
+
+        world = hardware.world
+        net = world.network
+        now = world.clock.now_us()
+        if now - self._used_us > net.keepalive_us:
+            # The server closed the idle connection, the request is lost.
+            net.bytes_sent += sent
+            self._closed_by_server = True
+            return True
+        if net.fails():
+            net.bytes_sent += sent
+            self._reset = True
+            return True
+        method, path = head[0].split(' ')[:2]
+        status, response_headers, content = net.api.handle(
+            method, path, headers, body)
+        response = 'HTTP/1.1 {} {}\r\n'.format(
+            status, _REASONS.get(status, 'Unknown'))
+        for key in response_headers:
+            response += '{}: {}\r\n'.format(key, response_headers[key])
+        if status not in (204, 304):
+            response += 'Content-Length: {}\r\n'.format(len(content))
+        response = response.encode() + b'\r\n' + content
+        net.requests += 1
+        net.transfer(sent, len(response))
+        self._out += response
+        self._used_us = world.clock.now_us()
+        return True
+
+    def _check(self):
+        """Raise OSError if the connection was reset."""
+        if self._reset:
+            raise OSError(104, 'ECONNRESET')
+
+    def readline(self):
+        """Read a line of the response."""
+        self._check()
+        end = self._out.find(b'\n')
+        if end < 0:
+            line, self._out = self._out, b''
+        else:
+            line, self._out = self._out[:end + 1], self._out[end + 1:]
+        return line
+
+    def read(self, size=-1):
+        """Read up to size bytes, all with -1."""
+        self._check()
+        if size < 0:
+            size = len(self._out)
+        data, self._out = self._out[:size], self._out[size:]
+        return data
+
+    recv = read
+
+    def readinto(self, buf, size=None):
+        """Read into a buffer."""
+        data = self.read(len(buf) if size is None else size)
+        buf[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        """Close the connection."""
+        self._connected = False
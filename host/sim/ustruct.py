@@ -0,0 +1,2 @@
+"""ustruct of the host simulator."""
+from struct import calcsize, pack, pack_into, unpack, unpack_from  # noqa
@@ -0,0 +1,57 @@
+"""utime of the host simulator, on the virtual clock of the world."""
+import hardware
+
+_PERIOD = 1 << 30
+
+
+def time():
+    """Return the seconds since 2000-01-01."""
+    return hardware.world.clock.time()
+
+
+def localtime(secs=None):
+    """Return the date and time like the board."""
+    import time as _time
+    if secs is None:
+        secs = time()
+    return _time.gmtime(secs + 946684800)[:8]
+
+
+def sleep(seconds):
+    """Sleep on the virtual clock."""
+    hardware.world.clock.sleep_us(int(seconds * 1000000))
+
+
+def sleep_ms(duration):
+    """Sleep on the virtual clock."""
+    hardware.world.clock.sleep_us(duration * 1000)
+
+
+def sleep_us(duration):
+    """Sleep on the virtual clock."""
+    hardware.world.clock.sleep_us(duration)
+
+
+def ticks_us():
+    """Return the wrapping microseconds of the board."""
+    return hardware.world.clock.ticks_us() % _PERIOD
+
+
+def ticks_ms():
+    """Return the wrapping milliseconds of the board."""
+    return hardware.world.clock.ticks_us() // 1000 % _PERIOD
+
+
+def ticks_cpu():
+    """Return the wrapping microseconds, the board has no finer clock."""
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    """Add a delta to ticks."""
+    return (ticks + delta) % _PERIOD
+
+
+def ticks_diff(end, start):
+    """Return the signed difference of two ticks."""
+    return (end - start + _PERIOD // 2) % _PERIOD - _PERIOD // 2
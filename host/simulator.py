@@ -0,0 +1,253 @@
+"""
+Run the station code on the host, on simulated hardware.
+
+The fake MicroPython modules in host/sim (machine, network, dht, _onewire,
+utime, usocket, urequests and friends) replace the ones of the board. They
+share a world of simulated devices, WiFi and API on a virtual clock, see
+host/sim/hardware.py. Sensor conversions, bus transfers, network latency
+and sleeps move the virtual clock, so an hour of a station takes seconds.
+
+A board runs like boot.py: WiFi is connected and the main() of a
+tempstation variant is run by supervisor.run. A deep sleep,
+machine.reset() or the watchdog boots the board again with the reset
+cause set and the RTC memory kept. The flash of the board is a temporary
+directory.
+
+    python host/simulator.py tempstation_BME280_LED --minutes 30
+
+See host/bench_station.py for the benchmarks built on it.
+"""
+import argparse
+import ast
+import contextlib
+import gc
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HOST)
+SIM = os.path.join(HOST, 'sim')
+
+API_URL = 'http://api.tempstation.sim/api'
+
+DEFAULT_CREDENTIALS = {
+    'ssid': 'tempstation',
+    'password': 'secret',
+    'get_controller_data': API_URL + '/controller/{hardware_id}',
+    'post_data': API_URL + '/stations/{station_ID}/data',
+    'post_batch_data': API_URL + '/stations/{station_ID}/batch',
+    # Summaries reset the phases, the simulation collects them itself.
+    'metrics_interval': 0,
+}
+
+# The devices each variant needs in the world.
+VARIANTS = {
+    'tempstation_DHT22': {},
+    'tempstation_DHT22_LED': {},
+    'tempstation_BME280_LED': {'bme280': 1},
+    'tempstation_DS18B20': {'ds18b20': 4},
+}
+
+# Time from a reset to the first line of boot.py.
+BOOT_US = 300000
+
+
+def install():
+    """Put the fake modules in front of the station code."""
+    for path in (ROOT, SIM):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+    import utime
+    # bme280.py uses the time module of MicroPython.
+    for name in ('sleep_ms', 'sleep_us', 'ticks_ms', 'ticks_us',
+                 'ticks_add', 'ticks_diff', 'ticks_cpu'):
+        setattr(time, name, getattr(utime, name))
+    import hardware
+    gc.mem_free = lambda: hardware.world.heap_free
+    gc.mem_alloc = lambda: 36000 - hardware.world.heap_free
+
+
+def _station_modules():
+    """Return the names of the imported modules of the station code."""
+    names = ['credentials']
+    for name, module in sys.modules.items():
+        path = getattr(module, '__file__', None) or ''
+        if os.path.dirname(os.path.abspath(path)) == ROOT:
+            names.append(name)
+    return names
+
+
+class Simulation():
+    """
+    A board in a simulated world.
+
+    credentials are the settings of credentials.py, the defaults reach the
+    API of the world. The world may be changed before and between runs,
+    e.g. sim.world.network.failure_rate = 0.1. The output of the station
+    is kept in log unless quiet is False.
+    """
+
+    def __init__(self, credentials=None, seed=1, cpu_scale=1.0,
+                 quiet=True, devices=None):
+        """Create a world with the devices, see VARIANTS."""
+        install()
+        import hardware
+        self.hardware = hardware
+        self.world = hardware.World(seed, cpu_scale)
+        hardware.world = self.world
+        self.settings = dict(DEFAULT_CREDENTIALS)
+        self.settings.update(credentials or {})
+        devices = devices or {}
+        bme280 = devices.get('bme280', 0)
+        for i in range(bme280):
+            # More than two sensors need the multiplexer.
+            channel = i // 2 if bme280 > 2 else None
+            self.world.add_bme280(0x76 + i % 2, channel)
+        if devices.get('ds18b20'):
+            self.world.add_ds18b20(devices['ds18b20'])
+        self.flash = tempfile.mkdtemp(prefix='tempstation-flash-')
+        self.quiet = quiet
+        self.log = io.StringIO()
+        self.boots = 0
+        self.phases = {}
+        self.counters = {}
+
+    def close(self):
+        """Remove the flash directory."""
+        shutil.rmtree(self.flash, ignore_errors=True)
+
+    def run(self, module, seconds):
+        """Run the variant module for the simulated seconds."""
+        hardware = self.hardware
+        hardware.world = self.world
+        clock = self.world.clock
+        clock.deadline_us = clock.now_us() + int(seconds * 1000000)
+        cwd = os.getcwd()
+        os.chdir(self.flash)
+        output = self.log if self.quiet else sys.stdout
+        try:
+            with contextlib.redirect_stdout(output):
+                while True:
+                    try:
+                        self._boot(module)
+                        return
+                    except hardware.BoardReset as reset:
+                        self._harvest()
+                        self.world.resets.append(reset.cause)
+                        self.world.reset_cause = reset.cause
+                        # Timers and the watchdog stop with the board.
+                        clock.timers = []
+                        clock.sleep_us(reset.sleep_ms * 1000 + BOOT_US)
+        except hardware.SimulationEnd:
+            self._harvest()
+        finally:
+            os.chdir(cwd)
+            clock.deadline_us = None
+
+    def prepare(self):
+        """
+        Forget the imported station code and set up the credentials.
+
+        Called on every boot, and before using station modules directly,
+        e.g. in a benchmark.
+        """
+        import network
+        self.hardware.world = self.world
+        for name in _station_modules():
+            sys.modules.pop(name, None)
+        # The WiFi connection does not survive a reset.
+        network._interfaces.clear()
+        credentials = types.ModuleType('credentials')
+        credentials.__dict__.update(self.settings)
+        sys.modules['credentials'] = credentials
+
+    def _boot(self, module):
+        """Boot the board with fresh modules, like boot.py."""
+        self.prepare()
+        self.world.clock.boot()
+        self.boots += 1
+        import supervisor
+        from wifi import wifi_stat
+        wifi_stat.connect()
+        supervisor.run(__import__(module).main)
+
+    def _harvest(self):
+        """Add the metrics of the ending boot to the totals."""
+        metrics = sys.modules.get('metrics')
+        if metrics is None:
+            return
+        for i, name in enumerate(metrics.PHASES):
+            if not metrics.count[i]:
+                continue
+            count, total, high = self.phases.get(name, (0, 0, 0))
+            self.phases[name] = (count + metrics.count[i],
+                                 total + metrics.total_us[i],
+                                 max(high, metrics.max_us[i]))
+        for i, name in enumerate(metrics.COUNTERS):
+            self.counters[name] = self.counters.get(name, 0) + \
+                metrics.counters[i]
+        # Harvest a boot only once.
+        del sys.modules['metrics']
+
+    def report(self):
+        """Return a summary of the run as a dict."""
+        net = self.world.network
+        phases = {}
+        for name, (count, total, high) in self.phases.items():
+            phases[name] = {'count': count, 'mean_us': total // count,
+                            'max_us': high}
+        return {
+            'boots': self.boots,
+            'simulated_s': self.world.clock.now_us() // 1000000,
+            'readings': net.api.readings,
+            'requests': net.requests,
+            'connects': net.connects,
+            'bytes_sent': net.bytes_sent,
+            'bytes_received': net.bytes_received,
+            'network_failures': net.failures,
+            'phases': phases,
+            'counters': self.counters,
+        }
+
+
+def main():
+    """Run a variant and print the summary."""
+    import json
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('variant', choices=sorted(VARIANTS))
+    parser.add_argument('--minutes', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='a credentials setting, VALUE is a Python '
+                        'literal')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the output of the station')
+    args = parser.parse_args()
+    settings = {}
+    for setting in args.set:
+        name, _, value = setting.partition('=')
+        try:
+            settings[name] = ast.literal_eval(value)
+        except (SyntaxError, ValueError):
+            parser.error('--set {}: VALUE is no Python literal'.format(
+                setting))
+    sim = Simulation(settings, args.seed, quiet=not args.verbose,
+                     devices=VARIANTS[args.variant])
+    sim.world.network.failure_rate = args.failure_rate
+    try:
+        sim.run(args.variant, args.minutes * 60)
+    finally:
+        sim.close()
+    print(json.dumps(sim.report(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
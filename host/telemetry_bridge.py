@@ -0,0 +1,162 @@
+"""
+Reference decoder of telemetry frames and a relay to the REST API.
+
+The relay runs on a host next to the stations. It accepts the binary
+frames of telemetry.py as POST requests and forwards their readings as
+JSON batches to the Tempstation API, so stations can send compact frames
+while the API stays unchanged:
+
+    python host/telemetry_bridge.py --port 8080 \\
+        --batch-url http://api.example/stations/{station_ID}/batch
+
+Stations point credentials.post_telemetry to http://<relay>:8080/.
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import telemetry  # noqa: E402
+
+from uploadformat import EPOCH_OFFSET, format_tag  # noqa: E402
+
+
+def _varint(frame, pos):
+    """Read an unsigned varint, return it and the position after it."""
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(frame):
+            raise ValueError('Truncated frame')
+        byte = frame[pos]
+        value |= (byte & 0x7F) << shift
+        pos += 1
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _zigzag(frame, pos):
+    """Read a signed varint, return it and the position after it."""
+    value, pos = _varint(frame, pos)
+    if value & 1:
+        return -((value + 1) >> 1), pos
+    return value >> 1, pos
+
+
+def decode(frame):
+    """
+    Decode a frame into the station ID and its readings.
+
+    Readings are dicts like the JSON batch of the station, with the value
+    in the unit of the API and a Unix timestamp. ValueError is raised for
+    damaged or unknown frames.
+    """
+    if len(frame) < 2 + telemetry.CRC_SIZE:
+        raise ValueError('Truncated frame')
+    end = len(frame) - telemetry.CRC_SIZE
+    crc = frame[end] | frame[end + 1] << 8
+    if crc != telemetry.crc16(frame, end):
+        raise ValueError('CRC mismatch')
+    if frame[0] != telemetry.MAGIC:
+        raise ValueError('Not a telemetry frame')
+    if frame[1] != telemetry.VERSION:
+        raise ValueError('Unsupported frame version {}'.format(frame[1]))
+    station_id, pos = _varint(frame, 2)
+    if pos + 4 > end:
+        raise ValueError('Truncated frame')
+    timestamp = int.from_bytes(frame[pos:pos + 4], 'little')
+    count, pos = _varint(frame, pos + 4)
+
+    readings = []
+    previous = {}
+    for _ in range(count):
+        unit_id, pos = _varint(frame, pos)
+        tag, pos = _varint(frame, pos)
+        delta, pos = _zigzag(frame, pos)
+        timestamp += delta
+        delta, pos = _zigzag(frame, pos)
+        value = previous.get((unit_id, tag), 0) + delta
+        previous[(unit_id, tag)] = value
+        reading = {
+            'value': round(value / 100, 2),
+            'unitId': unit_id,
+            'timestamp': timestamp + EPOCH_OFFSET,
+        }
+        if tag:
+            reading['sensor'] = format_tag(tag)
+        readings.append(reading)
+    if pos != end:
+        raise ValueError('Trailing bytes in frame')
+    return station_id, readings
+
+
+def forward(batch_url, station_id, readings, timeout=10):
+    """Post decoded readings to the batch endpoint, return the status."""
+    request = urllib.request.Request(
+        batch_url.format(station_ID=station_id),
+        data=json.dumps(readings).encode(),
+        headers={'Content-Type': 'application/json'},
+        method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            return resp.status
+    except urllib.error.HTTPError as err:
+        return err.code
+
+
+class RelayHandler(BaseHTTPRequestHandler):
+    """Decode posted frames and forward them to the API."""
+
+    batch_url = None
+
+    def do_POST(self):
+        """Relay one frame."""
+        length = int(self.headers.get('Content-Length', 0))
+        frame = self.rfile.read(length)
+        try:
+            station_id, readings = decode(frame)
+        except ValueError as err:
+            print("Rejected frame:", err)
+            self._reply(400)
+            return
+        try:
+            status = forward(self.batch_url, station_id, readings)
+        except OSError as err:
+            print("API unreachable:", err)
+            status = 503
+        print("Relayed", len(readings), "readings of station", station_id,
+              "in", length, "bytes:", status)
+        # The station keeps the readings unless the API took them.
+        self._reply(204 if 200 <= status < 300 else 502)
+
+    def _reply(self, status):
+        """Send an empty response."""
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def main():
+    """Run the relay."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--batch-url', required=True,
+                        help='batch endpoint with {station_ID}')
+    args = parser.parse_args()
+    RelayHandler.batch_url = args.batch_url
+    server = ThreadingHTTPServer((args.host, args.port), RelayHandler)
+    print("Relaying telemetry frames on port", args.port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Host tests of the station code, on the fake modules of the simulator.
+
+    python -m pytest host/tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import simulator  # noqa: E402
+
+simulator.install()
+
+import hardware  # noqa: E402
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def world():
+    """A world with the probes added by the test."""
+    hardware.world = hardware.World()
+    return hardware.world
+
+
+@pytest.fixture
+def add_probes(world):
+    """
+    Return a function adding probes with the serial numbers to the world,
+    alarmed if in alarms, which returns the sorted ROMs of all probes.
+    """
+    def add(serials, alarms=()):
+        for serial in serials:
+            world.onewire.append(hardware.Probe(world, serial,
+                                                alarm=serial in alarms))
+        return sorted(probe.rom for probe in world.onewire)
+    return add
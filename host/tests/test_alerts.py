@@ -0,0 +1,61 @@
+"""The alerts of host/alerts.py and their long-poll in the ingest server."""
+import asyncio
+import json
+
+from alerts import FleetRules
+from ingest_server import IngestServer, Store
+
+
+async def request(port, method, path, body=b''):
+    """Return the status and JSON body of a request to the server."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('{} {} HTTP/1.1\r\nContent-Length: {}\r\n'
+                 'Connection: close\r\n\r\n'.format(
+                     method, path, len(body)).encode() + body)
+    head = await reader.readuntil(b'\r\n\r\n')
+    content = await reader.read()
+    writer.close()
+    status = int(head.split(b' ', 2)[1])
+    return status, json.loads(content) if content else None
+
+
+def test_a_slow_subscriber_loses_its_oldest_alerts():
+    async def check():
+        rules = FleetRules({1: (10, 30)})
+        queue = rules.subscribe(size=2)
+        alerts = rules.evaluate([(12, 1, '', 100 + i, value) for i, value
+                                 in enumerate((3500, 2000, 500))])
+        rules.publish(alerts)
+        assert rules.dropped == 1
+        assert [queue.get_nowait()['id'] for _ in range(2)] == [2, 3]
+        rules.unsubscribe(queue)
+        assert rules.since(1) == alerts[1:]
+
+    asyncio.run(check())
+
+
+def test_a_waiting_request_gets_the_next_alert(tmp_path):
+    async def check():
+        server = IngestServer(Store(str(tmp_path / 'readings.sqlite')))
+        await server.start()
+        try:
+            waiting = asyncio.ensure_future(request(
+                server.port, 'GET', '/api/alerts?since=0&wait=10'))
+            await asyncio.sleep(0.1)
+            assert not waiting.done()
+            batch = json.dumps([{'value': 35.5, 'unitId': 1,
+                                 'timestamp': 1700000000}]).encode()
+            status, _ = await request(server.port, 'POST',
+                                      '/api/stations/12/batch', batch)
+            assert status == 201
+            status, alerts = await asyncio.wait_for(waiting, 5)
+            assert status == 200
+            assert [alert['raised'] for alert in alerts] == [['high']]
+            assert server.rules.subscribers == []
+            status, alerts = await request(
+                server.port, 'GET', '/api/alerts?since=1&wait=0.1')
+            assert (status, alerts) == (200, [])
+        finally:
+            await server.stop()
+
+    asyncio.run(check())
@@ -0,0 +1,70 @@
+"""bme280_batch against the compensation of bme280_int on the station."""
+import random
+
+from array import array
+
+import pytest
+
+from bme280_int import Compensator
+from hardware import CALIBRATION
+from test_bme280_int import (HUM_MAX, RAW_MAX, TYPES, long_path,
+                             random_calibration)
+
+np = pytest.importorskip('numpy')
+bme280_batch = pytest.importorskip('bme280_batch')
+
+
+def station(calibration, raws):
+    """Return the readings of the station, long integers on a fallback."""
+    compensator = Compensator(calibration)
+    driver = long_path(calibration)
+    result = array('i', (0, 0, 0))
+    expected = []
+    for raw_temp, raw_press, raw_hum in raws:
+        if compensator.compensate(raw_temp, raw_press, raw_hum, result):
+            expected.append(tuple(result))
+        else:
+            expected.append(driver._compensate(raw_temp, raw_press, raw_hum))
+    return expected
+
+
+def check(calibration, raws):
+    """Assert bme280_batch gives the readings of the station."""
+    columns = np.array(raws, np.int64).T
+    # A small chunk so that the samples span several chunks.
+    result = bme280_batch.compensate(calibration, *columns, chunk=256)
+    expected = station(calibration, raws)
+    for i, raw in enumerate(raws):
+        assert tuple(int(value) for value in result[i]) == expected[i], raw
+
+
+def random_raws(rng, count):
+    """Return raw readings over the whole raw ranges and their ends."""
+    raws = [(rng.randint(0, RAW_MAX), rng.randint(0, RAW_MAX),
+             rng.randint(0, HUM_MAX)) for _ in range(count)]
+    return raws + [(0, 0, 0), (1, 1, 1), (RAW_MAX, RAW_MAX, HUM_MAX),
+                   (1 << 19, 1 << 19, 1 << 15)]
+
+
+def test_station_calibration():
+    """The calibration of the simulated sensor."""
+    rng = random.Random(1)
+    check(CALIBRATION, random_raws(rng, 2000))
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_random_calibrations(seed):
+    """Calibrations over the whole range of their types."""
+    rng = random.Random(seed)
+    check(random_calibration(rng), random_raws(rng, 1000))
+
+
+@pytest.mark.parametrize('pick', (min, max))
+def test_extreme_calibrations(pick):
+    """The ends of every calibration type."""
+    calibration = []
+    for bits, signed in TYPES:
+        low = -(1 << bits - 1) if signed else 0
+        high = (1 << bits - 1) - 1 if signed else (1 << bits) - 1
+        calibration.append(pick(low, high))
+    check(tuple(calibration), random_raws(random.Random(2), 1000))
@@ -0,0 +1,115 @@
+"""bme280_int against the long integer compensation of bme280.py."""
+import random
+
+from array import array
+
+import pytest
+
+from bme280 import BME280
+from bme280_int import Compensator
+from hardware import CALIBRATION
+
+# Raw temperature and pressure have 20 bits, raw humidity 16 bits.
+RAW_MAX = (1 << 20) - 1
+HUM_MAX = (1 << 16) - 1
+# (bits, signed) of dig_T1 to dig_H6
+TYPES = ((16, False), (16, True), (16, True), (16, False)) + \
+    ((16, True),) * 8 + ((8, False), (16, True), (8, False), (12, True),
+                         (12, True), (8, True))
+
+
+def random_calibration(rng):
+    """Return a calibration with every value drawn over its type."""
+    values = []
+    for bits, signed in TYPES:
+        low = -(1 << bits - 1) if signed else 0
+        high = (1 << bits - 1) - 1 if signed else (1 << bits) - 1
+        values.append(rng.randint(low, high))
+    return tuple(values)
+
+
+def raw_values(step, maximum):
+    """Return the raw values every step, with both ends of the range."""
+    return sorted(set(range(0, maximum + 1, step)) | {0, 1, maximum})
+
+
+def long_path(calibration):
+    """Return a driver which compensates with long integers only."""
+    driver = BME280.__new__(BME280)
+    driver.dig_T1, driver.dig_T2, driver.dig_T3, driver.dig_P1, \
+        driver.dig_P2, driver.dig_P3, driver.dig_P4, driver.dig_P5, \
+        driver.dig_P6, driver.dig_P7, driver.dig_P8, driver.dig_P9, \
+        driver.dig_H1, driver.dig_H2, driver.dig_H3, driver.dig_H4, \
+        driver.dig_H5, driver.dig_H6 = calibration
+    return driver
+
+
+def compare(calibration, raws):
+    """Assert equal results, return the number of long fallbacks."""
+    driver = long_path(calibration)
+    compensator = Compensator(calibration)
+    result = array('i', (0, 0, 0))
+    fallbacks = 0
+    for raw_temp, raw_press, raw_hum in raws:
+        expected = driver._compensate(raw_temp, raw_press, raw_hum)
+        if not compensator.compensate(raw_temp, raw_press, raw_hum, result):
+            fallbacks += 1
+            continue
+        assert tuple(result) == expected, (raw_temp, raw_press, raw_hum)
+        assert compensator.t_fine == driver.t_fine
+    return fallbacks
+
+
+def grid(temps, pressures, humidities):
+    """Return every raw temperature with strided pressures and humidity."""
+    raws = []
+    for i, raw_temp in enumerate(temps):
+        for j in range(0, len(pressures), 7):
+            raw_press = pressures[(i + j) % len(pressures)]
+            raws.append((raw_temp, raw_press,
+                         humidities[(i * 7 + j) % len(humidities)]))
+    return raws
+
+
+def test_full_raw_range():
+    """Every raw temperature and pressure step of a real sensor."""
+    raws = grid(raw_values(1 << 12, RAW_MAX), raw_values(1 << 12, RAW_MAX),
+                raw_values(1 << 8, HUM_MAX))
+    compare(CALIBRATION, raws)
+
+
+def test_working_sensor_never_falls_back():
+    """Readings of -40 to 85 degC and 300 to 1100 hPa stay small."""
+    rng = random.Random(1)
+    raws = []
+    for _ in range(2000):
+        # The raw ranges of these values for the calibration above.
+        raws.append((rng.randint(380000, 660000),
+                     rng.randint(190000, 580000),
+                     rng.randint(0, HUM_MAX)))
+    assert compare(CALIBRATION, raws) == 0
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_random_calibrations(seed):
+    """Calibrations over the whole range of their types."""
+    rng = random.Random(seed)
+    calibration = random_calibration(rng)
+    raws = [(rng.randint(0, RAW_MAX), rng.randint(0, RAW_MAX),
+             rng.randint(0, HUM_MAX)) for _ in range(300)]
+    raws += grid(raw_values(1 << 14, RAW_MAX), raw_values(1 << 14, RAW_MAX),
+                 raw_values(1 << 12, HUM_MAX))
+    compare(calibration, raws)
+
+
+def test_extreme_calibrations():
+    """The ends of every calibration type."""
+    for pick in (min, max):
+        calibration = []
+        for bits, signed in TYPES:
+            low = -(1 << bits - 1) if signed else 0
+            high = (1 << bits - 1) - 1 if signed else (1 << bits) - 1
+            calibration.append(pick(low, high))
+        compare(tuple(calibration), grid(
+            raw_values(1 << 14, RAW_MAX), raw_values(1 << 14, RAW_MAX),
+            raw_values(1 << 12, HUM_MAX)))
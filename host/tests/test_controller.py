@@ -0,0 +1,45 @@
+"""Revalidation of the controller data of controller.py."""
+import copy
+import json
+import os
+
+from simulator import Simulation
+
+VARIANT = 'tempstation_DHT22'
+
+
+def serve(sim, changes):
+    """Serve the (start_s, config, etag) changes of the controller data."""
+    api = sim.world.network.api
+    clock = sim.world.clock
+    handle = api.handle
+
+    def handle_changed(method, path, headers, body):
+        for start_s, config, etag in changes:
+            if clock.now_us() >= start_s * 1000000:
+                api.config = config
+                api.etag = etag
+        return handle(method, path, headers, body)
+
+    api.handle = handle_changed
+
+
+def test_incomplete_data_keeps_the_cycle_and_the_cache():
+    sim = Simulation({'config_ttl': 60}, cpu_scale=0)
+    api = sim.world.network.api
+    fixed = copy.deepcopy(api.config)
+    fixed['location']['criticalValues'][0]['maxValue'] = 35
+    broken = copy.deepcopy(fixed)
+    del broken['location']
+    # The API is fixed without a new ETag.
+    serve(sim, [(150, broken, '"2"'), (400, fixed, '"2"')])
+    try:
+        sim.run(VARIANT, 20 * 60)
+        with open(os.path.join(sim.flash, 'controller.json')) as cache:
+            cached = json.load(cache)
+    finally:
+        sim.close()
+    assert 'Failure' not in sim.log.getvalue()
+    assert sim.counters['config_failures'] >= 1
+    assert [1, 10, 35] in cached['critical']
+    assert cached['etag'] == '"2"'
@@ -0,0 +1,38 @@
+"""The tags of the probes of ds18b20.py."""
+from ds18b20 import DS18B20Bus, probe_tags
+from machine import Pin
+from uploadformat import format_tag
+
+
+def test_tags_stay_with_their_probes(world, add_probes):
+    add_probes((0x1000, 0x1001, 0x1002, 0x1003))
+    bus = DS18B20Bus(Pin(4))
+    before = dict(zip(bus.roms, bus.tags))
+    del world.onewire[1]
+    bus = DS18B20Bus(Pin(4))
+    assert len(bus) == 3
+    for rom, tag in zip(bus.roms, bus.tags):
+        assert before[rom] == tag
+
+
+def test_colliding_serial_bytes_get_distinct_tags():
+    roms = [bytes([0x28, 0x3f, serial, 0, 0, 0, 0, 0])
+            for serial in (1, 2, 3)]
+    tags = probe_tags(roms)
+    assert len(set(tags)) == len(roms)
+    assert tags[0] == 0x3f28
+
+
+def test_collisions_retag_or_repeat():
+    first = bytes([0x28, 1, 9, 9, 9, 9, 9, 0])
+    second = bytes([0x28, 1, 2, 2, 2, 2, 2, 0])
+    assert probe_tags([first, second]) == [0x0128, 0x0228]
+    assert probe_tags([second]) == [0x0128]
+    taken = bytes([0x28, 9, 9, 9, 9, 9, 9, 0])
+    assert probe_tags([first, taken]) == [0x0128, 0x0928]
+    assert probe_tags([first, taken, taken]) == [0x0128, 0x0928, 0x0928]
+
+
+def test_format_of_a_probe_tag():
+    assert format_tag(0x3f28) == '28-3f'
+    assert format_tag(0x0277) == '1:0x77'
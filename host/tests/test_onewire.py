@@ -0,0 +1,71 @@
+"""onewire.py on the simulated 1-Wire bus of host/sim/_onewire.py."""
+import pytest
+
+from machine import Pin
+from onewire import OneWire, OneWireError
+
+
+# Serial numbers differing in low, high and many bits.
+SERIALS = (0x1000, 0x1001, 0x1002, 0x8000, 0x800001, 0xFFFFFFFFFFFF, 0x55)
+
+
+def test_scan_finds_every_rom(add_probes):
+    roms = add_probes(SERIALS)
+    found = OneWire(Pin(4)).scan()
+    assert sorted(found) == roms
+    assert len(found) == len(set(found))
+
+
+def test_scan_of_an_empty_bus(world):
+    bus = OneWire(Pin(4))
+    assert bus.scan() == []
+    with pytest.raises(OneWireError):
+        bus.reset(True)
+
+
+def test_roms_have_a_valid_crc(add_probes):
+    add_probes(SERIALS)
+    bus = OneWire(Pin(4))
+    for rom in bus.scan():
+        assert bus.crc8(rom) == 0
+
+
+def test_iscan_yields_before_the_scan_is_done(add_probes):
+    roms = add_probes(SERIALS)
+    bus = OneWire(Pin(4))
+    scan = bus.iscan()
+    first = next(scan)
+    assert first in roms
+    assert sorted([first] + list(scan)) == roms
+
+
+def test_interleaved_scans_do_not_share_state(add_probes):
+    roms = add_probes(SERIALS)
+    bus = OneWire(Pin(4))
+    one = bus.iscan()
+    other = bus.iscan()
+    found_one = [next(one), next(one)]
+    found_other = list(other)
+    found_one += list(one)
+    assert sorted(found_one) == roms
+    assert sorted(found_other) == roms
+
+
+def test_alarm_scan_finds_alarmed_probes_only(world, add_probes):
+    add_probes(SERIALS, alarms=(0x1001, 0x8000))
+    alarmed = sorted(probe.rom for probe in world.onewire if probe.alarm)
+    bus = OneWire(Pin(4))
+    assert sorted(bus.alarm_scan()) == alarmed
+    assert len(bus.scan()) == len(SERIALS)
+
+
+def test_read_scratchpad_with_write_and_readinto(world, add_probes):
+    add_probes((0x1000,))
+    bus = OneWire(Pin(4))
+    rom = bus.scan()[0]
+    bus.select_rom(rom)
+    bus.write(b'\xbe')
+    data = bytearray(9)
+    bus.readinto(data)
+    assert bytes(data) == bytes(world.onewire[0].scratchpad())
+    assert bus.crc8(data) == 0
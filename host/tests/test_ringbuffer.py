@@ -0,0 +1,195 @@
+"""The ring buffer of ringbuffer.py and store and forward in outages."""
+import os
+
+import pytest
+
+from ringbuffer import RECORD_SIZE, RingBuffer
+from simulator import Simulation
+from uploadformat import EPOCH_OFFSET
+
+VARIANT = 'tempstation_DHT22'
+# A station needs the API to boot, outages start after the first cycle.
+BOOTED = 60
+# A DHT22 station sends temperature and humidity every minute.
+PER_MINUTE = 2
+
+
+def readings(*values):
+    """Return the (timestamp, unitId, value, sensor) array of readings."""
+    flat = []
+    for timestamp, value in values:
+        flat += [timestamp, 1, value, 0]
+    return flat
+
+
+def pending(buffer):
+    """Return the (timestamp, value) of all pending readings."""
+    batch = [0] * (4 * buffer.slots)
+    count, _ = buffer.peek(batch, buffer.slots)
+    return [(batch[i], batch[i + 2]) for i in range(0, 4 * count, 4)]
+
+
+@pytest.fixture
+def path(tmp_path):
+    """The path of a buffer file."""
+    return str(tmp_path / 'readings.bin')
+
+
+def test_append_peek_ack(path):
+    buffer = RingBuffer(path, 8)
+    buffer.append(readings((100, 1), (160, 2), (220, 3)), 3)
+    assert len(buffer) == 3
+    batch = [0] * 8
+    count, seq = buffer.peek(batch, 2)
+    assert (count, seq) == (2, 2)
+    buffer.ack(seq)
+    assert pending(buffer) == [(220, 3)]
+
+
+def test_oldest_readings_are_evicted(path):
+    buffer = RingBuffer(path, 4)
+    buffer.append(readings(*[(60 * i, i) for i in range(6)]), 6)
+    assert len(buffer) == 4
+    assert pending(buffer) == [(120, 2), (180, 3), (240, 4), (300, 5)]
+    assert os.path.getsize(path) == 4 * RECORD_SIZE
+
+
+def test_recovered_after_reopening(path):
+    buffer = RingBuffer(path, 4)
+    buffer.append(readings(*[(60 * i, i) for i in range(6)]), 6)
+    buffer.ack(buffer.peek([0] * 4, 1)[1])
+    buffer.close()
+    buffer = RingBuffer(path, 4)
+    assert pending(buffer) == [(180, 3), (240, 4), (300, 5)]
+
+
+def test_torn_record_is_skipped(path):
+    buffer = RingBuffer(path, 8)
+    buffer.append(readings((100, 1), (160, 2), (220, 3)), 3)
+    buffer.close()
+    with open(path, 'r+b') as data:
+        # The value of the second reading, sequence number 2.
+        data.seek(2 * RECORD_SIZE + 13)
+        data.write(b'\xff')
+    buffer = RingBuffer(path, 8)
+    assert pending(buffer) == [(100, 1), (220, 3)]
+
+
+def test_ack_is_written_every_ack_every(path):
+    buffer = RingBuffer(path, 64)
+    for i in range(RingBuffer.ACK_EVERY - 1):
+        buffer.append(readings((60 * i, i)), 1)
+        buffer.ack(buffer.head)
+    assert not os.path.exists(buffer.ack_path)
+    buffer.append(readings((0, 0)), 1)
+    buffer.ack(buffer.head)
+    assert RingBuffer(path, 64).acked == RingBuffer.ACK_EVERY
+    buffer.append(readings((0, 0)), 1)
+    buffer.ack(buffer.head)
+    buffer.close()
+    assert RingBuffer(path, 64).acked == RingBuffer.ACK_EVERY + 1
+
+
+def simulation(**settings):
+    """Return a DHT22 station with store and forward."""
+    settings['store_and_forward'] = True
+    return Simulation(settings, cpu_scale=0)
+
+
+def outage(sim, start_s, end_s):
+    """Let the API answer 503 from start_s to end_s of the simulation."""
+    api = sim.world.network.api
+    clock = sim.world.clock
+    handle = api.handle
+
+    def handle_in_outage(method, path, headers, body):
+        if start_s * 1000000 <= clock.now_us() < end_s * 1000000:
+            return 503, {}, b''
+        return handle(method, path, headers, body)
+
+    api.handle = handle_in_outage
+
+
+def unix_time(sim, seconds):
+    """Return the Unix time of seconds into the simulation."""
+    return sim.world.clock.epoch + EPOCH_OFFSET + seconds
+
+
+def received(sim):
+    """Return the (unitId, timestamp) of the readings the API took."""
+    keys = []
+    for endpoint, data in sim.world.network.api.received:
+        if endpoint == 'data':
+            data = [data]
+        if endpoint in ('batch', 'data'):
+            keys += [(reading['unitId'], reading['timestamp'])
+                     for reading in data]
+    return keys
+
+
+def run(sim, minutes):
+    """Run the station, then remove the flash."""
+    try:
+        sim.run(VARIANT, minutes * 60)
+    finally:
+        sim.close()
+    return received(sim)
+
+
+def test_outage_readings_arrive_once():
+    expected = run(simulation(), 30)
+    sim = simulation()
+    outage(sim, 600, 1200)
+    keys = run(sim, 30)
+    assert len(keys) == len(set(keys))
+    # The last cycle may still be waiting for its upload.
+    assert set(expected) - set(keys) <= set(expected[-PER_MINUTE:])
+    assert sorted(keys) == sorted(set(expected) & set(keys))
+
+
+def test_outage_longer_than_the_buffer_keeps_the_newest():
+    sim = simulation()
+    slots = RingBuffer.SLOTS
+    # Twice as long as the buffer holds.
+    minutes = 2 * slots // PER_MINUTE
+    outage(sim, BOOTED, BOOTED + minutes * 60)
+    keys = run(sim, minutes + 5)
+    assert len(keys) == len(set(keys))
+    start = unix_time(sim, BOOTED)
+    end = unix_time(sim, BOOTED + minutes * 60)
+    kept = [key for key in keys if start <= key[1] < end]
+    # The cycle at the end may be measured just after the outage.
+    assert slots - PER_MINUTE <= len(kept) <= slots
+    # Only the newest readings of the outage are left.
+    assert min(timestamp for _, timestamp in kept) > \
+        end - (slots // PER_MINUTE + 1) * 60
+
+
+def test_readings_survive_a_power_loss_in_an_outage():
+    sim = simulation()
+    outage(sim, BOOTED, 20 * 60)
+    try:
+        sim.run(VARIANT, 10 * 60)
+        sent = len(received(sim))
+        # The RTC starts over, the flash keeps the buffer.
+        sim.world.clock.set_time(0)
+        sim.world.rtc_memory = b''
+        sim.run(VARIANT, 20 * 60)
+    finally:
+        sim.close()
+    keys = received(sim)
+    # Acks since the last save are lost, those readings are sent again.
+    assert len(keys) - len(set(keys)) <= min(sent, RingBuffer.ACK_EVERY)
+    before = {key for key in keys if key[1] < unix_time(sim, 600)}
+    assert len(before) - sent >= 8 * PER_MINUTE
+
+
+def test_outage_readings_posted_one_by_one_keep_their_time():
+    expected = run(simulation(), 30)
+    sim = simulation()
+    # A server without the batch endpoint.
+    sim.world.network.api.batch = False
+    outage(sim, 600, 1200)
+    keys = run(sim, 30)
+    assert len(keys) == len(set(keys))
+    assert set(expected) - set(keys) <= set(expected[-PER_MINUTE:])
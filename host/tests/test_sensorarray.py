@@ -0,0 +1,50 @@
+"""The BME280 array of sensorarray.py on the simulated I2C bus."""
+import bme280_int
+import hardware
+import pytest
+
+from machine import I2C, Pin
+from sensorarray import BME280Array
+
+
+@pytest.fixture
+def world():
+    """A world with two BME280 at both addresses."""
+    hardware.world = hardware.World()
+    hardware.world.add_bme280(0x76)
+    hardware.world.add_bme280(0x77)
+    return hardware.world
+
+
+def bme280_array():
+    """Return the array of the sensors on the bus."""
+    i2c = I2C(scl=Pin(0), sda=Pin(4))
+    return BME280Array(i2c, compensator=bme280_int.Compensator)
+
+
+def test_all_sensors_report(world):
+    sensors = bme280_array()
+    sensors.measure()
+    assert sensors.tags == [0x76, 0x77]
+    assert list(sensors.valid) == [1, 1]
+
+
+def test_a_missing_sensor_leaves_the_others(world):
+    sensors = bme280_array()
+    sensors.measure()
+    before = list(sensors.results[0])
+    device = world.i2c.devices.pop(0x77)
+    results = sensors.measure()
+    assert list(sensors.valid) == [1, 0]
+    assert list(results[0]) == pytest.approx(before, abs=200)
+    world.i2c.devices[0x77] = device
+    sensors.measure()
+    assert list(sensors.valid) == [1, 1]
+
+
+def test_no_sensor_answering_raises(world):
+    sensors = bme280_array()
+    world.i2c.devices.clear()
+    with pytest.raises(OSError):
+        sensors.measure()
+    assert list(sensors.valid) == [0, 0]
@@ -0,0 +1,426 @@
+"""
+Columnar time-series store of station readings for dashboards.
+
+Every series, the readings of one unit of one sensor of a station, is kept
+in a directory of append-only files:
+
+- chunks.dat: sealed chunks of up to CHUNK readings. Timestamps are stored
+  as deltas of deltas and values, in hundredths like on the station, as
+  deltas, each in the narrowest integer type that fits. Readings every
+  minute take 2 bytes instead of 12.
+- chunks.idx: one INDEX record per chunk with its offset, time range and
+  min, max and sum, so a query only decodes the chunks it needs.
+- tier_<seconds>.dat: TIER records of count, min, max and sum per hour
+  and per day, written when a chunk is sealed. Finer rollups are computed
+  from the chunks, a week of readings every minute is 10080 readings.
+
+The files are memory-mapped, so only the pages a query touches are read.
+Readings are collected in memory until CHUNK of them are sealed, or until
+the first of them has waited SEAL_S seconds. Queries include them.
+close() seals the rest. Unsealed readings are lost with the process, the
+last SEAL_S of a store can be imported again from the SQLite database.
+Readings may arrive out of order, a reading with the timestamp of one in
+the same chunk replaces it.
+
+    store = ColumnStore('readings.tsdb')
+    store.write(12, 1, timestamps, values)
+    times, values = store.range(12, 1, start, end)
+    hourly = store.rollup(12, 1, start, end, 3600)
+
+The ingestion server writes to a store with --columns, a store can be
+rebuilt from its SQLite database. The store needs NumPy:
+
+    python host/tsstore.py import readings.sqlite readings.tsdb
+    python host/tsstore.py query readings.tsdb 12 1 --days 30 --res 3600
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+CHUNK = 4096
+TIERS = (3600, 86400)
+SEAL_S = 3600
+SWEEP_S = 60
+
+INDEX = np.dtype([
+    ('offset', '<i8'), ('count', '<i4'), ('time_type', 'u1'),
+    ('value_type', 'u1'), ('t0', '<i8'), ('t1', '<i8'), ('first', '<i4'),
+    ('min', '<i4'), ('max', '<i4'), ('sum', '<i8')])
+TIER = np.dtype([
+    ('bucket', '<i8'), ('count', '<i4'), ('min', '<i4'), ('max', '<i4'),
+    ('sum', '<i8')])
+# Delta types by their code in the index.
+TYPES = (np.dtype('<i1'), np.dtype('<i2'), np.dtype('<i4'),
+         np.dtype('<i8'))
+
+
+def _narrowest(deltas):
+    """Return the code of the smallest type holding all deltas."""
+    if not len(deltas):
+        return 0
+    low = deltas.min()
+    high = deltas.max()
+    for code, dtype in enumerate(TYPES):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return code
+    raise ValueError('Delta out of range')
+
+
+def encode_chunk(times, values):
+    """Return the bytes and index record of sorted readings."""
+    deltas = np.diff(times, prepend=times[0])
+    times_dd = np.diff(deltas, prepend=0)
+    values_d = np.diff(values.astype(np.int64), prepend=values[0])
+    record = np.zeros(1, INDEX)[0]
+    record['count'] = len(times)
+    record['time_type'] = _narrowest(times_dd)
+    record['value_type'] = _narrowest(values_d)
+    record['t0'] = times[0]
+    record['t1'] = times[-1]
+    record['first'] = values[0]
+    record['min'] = values.min()
+    record['max'] = values.max()
+    record['sum'] = values.sum(dtype=np.int64)
+    data = (times_dd.astype(TYPES[record['time_type']]).tobytes() +
+            values_d.astype(TYPES[record['value_type']]).tobytes())
+    return data, record
+
+
+def decode_chunk(buffer, record):
+    """Return the timestamps and values of a chunk in buffer."""
+    count = int(record['count'])
+    offset = int(record['offset'])
+    time_type = TYPES[record['time_type']]
+    value_type = TYPES[record['value_type']]
+    times_dd = np.frombuffer(buffer, time_type, count, offset)
+    values_d = np.frombuffer(buffer, value_type, count,
+                             offset + count * time_type.itemsize)
+    times = np.cumsum(np.cumsum(times_dd, dtype=np.int64)) + record['t0']
+    values = np.cumsum(values_d, dtype=np.int64) + record['first']
+    return times, values.astype(np.int32)
+
+
+def aggregate(times, values, resolution):
+    """
+    Return TIER records of sorted readings per bucket of resolution.
+
+    Buckets start at multiples of the resolution in Unix time.
+    """
+    buckets = times // resolution * resolution
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[:1] - 1))
+    records = np.empty(len(starts), TIER)
+    records['bucket'] = buckets[starts]
+    records['count'] = np.diff(starts, append=len(buckets))
+    records['min'] = np.minimum.reduceat(values, starts)
+    records['max'] = np.maximum.reduceat(values, starts)
+    records['sum'] = np.add.reduceat(values.astype(np.int64), starts)
+    return records
+
+
+def merge(records, resolution):
+    """Combine TIER records into buckets of a coarser resolution."""
+    buckets = records['bucket'] // resolution * resolution
+    if len(buckets) > 1 and np.any(buckets[1:] < buckets[:-1]):
+        order = np.argsort(buckets, kind='stable')
+        records = records[order]
+        buckets = buckets[order]
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[:1] - 1))
+    merged = np.empty(len(starts), TIER)
+    merged['bucket'] = buckets[starts]
+    merged['count'] = np.add.reduceat(records['count'], starts)
+    merged['min'] = np.minimum.reduceat(records['min'], starts)
+    merged['max'] = np.maximum.reduceat(records['max'], starts)
+    merged['sum'] = np.add.reduceat(records['sum'], starts)
+    return merged
+
+
+def _mapped(path, dtype):
+    """Return a read-only memory map of a file of records."""
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size < dtype.itemsize:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype, 'r', shape=(size // dtype.itemsize,))
+
+
+class Series():
+    """The files and unsealed readings of one series."""
+
+    def __init__(self, path):
+        """Use the series directory at path."""
+        self.path = path
+        self.head_times = []
+        self.head_values = []
+        self.head_count = 0
+        self.head_since = 0
+        self._maps = {}
+
+    def _map(self, name, dtype):
+        """Return the memory map of a file, mapped again if it grew."""
+        path = os.path.join(self.path, name)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        cached = self._maps.get(name)
+        if cached is None or cached[0] != size:
+            cached = (size, _mapped(path, dtype))
+            self._maps[name] = cached
+        return cached[1]
+
+    @property
+    def index(self):
+        """The INDEX records of the sealed chunks."""
+        return self._map('chunks.idx', INDEX)
+
+    def tier(self, resolution):
+        """The TIER records of a resolution."""
+        return self._map('tier_{}.dat'.format(resolution), TIER)
+
+    def append(self, times, values):
+        """Add readings, seal a chunk once there are CHUNK of them."""
+        if not self.head_count:
+            self.head_since = time.monotonic()
+        self.head_times.append(np.asarray(times, np.int64))
+        self.head_values.append(np.asarray(values, np.int32))
+        self.head_count += len(self.head_times[-1])
+        if self.head_count >= CHUNK:
+            self.seal()
+
+    def head(self):
+        """Return the unsealed readings sorted by time, without repeats."""
+        if not self.head_count:
+            return np.zeros(0, np.int64), np.zeros(0, np.int32)
+        times = np.concatenate(self.head_times)
+        values = np.concatenate(self.head_values)
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        values = values[order]
+        # Keep the last reading of a timestamp, e.g. of a retried upload.
+        last = np.append(times[1:] != times[:-1], True)
+        return times[last], values[last]
+
+    def seal(self):
+        """Write the unsealed readings as chunks and tier records."""
+        times, values = self.head()
+        self.head_times = []
+        self.head_values = []
+        self.head_count = 0
+        if not len(times):
+            return
+        os.makedirs(self.path, exist_ok=True)
+        data_path = os.path.join(self.path, 'chunks.dat')
+        offset = os.path.getsize(data_path) if os.path.exists(
+            data_path) else 0
+        with open(data_path, 'ab') as data, \
+                open(os.path.join(self.path, 'chunks.idx'), 'ab') as index:
+            for start in range(0, len(times), CHUNK):
+                chunk, record = encode_chunk(times[start:start + CHUNK],
+                                             values[start:start + CHUNK])
+                record['offset'] = offset
+                offset += len(chunk)
+                data.write(chunk)
+                index.write(record.tobytes())
+        for resolution in TIERS:
+            with open(os.path.join(self.path, 'tier_{}.dat'.format(
+                    resolution)), 'ab') as tier:
+                tier.write(aggregate(times, values, resolution).tobytes())
+
+    def range(self, start, end):
+        """Return the readings from start up to end."""
+        index = self.index
+        selected = np.flatnonzero((index['t1'] >= start) &
+                                  (index['t0'] < end))
+        parts = []
+        if len(selected):
+            buffer = self._map('chunks.dat', np.dtype('u1'))
+            for i in selected:
+                parts.append(decode_chunk(buffer, index[i]))
+        if self.head_count:
+            parts.append(self.head())
+        if not parts:
+            return np.zeros(0, np.int64), np.zeros(0, np.int32)
+        times = np.concatenate([part[0] for part in parts])
+        values = np.concatenate([part[1] for part in parts])
+        if np.any(times[1:] < times[:-1]):
+            # Chunks of late readings overlap the others.
+            order = np.argsort(times, kind='stable')
+            times = times[order]
+            values = values[order]
+        low, high = np.searchsorted(times, (start, end))
+        return times[low:high], values[low:high]
+
+    def rollup(self, start, end, resolution):
+        """Return TIER records of the buckets from start up to end."""
+        start = start // resolution * resolution
+        end = -(-end // resolution) * resolution
+        tier = max((t for t in TIERS if resolution % t == 0), default=None)
+        if tier is None:
+            times, values = self.range(start, end)
+            if not len(times):
+                return np.zeros(0, TIER)
+            return aggregate(times, values, resolution)
+        records = self.tier(tier)
+        records = records[(records['bucket'] >= start) &
+                          (records['bucket'] < end)]
+        if self.head_count:
+            times, values = self.head()
+            low, high = np.searchsorted(times, (start, end))
+            if high > low:
+                records = np.concatenate([records, aggregate(
+                    times[low:high], values[low:high], tier)])
+        if not len(records):
+            return np.zeros(0, TIER)
+        return merge(records, resolution)
+
+
+class ColumnStore():
+    """
+    Series of readings below a root directory.
+
+    Series are found by station, unitId and sensor tag (the sensor field of
+    an upload, '' without). Values are integers in hundredths.
+    """
+
+    def __init__(self, root, seal_s=SEAL_S):
+        """Use or create the store at root."""
+        self.root = root
+        self.seal_s = seal_s
+        self.series = {}
+        self.swept = time.monotonic()
+        os.makedirs(root, exist_ok=True)
+
+    def _series(self, station, unit, sensor=''):
+        """Return a series, created on first use."""
+        key = (station, unit, sensor)
+        series = self.series.get(key)
+        if series is None:
+            name = '{}-{}'.format(unit, sensor.replace(':', '_')) \
+                if sensor else str(unit)
+            series = Series(os.path.join(self.root, str(station), name))
+            self.series[key] = series
+        return series
+
+    def keys(self):
+        """Return the (station, unit, sensor) of every stored series."""
+        keys = set(self.series)
+        for station in os.listdir(self.root):
+            if not station.isdigit():
+                continue
+            for name in os.listdir(os.path.join(self.root, station)):
+                unit, _, sensor = name.partition('-')
+                keys.add((int(station), int(unit), sensor.replace('_', ':')))
+        return sorted(keys)
+
+    def write(self, station, unit, times, values, sensor=''):
+        """Add readings of a series, Unix timestamps and hundredths."""
+        self._series(station, unit, sensor).append(times, values)
+        if time.monotonic() - self.swept >= min(SWEEP_S, self.seal_s):
+            self.seal_waiting()
+
+    def write_rows(self, rows):
+        """Add (station, unit, sensor, timestamp, value) rows."""
+        grouped = {}
+        for station, unit, sensor, timestamp, value in rows:
+            group = grouped.setdefault((station, unit, sensor), ([], []))
+            group[0].append(timestamp)
+            group[1].append(value)
+        for (station, unit, sensor), (times, values) in grouped.items():
+            self.write(station, unit, times, values, sensor)
+
+    def seal_waiting(self):
+        """Seal the series whose unsealed readings waited seal_s."""
+        now = self.swept = time.monotonic()
+        for series in self.series.values():
+            if series.head_count and now - series.head_since >= self.seal_s:
+                series.seal()
+
+    def range(self, station, unit, start, end, sensor=''):
+        """Return the timestamps and values from start up to end."""
+        return self._series(station, unit, sensor).range(start, end)
+
+    def rollup(self, station, unit, start, end, resolution, sensor=''):
+        """
+        Return count, min, max and mean per bucket of resolution seconds.
+
+        The buckets cover start rounded down to end rounded up to the
+        resolution. Multiples of a tier are answered from the tier without
+        reading raw readings. The result is a dict of arrays: time, count,
+        min, max and mean, all values in hundredths.
+        """
+        records = self._series(station, unit, sensor).rollup(
+            start, end, resolution)
+        return {
+            'time': records['bucket'],
+            'count': records['count'],
+            'min': records['min'],
+            'max': records['max'],
+            'mean': records['sum'] / np.maximum(records['count'], 1),
+        }
+
+    def flush(self):
+        """Seal the unsealed readings of all series."""
+        for series in self.series.values():
+            series.seal()
+
+    def close(self):
+        """Seal everything and forget the series."""
+        self.flush()
+        self.series = {}
+
+
+def import_sqlite(database, root, batch=1000000):
+    """Add the readings of an ingestion server database to a store."""
+    store = ColumnStore(root)
+    db = sqlite3.connect(database)
+    count = 0
+    try:
+        cursor = db.execute(
+            'SELECT station, unit, sensor, timestamp, value FROM readings')
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                break
+            store.write_rows(rows)
+            count += len(rows)
+    finally:
+        db.close()
+        store.close()
+    return count
+
+
+def main():
+    """Import a database or query a store."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    importing = commands.add_parser('import')
+    importing.add_argument('database')
+    importing.add_argument('root')
+    query = commands.add_parser('query')
+    query.add_argument('root')
+    query.add_argument('station', type=int)
+    query.add_argument('unit', type=int)
+    query.add_argument('--sensor', default='')
+    query.add_argument('--days', type=float, default=1)
+    query.add_argument('--res', type=int, default=3600,
+                       help='seconds per bucket')
+    args = parser.parse_args()
+    if args.command == 'import':
+        print("Imported", import_sqlite(args.database, args.root),
+              "readings")
+        return
+    store = ColumnStore(args.root)
+    end = int(time.time())
+    result = store.rollup(args.station, args.unit,
+                          end - int(args.days * 86400), end, args.res,
+                          args.sensor)
+    for i in range(len(result['time'])):
+        print('{} {:6d} {:9.2f} {:9.2f} {:9.2f}'.format(
+            time.strftime('%Y-%m-%d %H:%M', time.gmtime(
+                result['time'][i])), result['count'][i],
+            result['min'][i] / 100, result['mean'][i] / 100,
+            result['max'][i] / 100))
+
+
+if __name__ == '__main__':
+    main()
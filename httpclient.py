@@ -0,0 +1,224 @@
+"""A small HTTP/1.1 client which keeps its connection to the API open."""
+import metrics
+import ujson
+import usocket
+
+from utime import ticks_diff, ticks_ms, ticks_us
+
+ETIMEDOUT = 110
+
+
+class Response():
+    """A completely read response of the API."""
+
+    def __init__(self, status_code, headers, content, latency_ms):
+        """Store the status code, headers, body and latency of a request."""
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.latency_ms = latency_ms
+
+    @property
+    def text(self):
+        """Return the body as a string."""
+        return str(self.content, 'utf-8')
+
+    def json(self):
+        """Return the parsed JSON body."""
+        return ujson.loads(self.content)
+
+    def close(self):
+        """Do nothing, the body is read and the socket is kept alive."""
+
+
+class HTTPClient():
+    """
+    HTTP/1.1 client reusing one keep-alive socket.
+
+    The socket stays connected to the last requested host. DNS results are
+    cached per host. A socket idle for more than IDLE_TIMEOUT seconds is
+    closed before the next request, as servers drop idle connections after
+    a few seconds (5 s on Apache). If the kept socket turns out to be dead
+    anyway, reset or closed before any byte of the response, the request is
+    sent once more over a new connection. A timeout is never retried, the
+    server may have taken the request. The latency of every request is
+    available as `latency_ms` on its response and in `last_latency_ms`.
+    """
+
+    TIMEOUT = 10
+    IDLE_TIMEOUT = 4
+
+    def __init__(self):
+        """Initialize the client without an open connection."""
+        self.sock = None
+        self.host = None
+        self.addresses = {}
+        self.requests = 0
+        self.connects = 0
+        self.retries = 0
+        self.last_latency_ms = 0
+        self.used_ms = 0
+        self._answered = False
+
+    def get(self, url, headers=None):
+        """Send a GET request."""
+        return self.request('GET', url, headers=headers)
+
+    def post(self, url, data=None, headers=None):
+        """Send a POST request."""
+        return self.request('POST', url, data, headers)
+
+    def request(self, method, url, data=None, headers=None):
+        """Send a request and return the read response."""
+        proto, host, port, path = self._split_url(url)
+        if isinstance(data, str):
+            data = data.encode()
+        start = ticks_us()
+        if self.sock is not None and ticks_diff(
+                ticks_ms(), self.used_ms) > self.IDLE_TIMEOUT * 1000:
+            # The server has most likely closed it already.
+            self.close()
+        reused = self.sock is not None and self.host == (proto, host, port)
+        try:
+            if not reused:
+                self._connect(proto, host, port)
+            response = self._exchange(method, host, path, data, headers)
+        except OSError as err:
+            self.close()
+            if not reused:
+                # The cached address may be outdated, resolve it again.
+                self.addresses.pop((host, port), None)
+                raise
+            if self._answered or err.args[:1] == (ETIMEDOUT,):
+                raise
+            self.retries += 1
+            metrics.increment(metrics.HTTP_RETRIES)
+            self._connect(proto, host, port)
+            response = self._exchange(method, host, path, data, headers)
+        self.requests += 1
+        self.used_ms = ticks_ms()
+        latency_us = ticks_diff(ticks_us(), start)
+        metrics.record(metrics.HTTP, latency_us)
+        self.last_latency_ms = latency_us // 1000
+        response.latency_ms = self.last_latency_ms
+        return response
+
+    def close(self):
+        """Close the kept connection."""
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.host = None
+
+    def _split_url(self, url):
+        """Split an URL into protocol, host, port and path."""
+        proto, _, host, path = (url.split('/', 3) + [''])[:4]
+        if proto == 'http:':
+            port = 80
+        elif proto == 'https:':
+            port = 443
+        else:
+            raise ValueError('Unsupported protocol: ' + proto)
+        if ':' in host:
+            host, port = host.split(':', 1)
+            port = int(port)
+        return proto, host, port, '/' + path
+
+    def _connect(self, proto, host, port):
+        """Open a new connection to the host."""
+        self.close()
+        address = self.addresses.get((host, port))
+        if address is None:
+            address = usocket.getaddrinfo(
+                host, port, 0, usocket.SOCK_STREAM)[0][-1]
+            self.addresses[(host, port)] = address
+        sock = usocket.socket()
+        sock.settimeout(self.TIMEOUT)
+        try:
+            sock.connect(address)
+            if proto == 'https:':
+                import ussl
+                sock = ussl.wrap_socket(sock, server_hostname=host)
+        except OSError:
+            sock.close()
+            self.addresses.pop((host, port), None)
+            raise
+        self.sock = sock
+        self.host = (proto, host, port)
+        self.connects += 1
+
+    def _exchange(self, method, host, path, data, headers):
+        """Write the request and read the response."""
+        sock = self.sock
+        # Send the head and body in one write, small segments are delayed
+        # by the TCP stack.
+        head = '{} {} HTTP/1.1\r\nHost: {}\r\n'.format(method, path, host)
+        if headers:
+            for key in headers:
+                head += '{}: {}\r\n'.format(key, headers[key])
+        if data is not None:
+            head += 'Content-Length: {}\r\n'.format(len(data))
+        head = head.encode() + b'\r\n'
+        if data is not None:
+            head += data
+        self._answered = False
+        sock.write(head)
+
+        line = sock.readline()
+        if not line:
+            raise OSError('Connection closed by the server')
+        self._answered = True
+        status = int(line.split(None, 2)[1])
+        response_headers = {}
+        length = None
+        chunked = False
+        keep_alive = True
+        while True:
+            line = sock.readline()
+            if not line:
+                raise OSError('Connection closed by the server')
+            if line == b'\r\n':
+                break
+            key, _, value = line.partition(b':')
+            key = str(key.strip().lower(), 'utf-8')
+            value = str(value.strip(), 'utf-8')
+            response_headers[key] = value
+            if key == 'content-length':
+                length = int(value)
+            elif key == 'transfer-encoding':
+                chunked = value.lower() == 'chunked'
+            elif key == 'connection':
+                keep_alive = value.lower() != 'close'
+
+        if status in (204, 304) or method == 'HEAD':
+            content = b''
+        elif chunked:
+            content = b''
+            while True:
+                size = int(sock.readline().split(b';')[0], 16)
+                chunk = self._read(size)
+                sock.readline()
+                if not size:
+                    break
+                content += chunk
+        elif length is not None:
+            content = self._read(length)
+        else:
+            content = sock.read()
+            keep_alive = False
+        if not keep_alive:
+            self.close()
+        return Response(status, response_headers, content, 0)
+
+    def _read(self, length):
+        """Read exactly length bytes of the body."""
+        content = b''
+        while len(content) < length:
+            part = self.sock.read(length - len(content))
+            if not part:
+                raise OSError('Connection closed by the server')
+            content += part
+        return content
+
+
+client = HTTPClient()
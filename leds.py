@@ -0,0 +1,72 @@
+"""Non-blocking LED signals for the tempstations."""
+import machine
+
+
+def blink(leds, times, on_ms=1000, off_ms=1000):
+    """Return a pattern lighting the given LEDs several times."""
+    return ((tuple(leds), on_ms), ((), off_ms)) * times
+
+
+class LedSequencer():
+    """
+    Play LED patterns from a timer callback.
+
+    A pattern is a sequence of (leds, duration_ms) steps: the LEDs in a step
+    are lit for duration_ms while all others are dark. Queued patterns are
+    played one after another while the caller continues measuring. The
+    LEDs are wired active low, so off() lights them.
+    """
+
+    MAX_QUEUED = 4
+
+    def __init__(self, leds, timer_id=-1):
+        """Take control of the given LEDs."""
+        self.leds = tuple(leds)
+        self.timer = machine.Timer(timer_id)
+        self.queue = []
+        self.pattern = None
+        self.step = 0
+        # Bind the callback once instead of on every step.
+        self._callback = self._next_step
+
+    @property
+    def busy(self):
+        """Return True while a pattern is played or queued."""
+        return self.pattern is not None
+
+    def play(self, pattern):
+        """Queue a pattern and return immediately."""
+        if len(self.queue) >= self.MAX_QUEUED:
+            self.queue.pop(0)
+        self.queue.append(pattern)
+        if self.pattern is None:
+            self._next_step(None)
+
+    def stop(self):
+        """Stop playing and drop all queued patterns."""
+        self.timer.deinit()
+        self.queue = []
+        self.pattern = None
+        self._light(())
+
+    def _light(self, leds):
+        """Light only the given LEDs."""
+        for led in self.leds:
+            led.on()
+        for led in leds:
+            led.off()
+
+    def _next_step(self, timer):
+        """Show the next step and arm the timer for its duration."""
+        while self.pattern is None or self.step >= len(self.pattern):
+            if not self.queue:
+                self.pattern = None
+                self._light(())
+                return
+            self.pattern = self.queue.pop(0)
+            self.step = 0
+        leds, duration = self.pattern[self.step]
+        self.step += 1
+        self._light(leds)
+        self.timer.init(period=duration, mode=machine.Timer.ONE_SHOT,
+                        callback=self._callback)
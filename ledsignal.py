@@ -0,0 +1,116 @@
+"""LED backends of the station, see station.py."""
+import leds
+
+from machine import Pin
+from station import BROKEN_HUMIDITY, BROKEN_PRESSURE, BROKEN_TEMPERATURE
+
+
+def _led(number):
+    """Return the active low LED on the pin, switched off."""
+    led = Pin(number, Pin.OUT)
+    led.on()
+    return led
+
+
+class RGBSignal():
+    """
+    An RGB LED on GPIO13 (red), GPIO15 (green) and GPIO12 (blue).
+
+    A measurement is signalled with three blinks:
+
+    - magenta: pressure is too low or high
+    - red: temperature is too low or high
+    - cyan: humidity is too low or high
+    - green: otherwise
+
+    A blink lasts blink_ms and is followed by a dark pause as long.
+    """
+
+    def __init__(self, blink_ms=1000):
+        """Set up the pins and build the signals of all broken values."""
+        self.red = _led(13)
+        self.green = _led(15)
+        self.blue = _led(12)
+        self.blink_ms = blink_ms
+        self.sequencer = leds.LedSequencer((self.red, self.green, self.blue))
+        ok = leds.blink([self.green], 1, blink_ms, blink_ms)
+        pressure = leds.blink([self.red, self.blue], 3, blink_ms, blink_ms)
+        temperature = leds.blink([self.red], 3, blink_ms, blink_ms)
+        humidity = leds.blink([self.blue, self.green], 3, blink_ms,
+                              blink_ms)
+        # The signal of a measurement is looked up by its broken bits.
+        self.signals = []
+        for broken in range(8):
+            self.signals.append(
+                (pressure if broken & BROKEN_PRESSURE else ok) +
+                (temperature if broken & BROKEN_TEMPERATURE else ok) +
+                (humidity if broken & BROKEN_HUMIDITY else ok))
+
+    @property
+    def busy(self):
+        """Return True while a signal is played."""
+        return self.sequencer.busy
+
+    def stop(self):
+        """Stop the signal and switch the LEDs off."""
+        self.sequencer.stop()
+
+    def check(self):
+        """Blink all colors once."""
+        red = self.red
+        green = self.green
+        blue = self.blue
+        led_colors = [
+            [red], [green], [blue], [red, blue], [blue, green], [red, green]
+        ]
+        pattern = ()
+        for led_color in led_colors:
+            pattern += leds.blink(led_color, 1, self.blink_ms,
+                                  self.blink_ms)
+        self.sequencer.play(pattern)
+
+    def show(self, broken):
+        """Signal the broken critical values."""
+        self.sequencer.play(self.signals[broken & 7])
+
+
+class RedGreenSignal():
+    """
+    A red LED on GPIO13 and a green one on GPIO12.
+
+    Red blinks if any critical value is broken, green otherwise. A blink
+    lasts blink_ms and is followed by a dark pause as long.
+    """
+
+    def __init__(self, blink_ms=1000):
+        """Set up the pins and build the signals."""
+        self.red = _led(13)
+        self.green = _led(12)
+        self.sequencer = leds.LedSequencer((self.red, self.green))
+        self.ok = leds.blink([self.green], 3, blink_ms, blink_ms)
+        self.critical = leds.blink([self.red], 3, blink_ms, blink_ms)
+        self._check = leds.blink([self.red], 1, blink_ms, blink_ms) + \
+            leds.blink([self.green], 1, blink_ms, blink_ms)
+
+    @property
+    def busy(self):
+        """Return True while a signal is played."""
+        return self.sequencer.busy
+
+    def stop(self):
+        """Stop the signal and switch the LEDs off."""
+        self.sequencer.stop()
+
+    def check(self):
+        """Blink both LEDs once."""
+        self.sequencer.play(self._check)
+
+    def show(self, broken):
+        """Signal the broken critical values."""
+        self.sequencer.play(self.critical if broken else self.ok)
+
+
+BACKENDS = {
+    'rgb': RGBSignal,
+    'red_green': RedGreenSignal,
+}
@@ -0,0 +1,160 @@
+"""
+Self-metrics of the station, uploaded next to the readings.
+
+The time of every phase of a cycle is recorded in microseconds with
+ticks_us: the sensor read, the JSON encoding, every HTTP request, the LED
+signal, the whole upload and the whole cycle. Together with counters of
+retries, failures, late cycles of scheduler.py and the uploaded and
+suppressed means of aggregate.py they are kept in preallocated arrays, so
+recording allocates nothing:
+
+    start = ticks_us()
+    sensor.measure()
+    metrics.stop(metrics.SENSOR, start)
+
+Every credentials.metrics_interval seconds (3600 by default, 0 turns the
+metrics off) a summary is sent as JSON to credentials.post_metrics or to
+the metrics topic of the MQTT transport, see upload.BatchUploader. It also
+has the free heap and its fragmentation, the reset cause, the crashes
+counted by supervisor.py, the WiFi signal and the time to connect. The
+phases start over after every summary, the counters count since the boot.
+"""
+import credentials
+import gc
+
+from array import array
+from utime import ticks_diff, ticks_us, time
+
+# phases
+SENSOR = 0
+ENCODE = 1
+HTTP = 2
+LEDS = 3
+UPLOAD = 4
+CYCLE = 5
+PHASES = ('sensor', 'encode', 'http', 'leds', 'upload', 'cycle')
+
+# counters
+HTTP_RETRIES = 0
+UPLOAD_FAILURES = 1
+SENSOR_FAILURES = 2
+CONFIG_FAILURES = 3
+RECOVERIES = 4
+LOOP_FAILURES = 5
+AGGREGATE_UPLOADED = 6
+AGGREGATE_SUPPRESSED = 7
+LATE_CYCLES = 8
+SKIPPED_SLOTS = 9
+COUNTERS = ('http_retries', 'upload_failures', 'sensor_failures',
+            'config_failures', 'recoveries', 'loop_failures',
+            'aggregate_uploaded', 'aggregate_suppressed', 'late_cycles',
+            'skipped_slots')
+
+INTERVAL = 3600
+
+count = array('i', bytes(4 * len(PHASES)))
+total_us = array('i', bytes(4 * len(PHASES)))
+max_us = array('i', bytes(4 * len(PHASES)))
+counters = array('i', bytes(4 * len(COUNTERS)))
+interval = getattr(credentials, 'metrics_interval', INTERVAL)
+_reported = time()
+
+
+def stop(phase, start):
+    """Record the time of a phase started at the ticks_us start."""
+    record(phase, ticks_diff(ticks_us(), start))
+
+
+def record(phase, duration_us):
+    """Record the duration of a phase in microseconds."""
+    count[phase] += 1
+    # Sums stop at the largest small int, after about 18 minutes.
+    total_us[phase] = min(total_us[phase] + duration_us, 0x3FFFFFFF)
+    if duration_us > max_us[phase]:
+        max_us[phase] = duration_us
+
+
+def increment(counter, count=1):
+    """Count a retry or failure, count times."""
+    counters[counter] += count
+
+
+def due():
+    """Return True if a summary should be sent."""
+    return bool(interval) and time() - _reported >= interval
+
+
+def fragmentation():
+    """
+    Return the free heap and the largest free block in bytes.
+
+    The largest block is found by bisecting allocations, which takes a few
+    milliseconds, so it is only measured for a summary.
+    """
+    gc.collect()
+    free = gc.mem_free()
+    low = 0
+    high = free
+    while high - low > 64:
+        size = (low + high) // 2
+        try:
+            block = bytearray(size)
+            del block
+            low = size
+        except MemoryError:
+            high = size
+    return free, low
+
+
+def summary():
+    """Return the summary of the metrics as a dict."""
+    import machine
+    import supervisor
+    from uploadformat import EPOCH_OFFSET
+    from wifi import wifi_stat
+    free, largest = fragmentation()
+    phases = {}
+    for i in range(len(PHASES)):
+        if count[i]:
+            phases[PHASES[i]] = [count[i], total_us[i] // count[i],
+                                 max_us[i]]
+    data = {
+        'timestamp': time() + EPOCH_OFFSET,
+        'reset': machine.reset_cause(),
+        'crashes': supervisor.load().get('crashes', {}),
+        'mem_free': free,
+        'mem_frag': 100 - 100 * largest // max(1, free),
+        'phases': phases,
+        'counters': dict(zip(COUNTERS, counters)),
+        'wifi_ms': wifi_stat.connect_ms,
+        'wifi_attempts': wifi_stat.attempts,
+        'wifi_failures': wifi_stat.failures,
+    }
+    try:
+        data['rssi'] = wifi_stat.station.status('rssi')
+    except (OSError, TypeError, ValueError):
+        pass
+    return data
+
+
+def reset():
+    """Start the next period of the phases."""
+    global _reported
+    for i in range(len(PHASES)):
+        count[i] = 0
+        total_us[i] = 0
+        max_us[i] = 0
+    _reported = time()
+
+
+def report(uploader):
+    """Send a summary with the uploader if one is due."""
+    global _reported
+    if not due():
+        return
+    import ujson
+    if uploader.send_metrics(ujson.dumps(summary())):
+        reset()
+    else:
+        # Keep the phases and try again after the next interval.
+        _reported = time()
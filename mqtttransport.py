@@ -0,0 +1,143 @@
+"""MQTT transport of the readings, an alternative to the REST API."""
+import credentials
+import ujson
+
+from umqtt.simple import MQTTClient, MQTTException
+from utime import ticks_diff, ticks_ms
+
+
+class MQTTTransport():
+    """
+    Publish readings to a broker and receive the controller data from it.
+
+    The station keeps one persistent session (clean_session=False) with the
+    broker and publishes every upload as a JSON batch, the body of a REST
+    batch, to <prefix>/<station ID>/readings with QoS 0 or 1. With QoS 1
+    the publish waits for the PUBACK of the broker. The summaries of
+    metrics.py go to <prefix>/<station ID>/metrics.
+
+    The station subscribes to <prefix>/<station ID>/config. A message on it
+    has the JSON of the controller data of the API, so new critical values
+    and a new measureDuration are pushed instead of polled. Publish it
+    retained to reach stations which are asleep or offline.
+
+    Broken connections raise OSError and are opened again on the next use,
+    like the HTTP client. Between the cycles the station calls keep_alive()
+    at least every half keepalive, so a measureDuration longer than the
+    keepalive does not lose the connection at the broker.
+    """
+
+    PORT = 1883
+    KEEPALIVE = 60
+    PREFIX = 'tempstation'
+
+    def __init__(self, station_id, client_id, server, port=PORT, user=None,
+                 password=None, qos=0, keepalive=KEEPALIVE, prefix=PREFIX):
+        """Prepare the transport of the station, connect on first use."""
+        self.client = MQTTClient(client_id, server, port, user, password,
+                                 keepalive)
+        self.client.set_callback(self._receive)
+        self.qos = qos
+        self.keepalive = keepalive
+        self.readings_topic = '{}/{}/readings'.format(prefix, station_id)
+        self.config_topic = '{}/{}/config'.format(prefix, station_id)
+        self.metrics_topic = '{}/{}/metrics'.format(prefix, station_id)
+        self.connected = False
+        self.connects = 0
+        self.published = 0
+        self.config = None
+        self._active = 0
+
+    def connect(self):
+        """Open the session and subscribe to the config topic."""
+        try:
+            resumed = self.client.connect(clean_session=False)
+            if not resumed:
+                # The broker lost the session and its subscription.
+                self.client.subscribe(self.config_topic, 1)
+        except MQTTException as err:
+            self.close()
+            raise OSError('MQTT connect refused {}'.format(err))
+        self.connected = True
+        self.connects += 1
+        self._active = ticks_ms()
+        print("Connected to the MQTT broker, session resumed:", resumed)
+
+    def close(self):
+        """Close the connection, the broker keeps the session."""
+        try:
+            self.client.sock.close()
+        except (AttributeError, OSError):
+            pass
+        self.connected = False
+
+    def publish(self, payload, topic=None):
+        """Publish an upload, raise OSError if it was not sent."""
+        if topic is None:
+            topic = self.readings_topic
+        if not self.connected:
+            self.connect()
+        try:
+            self.client.publish(topic, payload, qos=self.qos)
+        except (OSError, MQTTException) as err:
+            self.close()
+            raise OSError('MQTT publish failed {}'.format(err))
+        self.published += 1
+        self._active = ticks_ms()
+
+    def keep_alive(self):
+        """
+        Handle a pending message without blocking.
+
+        Sends a ping if the connection was idle for half the keepalive. A
+        closed connection stays closed until the next use.
+        """
+        if not self.connected:
+            return
+        try:
+            self.client.check_msg()
+            if self.keepalive and ticks_diff(
+                    ticks_ms(), self._active) >= self.keepalive * 500:
+                self.client.ping()
+                self._active = ticks_ms()
+        except (OSError, MQTTException) as err:
+            print("MQTT connection lost:", err)
+            self.close()
+
+    def poll_config(self):
+        """
+        Handle the pending messages without blocking.
+
+        Returns the controller data of the last config message received or
+        None.
+        """
+        if not self.connected:
+            try:
+                self.connect()
+            except OSError as err:
+                print("MQTT connection lost:", err)
+        self.keep_alive()
+        config = self.config
+        self.config = None
+        return config
+
+    def _receive(self, topic, msg):
+        """Keep the controller data of a config message."""
+        if topic.decode() != self.config_topic:
+            return
+        try:
+            self.config = ujson.loads(msg)
+        except ValueError:
+            print("Ignored invalid config message.")
+
+
+def create_transport(station_id, client_id):
+    """Return a transport configured by the credentials."""
+    return MQTTTransport(
+        station_id, client_id, credentials.mqtt_broker,
+        getattr(credentials, 'mqtt_port', MQTTTransport.PORT),
+        getattr(credentials, 'mqtt_user', None),
+        getattr(credentials, 'mqtt_password', None),
+        getattr(credentials, 'mqtt_qos', 0),
+        getattr(credentials, 'mqtt_keepalive', MQTTTransport.KEEPALIVE),
+        getattr(credentials, 'mqtt_prefix', MQTTTransport.PREFIX))
@@ -1,18 +1,25 @@
 # 1-Wire driver for MicroPython
 # MIT license; Copyright (c) 2016 Damien P. George
 
+import micropython
 from micropython import const
 import _onewire as _ow
 
+_SEARCH_ROM = const(0xf0)
+_MATCH_ROM = const(0x55)
+_SKIP_ROM = const(0xcc)
+_ALARM_SEARCH = const(0xec)
+
 
 class OneWireError(Exception):
     pass
 
 
 class OneWire:
-    SEARCH_ROM = const(0xf0)
-    MATCH_ROM = const(0x55)
-    SKIP_ROM = const(0xcc)
+    SEARCH_ROM = _SEARCH_ROM
+    MATCH_ROM = _MATCH_ROM
+    SKIP_ROM = _SKIP_ROM
+    ALARM_SEARCH = _ALARM_SEARCH
 
     def __init__(self, pin):
         self.pin = pin
@@ -30,9 +37,12 @@ class OneWire:
     def readbyte(self):
         return _ow.readbyte(self.pin)
 
+    @micropython.native
     def readinto(self, buf):
+        pin = self.pin
+        readbyte = _ow.readbyte
         for i in range(len(buf)):
-            buf[i] = _ow.readbyte(self.pin)
+            buf[i] = readbyte(pin)
 
     def writebit(self, value):
         return _ow.writebit(self.pin, value)
@@ -40,54 +50,68 @@ class OneWire:
     def writebyte(self, value):
         return _ow.writebyte(self.pin, value)
 
+    @micropython.native
     def write(self, buf):
-        for b in buf:
-            _ow.writebyte(self.pin, b)
+        pin = self.pin
+        writebyte = _ow.writebyte
+        for i in range(len(buf)):
+            writebyte(pin, buf[i])
 
     def select_rom(self, rom):
         self.reset()
-        self.writebyte(MATCH_ROM)
+        self.writebyte(_MATCH_ROM)
         self.write(rom)
 
     def scan(self):
-        devices = []
+        return list(self.iscan())
+
+    def alarm_scan(self):
+        # devices with an alarm condition, e.g. a DS18B20 out of its limits
+        return list(self.iscan(_ALARM_SEARCH))
+
+    def iscan(self, command=_SEARCH_ROM):
+        # Yields the ROMs one by one. The search state is kept in the
+        # generator, so a scan can be stopped and resumed between devices,
+        # also while another scan runs. The ROM is searched in place.
         diff = 65
-        rom = False
+        rom = bytearray(8)
         for i in range(0xff):
-            rom, diff = self._search_rom(rom, diff)
-            if rom:
-                devices += [rom]
+            found, diff = self._search_rom(rom, diff, command)
+            if found:
+                yield bytes(rom)
             if diff == 0:
                 break
-        return devices
 
-    def _search_rom(self, l_rom, diff):
+    @micropython.native
+    def _search_rom(self, rom, diff, command=_SEARCH_ROM):
+        # rom holds the last ROM found and is replaced by the next one, a
+        # byte is only written after its bits are searched.
         if not self.reset():
-            return None, 0
-        self.writebyte(SEARCH_ROM)
-        if not l_rom:
-            l_rom = bytearray(8)
-        rom = bytearray(8)
+            return False, 0
+        self.writebyte(command)
+        pin = self.pin
+        readbit = _ow.readbit
+        writebit = _ow.writebit
         next_diff = 0
         i = 64
         for byte in range(8):
             r_b = 0
             for bit in range(8):
-                b = self.readbit()
-                if self.readbit():
-                    if b: # there are no devices or there is an error on the bus
-                        return None, 0
+                b = readbit(pin)
+                if readbit(pin):
+                    if b:  # there are no devices or there is an error on the bus
+                        return False, 0
                 else:
-                    if not b: # collision, two devices with different bit meaning
-                        if diff > i or ((l_rom[byte] & (1 << bit)) and diff != i):
+                    if not b:  # collision, two devices with different bit meaning
+                        if diff > i or ((rom[byte] & (1 << bit)) and diff != i):
                             b = 1
                             next_diff = i
-                self.writebit(b)
+                writebit(pin, b)
                 if b:
                     r_b |= 1 << bit
                 i -= 1
             rom[byte] = r_b
-        return rom, next_diff
+        return True, next_diff
 
     def crc8(self, data):
         return _ow.crc8(data)
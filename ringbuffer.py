@@ -0,0 +1,172 @@
+"""A ring buffer of readings on flash for store and forward."""
+import ustruct
+
+# marker, sequence number, timestamp, unitId, sensor tag,
+# value in hundredths, CRC
+RECORD_FORMAT = '<BIIHHiB'
+RECORD_SIZE = 18
+MARKER = 0xA6
+
+
+def crc8(data, length):
+    """Return the Dallas/Maxim CRC-8 of the first length bytes."""
+    crc = 0
+    for i in range(length):
+        byte = data[i]
+        for bit in range(8):
+            mix = (crc ^ byte) & 0x01
+            crc >>= 1
+            if mix:
+                crc ^= 0x8C
+            byte >>= 1
+    return crc
+
+
+class RingBuffer():
+    """
+    Fixed-size, append-only ring buffer of readings in a file.
+
+    Every reading is one 18 byte record with a sequence number and a CRC.
+    The file never grows: when it is full the oldest records are
+    overwritten. The sequence number of the last uploaded record is kept
+    in a small extra file, which is only written after ACK_EVERY uploaded
+    readings and on close(). After a reset up to ACK_EVERY readings are
+    uploaded again, the API stores a reading with the same timestamp once.
+    After a power loss the buffer is recovered by scanning the records,
+    torn records fail their CRC and are ignored.
+    """
+
+    FILE = 'readings.bin'
+    SLOTS = 256
+    ACK_EVERY = 32
+
+    def __init__(self, path=FILE, slots=SLOTS):
+        """Open or create the buffer file and recover its state."""
+        self.path = path
+        self.ack_path = path + '.ack'
+        self.slots = slots
+        self._record = bytearray(RECORD_SIZE)
+        try:
+            self.file = open(path, 'r+b')
+        except OSError:
+            self.file = open(path, 'w+b')
+        self.file.seek(0, 2)
+        size = self.file.tell()
+        if size < slots * RECORD_SIZE:
+            # Fill the file up front, so appending never grows it.
+            blank = bytes(RECORD_SIZE)
+            for i in range(size // RECORD_SIZE, slots):
+                self.file.write(blank)
+            self.file.flush()
+        self.head = self._recover()
+        self.acked = self._read_ack()
+        if self.acked > self.head:
+            self.acked = self.head
+        self.saved = self.acked
+
+    def __len__(self):
+        """Return the number of readings not uploaded yet."""
+        return min(self.head - self.acked, self.slots)
+
+    def append(self, readings, count):
+        """Write count (timestamp, unitId, value, sensor) in one pass."""
+        if not count:
+            return
+        record = self._record
+        self.file.seek((self.head + 1) % self.slots * RECORD_SIZE)
+        for i in range(0, 4 * count, 4):
+            self.head += 1
+            slot = self.head % self.slots
+            if slot == 0:
+                self.file.seek(0)
+            ustruct.pack_into(RECORD_FORMAT, record, 0, MARKER, self.head,
+                              readings[i], readings[i + 1], readings[i + 3],
+                              readings[i + 2], 0)
+            record[RECORD_SIZE - 1] = crc8(record, RECORD_SIZE - 1)
+            self.file.write(record)
+        self.file.flush()
+        evicted = self.head - self.acked - self.slots
+        if evicted > 0:
+            print("Reading buffer full, dropped", evicted, "readings.")
+            self.acked += evicted
+
+    def peek(self, readings, count):
+        """
+        Copy up to count of the oldest pending readings into readings.
+
+        Returns the number of copied (timestamp, unitId, value, sensor)
+        readings and the sequence number of the last one.
+        """
+        copied = 0
+        last = seq = self.head - len(self) + 1
+        while seq <= self.head and copied < count:
+            if self._read(seq, readings, 4 * copied):
+                copied += 1
+                last = seq
+            seq += 1
+        return copied, last
+
+    def ack(self, seq):
+        """Mark all readings up to the sequence number as uploaded."""
+        if seq <= self.acked:
+            return
+        self.acked = seq
+        if seq - self.saved >= self.ACK_EVERY:
+            self.save_ack()
+
+    def save_ack(self):
+        """Write the last uploaded sequence number to flash."""
+        if self.acked == self.saved:
+            return
+        with open(self.ack_path, 'wb') as ack:
+            ack.write(ustruct.pack('<I', self.acked))
+        self.saved = self.acked
+
+    def close(self):
+        """Save the acks and close the buffer file."""
+        self.save_ack()
+        self.file.close()
+
+    def _read(self, seq, readings, index):
+        """Copy the record of the sequence number, False if invalid."""
+        record = self._record
+        self.file.seek(seq % self.slots * RECORD_SIZE)
+        if self.file.readinto(record) != RECORD_SIZE:
+            return False
+        marker, record_seq, timestamp, unit_id, sensor, value, crc = \
+            ustruct.unpack_from(RECORD_FORMAT, record)
+        if marker != MARKER or record_seq != seq or \
+                crc != crc8(record, RECORD_SIZE - 1):
+            return False
+        readings[index] = timestamp
+        readings[index + 1] = unit_id
+        readings[index + 2] = value
+        readings[index + 3] = sensor
+        return True
+
+    def _recover(self):
+        """Return the highest valid sequence number in the file."""
+        head = 0
+        record = self._record
+        self.file.seek(0)
+        for slot in range(self.slots):
+            if self.file.readinto(record) != RECORD_SIZE:
+                break
+            marker, seq, _, _, _, _, crc = \
+                ustruct.unpack_from(RECORD_FORMAT, record)
+            if marker == MARKER and seq > head and \
+                    seq % self.slots == slot and \
+                    crc == crc8(record, RECORD_SIZE - 1):
+                head = seq
+        return head
+
+    def _read_ack(self):
+        """Return the last uploaded sequence number."""
+        try:
+            with open(self.ack_path, 'rb') as ack:
+                data = ack.read(4)
+        except OSError:
+            return 0
+        if len(data) != 4:
+            return 0
+        return ustruct.unpack('<I', data)[0]
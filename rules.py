@@ -0,0 +1,164 @@
+"""
+Alert rules on the readings of a station, on the board and the server.
+
+The critical values of the API give the limits of a value. A channel, one
+value of one device, is broken
+
+- LOW below its minimum or HIGH above its maximum; it is fine again only
+  once it is back inside the limits by the hysteresis,
+- RATE if it changed faster than the rate per minute since its last
+  reading.
+
+A change of the flags of a channel takes effect once it held for the hold
+time, so a value oscillating around a limit does not flap. The hysteresis,
+hold time and rate of a critical value are set per critical value id in
+credentials.alert_rules, in the units of the API and seconds:
+
+    alert_rules = {1: (0.5, 120, 2.0), 11: (1, 0, 0)}
+
+Without settings the limits are checked like plain comparisons. All state
+is kept in preallocated arrays, so evaluating allocates nothing. The module
+is plain Python, host/ingest_server.py evaluates the same rules for every
+station as readings arrive.
+"""
+from array import array
+
+LOW = 1
+HIGH = 2
+RATE = 4
+
+# Limit of a value without critical value.
+NO_LIMIT = 0x3FFFFFFF
+# Readings further apart are not compared for the rate.
+RATE_WINDOW = 3600
+
+# Critical value id of each unitId, like the UNITS of the sensors.
+CRITICAL_IDS = {1: 1, 2: 2, 3: 11}
+
+
+def to_hundredths(value):
+    """Return a value in the units of the API as an integer in hundredths."""
+    return int(round(float(value) * 100))
+
+
+def limits(critical_values):
+    """Return critical values of the API in hundredths."""
+    result = {}
+    for critical_id in critical_values:
+        low, high = critical_values[critical_id]
+        result[critical_id] = (to_hundredths(low), to_hundredths(high))
+    return result
+
+
+def settings(alert_rules):
+    """Return alert rules in the units of the API in hundredths."""
+    result = {}
+    for critical_id in alert_rules:
+        hysteresis, hold, rate = alert_rules[critical_id]
+        result[critical_id] = (to_hundredths(hysteresis), int(hold),
+                               to_hundredths(rate))
+    return result
+
+
+class Evaluator():
+    """
+    The rules of the channels of one station and their state.
+
+    A channel is given by the id of its critical value. Limits and rule
+    settings are in hundredths, see limits() and settings(), timestamps in
+    seconds. Readings older than the last one of a channel, e.g. forwarded
+    from a buffer, leave the state alone.
+    """
+
+    def __init__(self, critical_ids=()):
+        """Prepare channels of the given critical value ids."""
+        self.critical_ids = []
+        self.low = array('i')
+        self.high = array('i')
+        self.hysteresis = array('i')
+        self.hold = array('i')
+        self.rate = array('i')
+        self.last = array('i')
+        self.seen = array('i')
+        self.since = array('i')
+        self.active = bytearray()
+        self.pending = bytearray()
+        for critical_id in critical_ids:
+            self.add_channel(critical_id)
+
+    def add_channel(self, critical_id, limit=None, rule=None):
+        """Add a channel without state, return its index."""
+        self.critical_ids.append(critical_id)
+        for values in (self.low, self.high, self.hysteresis, self.hold,
+                       self.rate, self.last, self.seen, self.since):
+            values.append(0)
+        self.active.append(0)
+        self.pending.append(0)
+        index = len(self.critical_ids) - 1
+        self._set(index, limit, rule)
+        return index
+
+    def configure(self, limits, rules=None):
+        """
+        Set the limits and rules of all channels, keeping their state.
+
+        limits and rules are dicts by critical value id, see limits() and
+        settings().
+        """
+        rules = rules or {}
+        for index in range(len(self.critical_ids)):
+            critical_id = self.critical_ids[index]
+            self._set(index, limits.get(critical_id),
+                      rules.get(critical_id))
+
+    def _set(self, index, limit, rule):
+        """Set the limit and rule of a channel."""
+        if limit is None:
+            limit = (-NO_LIMIT, NO_LIMIT)
+        if rule is None:
+            rule = (0, 0, 0)
+        self.low[index], self.high[index] = limit
+        self.hysteresis[index], self.hold[index], self.rate[index] = rule
+
+    def update(self, index, value, now):
+        """Evaluate a reading of a channel, return its flags."""
+        flags = self.active[index]
+        seen = self.seen[index]
+        if seen and now < seen:
+            return flags
+        target = 0
+        if value > self.high[index] or (
+                flags & HIGH and
+                value > self.high[index] - self.hysteresis[index]):
+            target = HIGH
+        elif value < self.low[index] or (
+                flags & LOW and
+                value < self.low[index] + self.hysteresis[index]):
+            target = LOW
+        rate = self.rate[index]
+        elapsed = now - seen
+        if rate and seen and 0 < elapsed <= RATE_WINDOW and \
+                abs(value - self.last[index]) * 60 > rate * elapsed:
+            target |= RATE
+        self.last[index] = value
+        self.seen[index] = now
+        if target == flags:
+            self.pending[index] = flags
+            return flags
+        if target != self.pending[index]:
+            self.pending[index] = target
+            self.since[index] = now
+        if now - self.since[index] >= self.hold[index]:
+            self.active[index] = target
+            return target
+        return flags
+
+    def state(self, index):
+        """Return the state of a channel to restore it later."""
+        return (self.active[index], self.pending[index], self.since[index],
+                self.seen[index], self.last[index])
+
+    def restore(self, index, state):
+        """Restore the state of a channel."""
+        self.active[index], self.pending[index], self.since[index], \
+            self.seen[index], self.last[index] = state
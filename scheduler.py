@@ -0,0 +1,53 @@
+"""Fixed-rate scheduling of the measuring cycles."""
+import metrics
+
+from utime import sleep_ms, ticks_add, ticks_diff, ticks_ms
+
+
+class FixedRateScheduler():
+    """
+    Run a task at a fixed rate anchored to ticks_ms.
+
+    The slots are spaced exactly `period_ms` apart, independent of how long
+    the task took, so the time spent measuring and uploading does not add
+    up. A cycle that starts after its slot is counted as late. If a cycle
+    runs past one or more following slots, those slots are skipped, counted
+    as overruns and the schedule continues with the next slot in the future.
+    Both are counted in metrics.py, as late_cycles and skipped_slots.
+    """
+
+    def __init__(self, period_ms, sleep=sleep_ms):
+        """
+        Start the schedule with its first slot now.
+
+        sleep waits the given milliseconds, e.g. while feeding a watchdog.
+        """
+        self.period_ms = max(1, period_ms)
+        self.sleep = sleep
+        self.next_slot = ticks_ms()
+        self.cycles = 0
+        self.lateness_ms = 0
+
+    def set_period(self, period_ms):
+        """Change the period, starting with the next slot."""
+        self.period_ms = max(1, period_ms)
+
+    def wait(self):
+        """Sleep until the next slot and move the schedule on."""
+        delay = ticks_diff(self.next_slot, ticks_ms())
+        if delay > 0:
+            self.sleep(delay)
+            self.lateness_ms = 0
+        else:
+            self.lateness_ms = -delay
+            if self.cycles and self.lateness_ms:
+                metrics.increment(metrics.LATE_CYCLES)
+            missed = self.lateness_ms // self.period_ms
+            if missed:
+                # Coalesce the missed slots into this one.
+                metrics.increment(metrics.SKIPPED_SLOTS, missed)
+                print("Skipped", missed, "measuring slots.")
+                self.next_slot = ticks_add(
+                    self.next_slot, missed * self.period_ms)
+        self.next_slot = ticks_add(self.next_slot, self.period_ms)
+        self.cycles += 1
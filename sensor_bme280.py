@@ -0,0 +1,47 @@
+"""BME280 backend of the station, see station.py."""
+import bme280_int
+import credentials
+import machine
+import sensorarray
+
+from array import array
+
+
+class Sensor():
+    """
+    All BME280 on the I2C bus at GPIO0 (SCL) and GPIO4 (SDA).
+
+    The bus is scanned for the sensors, also behind a multiplexer at
+    credentials.bme280_mux (see sensorarray.py). Oversampling, power mode,
+    IIR filter and standby time may be given as credentials.bme280_settings,
+    e.g. {'power_mode': bme280.BME280_MODE_NORMAL}.
+    """
+
+    # temperature, pressure and humidity, the order of BME280.read_values
+    UNITS = ((1, 1), (3, 11), (2, 2))
+
+    def __init__(self, devices=None):
+        """Set up the sensors, known devices skip the scan."""
+        i2c = machine.I2C(scl=machine.Pin(0), sda=machine.Pin(4))
+        self.array = sensorarray.BME280Array(
+            i2c, devices, getattr(credentials, 'bme280_mux', None),
+            bme280_int.Compensator,
+            **getattr(credentials, 'bme280_settings', {}))
+        self.values = array('i', bytes(12 * len(self.array)))
+        self.valid = self.array.valid
+        self.tags = self.array.tags
+
+    @property
+    def devices(self):
+        """The channels, addresses and calibrations of the sensors."""
+        return self.array.devices
+
+    def measure(self):
+        """Measure with all sensors at once."""
+        results = self.array.measure()
+        values = self.values
+        for i in range(len(results)):
+            result = results[i]
+            values[3 * i] = result[0]
+            values[3 * i + 1] = result[1]
+            values[3 * i + 2] = result[2]
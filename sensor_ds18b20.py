@@ -0,0 +1,23 @@
+"""DS18B20 backend of the station, see station.py."""
+import ds18b20
+
+from machine import Pin
+
+
+class Sensor():
+    """All DS18B20 probes on the 1-Wire bus at GPIO4."""
+
+    # temperature
+    UNITS = ((1, 1),)
+
+    def __init__(self, devices=None):
+        """Scan the bus, the probes need no state over a deep sleep."""
+        self.bus = ds18b20.DS18B20Bus(Pin(4))
+        self.values = self.bus.results
+        self.valid = self.bus.valid
+        self.tags = self.bus.tags
+        self.devices = ()
+
+    def measure(self):
+        """Measure with all probes at once."""
+        self.bus.measure()
@@ -0,0 +1,144 @@
+"""All BME280 sensors on an I2C bus, measured in one cycle."""
+import bme280
+
+from array import array
+from uploadformat import format_tag
+from utime import sleep_us
+
+# The addresses a BME280 can be wired to.
+BME280_ADDRESSES = (0x76, 0x77)
+
+# Channel of the devices which are not behind a multiplexer.
+NO_CHANNEL = 0xFF
+
+
+def sensor_tag(channel, address):
+    """Return the tag of a device, see uploadformat.format_tag."""
+    if channel == NO_CHANNEL:
+        return address
+    return (channel + 1) << 8 | address
+
+
+class BME280Array():
+    """
+    A BME280 driver for every sensor on the bus.
+
+    The bus is scanned for the BME280 addresses, also on every channel of a
+    TCA9548A multiplexer if its address is given. The calibration of every
+    device is read once and kept in its driver.
+
+    A measuring cycle triggers the forced conversions of all sensors first,
+    waits once and then burst-reads every sensor, so N sensors take about
+    the conversion time of one. A sensor which does not answer, e.g. with
+    a NACK, is marked in valid and the others still report.
+    """
+
+    MUX_CHANNELS = 8
+
+    def __init__(self, i2c, devices=None, mux_address=None, compensator=None,
+                 **settings):
+        """
+        Set up a driver for every device.
+
+        devices is a list of (channel, address, calibration) as returned by
+        the devices property, e.g. kept over a deep sleep, which skips the
+        scan and the calibration reads. settings are passed to the drivers.
+        """
+        self.i2c = i2c
+        self.mux_address = mux_address
+        self._channel = None
+        self._mux_buf = bytearray(1)
+        if devices is None:
+            devices = [(channel, address, None)
+                       for channel, address in self.scan()]
+        if not devices:
+            raise OSError('No BME280 found on the I2C bus.')
+        self.sensors = []
+        self.channels = []
+        self.tags = []
+        self.results = []
+        for channel, address, calibration in devices:
+            self._select(channel)
+            self.sensors.append(bme280.BME280(
+                i2c=i2c, address=address, calibration=calibration,
+                compensator=compensator, **settings))
+            self.channels.append(channel)
+            self.tags.append(sensor_tag(channel, address))
+            self.results.append(array('i', (0, 0, 0)))
+        self.valid = bytearray(len(self.sensors))
+        print("Found", len(self.sensors), "BME280:",
+              [format_tag(tag) for tag in self.tags])
+
+    def __len__(self):
+        """Return the number of sensors."""
+        return len(self.sensors)
+
+    @property
+    def devices(self):
+        """The (channel, address, calibration) of every device."""
+        return [(self.channels[i], self.sensors[i].address,
+                 self.sensors[i].calibration)
+                for i in range(len(self.sensors))]
+
+    def scan(self):
+        """Return the (channel, address) of all BME280 on the bus."""
+        channels = (NO_CHANNEL,)
+        if self.mux_address is not None:
+            channels = range(self.MUX_CHANNELS)
+        found = []
+        for channel in channels:
+            self._select(channel)
+            for address in self.i2c.scan():
+                if address in BME280_ADDRESSES:
+                    found.append((channel, address))
+        return found
+
+    def measure(self):
+        """
+        Measure with all sensors.
+
+        Returns the list of results, one array of temperature, pressure and
+        humidity in hundredths per sensor, see BME280.read_values. valid[i]
+        is 0 if sensor i could not be read, OSError is raised if no sensor
+        could.
+        """
+        sensors = self.sensors
+        valid = self.valid
+        count = len(sensors)
+        waited = 0
+        answered = 0
+        for i in range(count):
+            valid[i] = 0
+            try:
+                self._select(self.channels[i])
+                sensors[i].start_measurement()
+            except OSError as err:
+                print("BME280", format_tag(self.tags[i]), "failed:", err)
+                continue
+            valid[i] = 1
+            if sensors[i].measure_time_us > waited:
+                waited = sensors[i].measure_time_us
+        sleep_us(waited)
+        for i in range(count):
+            if not valid[i]:
+                continue
+            try:
+                self._select(self.channels[i])
+                sensors[i].wait_measurement(waited)
+                sensors[i].read_values(self.results[i], False)
+            except OSError as err:
+                print("BME280", format_tag(self.tags[i]), "failed:", err)
+                valid[i] = 0
+                continue
+            answered += 1
+        if not answered:
+            raise OSError('No BME280 answered.')
+        return self.results
+
+    def _select(self, channel):
+        """Switch the multiplexer to the channel of a device."""
+        if channel == NO_CHANNEL or channel == self._channel:
+            return
+        self._mux_buf[0] = 1 << channel
+        self.i2c.writeto(self.mux_address, self._mux_buf)
+        self._channel = channel
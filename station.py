@@ -0,0 +1,400 @@
+"""
+The tempstation core, posting the data of any sensor to the API.
+
+The sensor and the LEDs of a board are pluggable backends chosen by name,
+by the arguments of main() or by credentials.sensor and credentials.leds:
+
+- sensor: 'dht22', 'bme280' or 'ds18b20', see sensor_<name>.py
+- leds: None, 'rgb' or 'red_green', see ledsignal.py
+
+Backends are imported only when they are chosen, so a board loads only the
+drivers it uses, the same holds for the aggregation and the deep sleep.
+The station runs under a supervisor.Supervisor, which feeds the watchdog
+and recovers the sensor and WiFi when they fail.
+"""
+import controller
+import credentials
+import gc
+import metrics
+import rules
+import scheduler
+import supervisor
+import upload
+
+from machine import Pin
+from utime import sleep, ticks_us, time
+
+# Bits of the broken critical values given to the LED signal.
+BROKEN_TEMPERATURE = 1
+BROKEN_HUMIDITY = 2
+BROKEN_PRESSURE = 4
+
+# API ids of the critical values: the station attributes of their limits
+# and their bit
+CRITICAL_VALUES = {
+    1: ('TEMP_MIN', 'TEMP_MAX', BROKEN_TEMPERATURE),
+    2: ('HUM_MIN', 'HUM_MAX', BROKEN_HUMIDITY),
+    11: ('PRES_MIN', 'PRES_MAX', BROKEN_PRESSURE),
+}
+
+
+def load_sensor(name, devices=None):
+    """Import the sensor backend of the given name and set it up."""
+    module = __import__('sensor_' + name)
+    return module.Sensor(devices)
+
+
+def load_signal(name, blink_ms=1000):
+    """Import the LED backend of the given name, None for no LEDs."""
+    if not name:
+        return None
+    import ledsignal
+    return ledsignal.BACKENDS[name](blink_ms)
+
+
+class Tempstation():
+    """
+    Tempstation according to the Tempstation API.
+
+    A sensor backend measures one or more devices. It has the attributes
+
+    - UNITS: (unitId, critical value id) of every value of a device
+    - values: array of the values in hundredths, device after device
+    - valid: 0 for every device which could not be read
+    - tags: sensor tag of every device, see uploadformat.format_tag
+    - devices: state kept over a deep sleep, see dutycycle.py
+
+    and measure() to fill values and valid. An LED backend has check() and
+    show(broken) methods, which return immediately, a busy property and
+    stop().
+    """
+
+    MAC_ADDRESS = None
+    LED_ACTIVITY = None
+    SENSOR = None
+    SIGNAL = None
+    ID = 0
+    TEMP_MIN = 0
+    TEMP_MAX = 0
+    HUM_MIN = 0
+    HUM_MAX = 0
+    PRES_MIN = 0
+    PRES_MAX = 0
+    INTERVAL = 0
+    UPLOADER = None
+    CONFIG = None
+    AGGREGATOR = None
+    RULES = None
+    SUPERVISOR = None
+
+    def __init__(self):
+        """Prepare the station, the onboard LED shows uploads."""
+        from network import WLAN
+        from ubinascii import hexlify
+        self.MAC_ADDRESS = str(hexlify(WLAN().config('mac')).decode())
+        self.LED_ACTIVITY = Pin(2, Pin.OUT)
+        self.LED_ACTIVITY.on()
+        self._channels = ()
+        self._broken = 0
+        self._sensor_name = None
+
+    def set_up_leds(self, name, blink_ms=1000):
+        """Set up the LED backend, blinking for blink_ms."""
+        self.SIGNAL = load_signal(name, blink_ms)
+        print("Pins are set up.")
+
+    def check_leds(self):
+        """Check if the LEDs are working, without waiting for them."""
+        if self.SIGNAL is not None:
+            self.SIGNAL.check()
+            print("LED check started.")
+
+    def set_up_sensor(self, name, devices=None):
+        """Set up the sensor backend, known devices skip its scan."""
+        self._sensor_name = name
+        self.SENSOR = load_sensor(name, devices)
+        self._set_up_channels()
+        print("Sensor is set up.")
+
+    def reset_sensor(self):
+        """
+        Set the sensor backend up again, with a new bus and scan.
+
+        The rules and the aggregation only start over if other devices
+        answered than before.
+        """
+        tags = list(self.SENSOR.tags)
+        self.SENSOR = load_sensor(self._sensor_name)
+        if list(self.SENSOR.tags) != tags:
+            self._set_up_channels()
+            if self.AGGREGATOR is not None:
+                self.set_up_aggregation()
+        print("Sensor is set up again.")
+
+    def _set_up_channels(self):
+        """Prepare the channels and alert rules of the sensor values."""
+        channels = []
+        for unit_id, critical_id in self.SENSOR.UNITS:
+            min_name, max_name, bit = CRITICAL_VALUES[critical_id]
+            channels.append((unit_id, min_name, max_name, bit))
+        self._channels = tuple(channels)
+        critical_ids = []
+        for _ in self.SENSOR.tags:
+            for _, critical_id in self.SENSOR.UNITS:
+                critical_ids.append(critical_id)
+        self.RULES = rules.Evaluator(critical_ids)
+        self._configure_rules()
+
+    def _configure_rules(self):
+        """
+        Give the critical values to the alert rules.
+
+        The hysteresis, hold time and rate of the rules are set by
+        credentials.alert_rules, see rules.py.
+        """
+        limits = {}
+        for critical_id in CRITICAL_VALUES:
+            min_name, max_name, _ = CRITICAL_VALUES[critical_id]
+            limits[critical_id] = (getattr(self, min_name),
+                                   getattr(self, max_name))
+        self.RULES.configure(limits, rules.settings(
+            getattr(credentials, 'alert_rules', {})))
+
+    def set_up_aggregation(self):
+        """
+        Aggregate the readings before they are uploaded.
+
+        The sensor is sampled credentials.aggregate_samples times per
+        interval, the mean of a value is only uploaded if it changed by
+        more than credentials.deadbands, see aggregate.py. Without them
+        every reading is uploaded and aggregate.py is not loaded.
+        """
+        if getattr(credentials, 'aggregate_samples', 1) <= 1 and \
+                not getattr(credentials, 'deadbands', None):
+            return
+        import aggregate
+        units = []
+        tags = []
+        tagged = len(self.SENSOR.tags) > 1
+        for tag in self.SENSOR.tags:
+            for channel in self._channels:
+                units.append(channel[0])
+                tags.append(tag if tagged else 0)
+        self.AGGREGATOR = aggregate.create_aggregator(units, tags)
+
+    @property
+    def period_ms(self):
+        """The time between two measurements."""
+        if self.AGGREGATOR is None:
+            return self.INTERVAL * 1000
+        return self.INTERVAL * 1000 // self.AGGREGATOR.window
+
+    def initialize_controller_data(self):
+        """Assign controller values given by the API or cached on flash."""
+        self.CONFIG = controller.ControllerConfig(self.MAC_ADDRESS)
+        if not self.CONFIG.load():
+            self.CONFIG.refresh(force=True)
+        self._assign_controller_data()
+        self.UPLOADER = upload.create_uploader(self.ID, self.MAC_ADDRESS)
+
+    def update_controller_data(self):
+        """
+        Revalidate the controller values, return True if they changed.
+
+        With an MQTT transport the values are pushed by the broker and
+        only taken from its config messages instead of being polled.
+        """
+        if self.CONFIG is None:
+            self.CONFIG = controller.ControllerConfig(self.MAC_ADDRESS)
+            self.CONFIG.load()
+        transport = getattr(self.UPLOADER, 'transport', None)
+        if transport is not None:
+            api_data = transport.poll_config()
+            if api_data is None:
+                return False
+            try:
+                if not self.CONFIG.apply(api_data):
+                    return False
+            except (KeyError, TypeError):
+                print("Ignored incomplete controller data.")
+                return False
+        elif not self.CONFIG.refresh():
+            return False
+        self._assign_controller_data()
+        return True
+
+    def sleep_ms(self, duration_ms):
+        """
+        Sleep between the cycles, with the watchdog fed by the supervisor.
+
+        An MQTT connection is kept alive meanwhile, see
+        mqtttransport.MQTTTransport.keep_alive.
+        """
+        transport = getattr(self.UPLOADER, 'transport', None)
+        if transport is None or not transport.keepalive:
+            self.SUPERVISOR.sleep_ms(duration_ms)
+            return
+        step = transport.keepalive * 500
+        while duration_ms > 0:
+            self.SUPERVISOR.sleep_ms(min(step, duration_ms))
+            duration_ms -= step
+            transport.keep_alive()
+
+    def _assign_controller_data(self):
+        """Assign the controller values to the station in hundredths."""
+        config = self.CONFIG
+        self.ID = config.id
+        for unit_id in config.critical_values:
+            if unit_id not in CRITICAL_VALUES:
+                continue
+            min_value, max_value = config.critical_values[unit_id]
+            min_name, max_name, _ = CRITICAL_VALUES[unit_id]
+            setattr(self, min_name, rules.to_hundredths(min_value))
+            setattr(self, max_name, rules.to_hundredths(max_value))
+        self.INTERVAL = config.interval
+        if self.RULES is not None:
+            self._configure_rules()
+        print("Assigned controller values from the API.")
+
+    def measure_and_post(self):
+        """
+        Measure data of all devices and post to the API.
+
+        With more than one device every reading is tagged with its device.
+        Devices which could not be read are skipped, a failed measurement
+        is given to the supervisor and the cycle goes on without readings,
+        so the pending readings are still uploaded. The alert rules decide
+        which critical values are broken, see rules.py. With aggregation the
+        readings go through the aggregator, which is flushed early when
+        the broken critical values change or stay broken.
+        """
+        cycle_start = ticks_us()
+        sensor = self.SENSOR
+        aggregator = self.AGGREGATOR
+        channels = self._channels
+        count = len(channels)
+        self.LED_ACTIVITY.off()
+        measured = self._measure()
+        values = sensor.values
+        tagged = len(sensor.tags) > 1
+        evaluator = self.RULES
+        now = time()
+        # Without readings the LEDs keep their signal.
+        broken = 0 if measured else self._broken
+        for i in range(len(sensor.tags)):
+            if not measured or not sensor.valid[i]:
+                metrics.increment(metrics.SENSOR_FAILURES)
+                continue
+            tag = sensor.tags[i] if tagged else 0
+            first = i * count
+            for j in range(count):
+                unit_id, _, _, bit = channels[j]
+                value = values[first + j]
+                if aggregator is None:
+                    self.UPLOADER.add(value, unit_id, sensor=tag)
+                else:
+                    aggregator.add(first + j, value)
+                if evaluator.update(first + j, value, now):
+                    broken |= bit
+        window_closed = True
+        if aggregator is not None:
+            urgent = broken != 0 or broken != self._broken
+            window_closed = aggregator.end_sample(self.UPLOADER, urgent)
+        if window_closed:
+            start = ticks_us()
+            self.UPLOADER.end_cycle()
+            metrics.stop(metrics.UPLOAD, start)
+        self.LED_ACTIVITY.on()
+        # Between windows the LEDs only signal a change.
+        if self.SIGNAL is not None and \
+                (window_closed or broken != self._broken):
+            start = ticks_us()
+            self.SIGNAL.show(broken)
+            metrics.stop(metrics.LEDS, start)
+        self._broken = broken
+        metrics.stop(metrics.CYCLE, cycle_start)
+
+    def _measure(self):
+        """Measure with the sensor, return False if it failed."""
+        start = ticks_us()
+        try:
+            self.SENSOR.measure()
+        except MemoryError:
+            raise
+        except Exception as err:
+            # e.g. a DHT22 timeout or checksum error, an I2C NACK or a
+            # OneWireError, the drivers raise plain exceptions
+            print("Measurement failed:", repr(err))
+            if self.SUPERVISOR is not None:
+                self.SUPERVISOR.failed(supervisor.SENSOR, err)
+            return False
+        finally:
+            metrics.stop(metrics.SENSOR, start)
+        if self.SUPERVISOR is not None:
+            self.SUPERVISOR.succeeded(supervisor.SENSOR)
+        return True
+
+
+def main(sensor=None, leds=None):
+    """
+    Starter function.
+
+    Exceptions of a cycle are counted by the supervisor, see supervisor.py,
+    the ones of the set up are left to supervisor.run in boot.py.
+    """
+    if sensor is None:
+        sensor = getattr(credentials, 'sensor', 'dht22')
+    if leds is None:
+        leds = getattr(credentials, 'leds', None)
+    temp_stat = Tempstation()
+    guard = supervisor.Supervisor({
+        supervisor.SENSOR: temp_stat.reset_sensor,
+        supervisor.NETWORK: supervisor.reconnect_wifi,
+    })
+    temp_stat.SUPERVISOR = guard
+    if getattr(credentials, 'deep_sleep', False):
+        import dutycycle
+        # Short blinks, the board sleeps once they are shown.
+        temp_stat.set_up_leds(leds, dutycycle.BLINK_MS)
+        state = dutycycle.RTCState()
+        if dutycycle.woke_from_deepsleep() and state.load(temp_stat):
+            temp_stat.set_up_sensor(sensor, state.devices)
+            state.restore_rules(temp_stat)
+            temp_stat.update_controller_data()
+        else:
+            temp_stat.check_leds()
+            temp_stat.set_up_sensor(sensor)
+            temp_stat.initialize_controller_data()
+        guard.feed()
+        try:
+            temp_stat.measure_and_post()
+        except Exception as err:
+            # Sleep anyway, the next wake tries again.
+            guard.failed(supervisor.LOOP, err)
+        else:
+            guard.succeeded(supervisor.LOOP)
+        dutycycle.deepsleep(temp_stat, state)
+    temp_stat.set_up_leds(leds)
+    temp_stat.check_leds()
+    temp_stat.set_up_sensor(sensor)
+    temp_stat.initialize_controller_data()
+    temp_stat.set_up_aggregation()
+    sleep(2)
+    schedule = scheduler.FixedRateScheduler(temp_stat.period_ms,
+                                            temp_stat.sleep_ms)
+    while True:
+        schedule.wait()
+        guard.start_cycle()
+        try:
+            if temp_stat.update_controller_data():
+                schedule.set_period(temp_stat.period_ms)
+            guard.feed()
+            temp_stat.measure_and_post()
+            guard.feed()
+            metrics.report(temp_stat.UPLOADER)
+        except Exception as err:
+            guard.failed(supervisor.LOOP, err)
+        else:
+            guard.succeeded(supervisor.LOOP)
+        # Collect the garbage of the upload between the cycles.
+        gc.collect()
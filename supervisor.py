@@ -0,0 +1,265 @@
+"""
+Supervision of the station: watchdog, recovery and crash records.
+
+The station runs under a Supervisor. It starts the watchdog (machine.WDT)
+and feeds it between the steps of a cycle and at least every FEED_MS
+while the station waits for its next slot, so a hang anywhere resets the
+board after credentials.wdt_timeout seconds (WDT_TIMEOUT by default, 0
+turns it off). The watchdog needs a port which takes the timeout, like
+the ESP32. The one of the ESP8266 is fixed to a few seconds, shorter than
+an HTTP timeout or a WiFi connect, so it is not armed there and only the
+watchdog of the SDK guards the board.
+
+Failures are counted per subsystem:
+
+- SENSOR: a measurement failed, e.g. a DHT22 checksum or an I2C NACK
+- NETWORK: the WiFi connection is lost
+- LOOP: any other exception of a cycle
+
+A subsystem which failed RECOVER_AFTER times in a row is recovered on its
+own, the others keep running: the sensor is set up again with a new bus
+and scan, WiFi is connected again. Further attempts wait with exponential
+backoff. The readings stay with the uploader meanwhile, so flaky WiFi
+only delays them. Only LOOP failures have a budget, after
+credentials.loop_budget of them in a row the board is reset.
+
+run() starts the main() of a station in boot.py. An exception escaping it,
+a reset for the budget and a watchdog reset are counted in a record on
+flash which survives resets and power losses. After such a crash the next
+boot waits with backoff, so a station which keeps crashing does not boot
+in a tight loop. The record is written only on crashes and on the first
+good cycle after them, which spares the flash.
+"""
+import credentials
+import gc
+import machine
+import metrics
+import ujson
+import uos
+
+from array import array
+from utime import sleep_ms, ticks_add, ticks_diff, ticks_ms
+
+# subsystems
+SENSOR = 0
+NETWORK = 1
+LOOP = 2
+SUBSYSTEMS = ('sensor', 'network', 'loop')
+
+FILE = 'crashes.json'
+
+WDT_TIMEOUT = 60
+FEED_MS = 1000
+RECOVER_AFTER = 2
+BACKOFF_MS = 30000
+MAX_BACKOFF_MS = 3600000
+LOOP_BUDGET = 5
+RECONNECT_TIMEOUT = 5
+CRASH_BACKOFF_MS = 5000
+MAX_CRASH_BACKOFF_MS = 600000
+
+
+def backoff_ms(first_ms, max_ms, attempt):
+    """Return the wait before an attempt, doubling from first_ms."""
+    return min(max_ms, first_ms << min(attempt, 16))
+
+
+def load():
+    """Return the crash record on flash, an empty one if there is none."""
+    try:
+        with open(FILE) as record_file:
+            record = ujson.load(record_file)
+        if isinstance(record, dict):
+            return record
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def save(record):
+    """Write the crash record to flash."""
+    try:
+        # Replace the record in one step, a power loss keeps the old one.
+        with open(FILE + '.tmp', 'w') as record_file:
+            ujson.dump(record, record_file)
+        uos.rename(FILE + '.tmp', FILE)
+    except OSError as err:
+        print("Crash record not saved:", err)
+
+
+def count_crash(reason, err=None):
+    """Count a crash in the record, return the crashes in a row."""
+    record = load()
+    crashes = record.setdefault('crashes', {})
+    crashes[reason] = crashes.get(reason, 0) + 1
+    record['in_row'] = record.get('in_row', 0) + 1
+    if err is not None:
+        record['last'] = repr(err)
+    save(record)
+    return record['in_row']
+
+
+def crash(reason, err=None):
+    """Count a crash and reset the board."""
+    print("Crash ({}): {!r}, resetting.".format(reason, err))
+    count_crash(reason, err)
+    machine.reset()
+
+
+def run(main):
+    """
+    Run the main() of a station, a crash resets the board.
+
+    A watchdog reset is counted first, and after crashes the start waits
+    with backoff. KeyboardInterrupt is left alone, so the REPL stays
+    reachable.
+    """
+    in_row = load().get('in_row', 0)
+    if machine.reset_cause() == getattr(machine, 'WDT_RESET', None):
+        in_row = count_crash('watchdog')
+    if in_row:
+        wait = backoff_ms(CRASH_BACKOFF_MS, MAX_CRASH_BACKOFF_MS, in_row - 1)
+        print("Crashed", in_row, "times in a row, starting in", wait, "ms.")
+        sleep_ms(wait)
+    try:
+        main()
+    except Exception as err:
+        crash('exception', err)
+
+
+def reconnect_wifi():
+    """Connect WiFi again, with the interface switched off first."""
+    from wifi import wifi_stat
+    wifi_stat.disconnect()
+    if not wifi_stat.connect(RECONNECT_TIMEOUT):
+        raise OSError('WiFi not connected')
+
+
+def wifi_connected():
+    """Return True if the station has a WiFi connection."""
+    from wifi import wifi_stat
+    return wifi_stat.station.isconnected()
+
+
+def _start_watchdog(timeout_ms):
+    """Return the started watchdog, None if it is off or fixed."""
+    if not timeout_ms:
+        return None
+    try:
+        return machine.WDT(timeout=timeout_ms)
+    except TypeError:
+        # The fixed timeout of the ESP8266 would reset the board during
+        # every slow upload.
+        print("Watchdog timeout not supported, watchdog off.")
+        return None
+
+
+class Supervisor():
+    """
+    The watchdog and the failures of the subsystems of a station.
+
+    recoveries are the functions which set a subsystem up again, by
+    subsystem. A recovery raising an exception counts as failed and is
+    tried again after the backoff.
+    """
+
+    def __init__(self, recoveries=None):
+        """Start the watchdog."""
+        self.recoveries = recoveries or {}
+        self.timeout_ms = getattr(credentials, 'wdt_timeout',
+                                  WDT_TIMEOUT) * 1000
+        self.loop_budget = getattr(credentials, 'loop_budget', LOOP_BUDGET)
+        self.failures = array('i', bytes(4 * len(SUBSYSTEMS)))
+        self.attempts = array('i', bytes(4 * len(SUBSYSTEMS)))
+        self.retry_at = array('i', bytes(4 * len(SUBSYSTEMS)))
+        self._cleared = False
+        self.watchdog = _start_watchdog(self.timeout_ms)
+
+    def feed(self):
+        """Feed the watchdog."""
+        if self.watchdog is not None:
+            self.watchdog.feed()
+
+    def sleep_ms(self, duration_ms):
+        """Sleep and keep the watchdog fed."""
+        if self.watchdog is None:
+            sleep_ms(duration_ms)
+            return
+        step = max(1, min(FEED_MS, self.timeout_ms // 2))
+        while duration_ms > 0:
+            self.feed()
+            sleep_ms(min(step, duration_ms))
+            duration_ms -= step
+        self.feed()
+
+    def check(self, subsystem, healthy):
+        """Count a subsystem as failed or working by a check."""
+        if healthy:
+            self.succeeded(subsystem)
+        else:
+            self.failed(subsystem, 'down')
+
+    def start_cycle(self):
+        """Feed the watchdog and check the WiFi before a cycle."""
+        self.feed()
+        self.check(NETWORK, wifi_connected())
+
+    def succeeded(self, subsystem):
+        """Note that a subsystem works."""
+        if self.failures[subsystem]:
+            print("The", SUBSYSTEMS[subsystem], "works again after",
+                  self.failures[subsystem], "failures.")
+            self.failures[subsystem] = 0
+            self.attempts[subsystem] = 0
+        if subsystem == LOOP:
+            self._clear_crashes()
+
+    def failed(self, subsystem, err):
+        """
+        Count a failure of a subsystem and recover it if it is due.
+
+        LOOP failures reset the board once the budget is used up.
+        """
+        self.failures[subsystem] += 1
+        failures = self.failures[subsystem]
+        print("Failure", failures, "of the", SUBSYSTEMS[subsystem] + ":",
+              err)
+        if subsystem == LOOP:
+            metrics.increment(metrics.LOOP_FAILURES)
+            if failures >= self.loop_budget:
+                crash('budget', err)
+            # e.g. a MemoryError, the next cycle gets a tidy heap.
+            gc.collect()
+            return
+        if failures < RECOVER_AFTER or subsystem not in self.recoveries:
+            return
+        if self.attempts[subsystem] and \
+                ticks_diff(ticks_ms(), self.retry_at[subsystem]) < 0:
+            return
+        self._recover(subsystem)
+
+    def _recover(self, subsystem):
+        """Set a subsystem up again and schedule the next attempt."""
+        attempt = self.attempts[subsystem]
+        self.attempts[subsystem] = attempt + 1
+        self.retry_at[subsystem] = ticks_add(
+            ticks_ms(), backoff_ms(BACKOFF_MS, MAX_BACKOFF_MS, attempt))
+        metrics.increment(metrics.RECOVERIES)
+        print("Recovering the", SUBSYSTEMS[subsystem] + ", attempt",
+              attempt + 1)
+        self.feed()
+        try:
+            self.recoveries[subsystem]()
+        except Exception as err:
+            print("Recovery of the", SUBSYSTEMS[subsystem], "failed:", err)
+        self.feed()
+
+    def _clear_crashes(self):
+        """Forget the crashes in a row after the first good cycle."""
+        if self._cleared:
+            return
+        self._cleared = True
+        record = load()
+        if record.get('in_row'):
+            record['in_row'] = 0
+            save(record)
@@ -0,0 +1,105 @@
+"""
+Compact binary telemetry frames, an alternative to the JSON upload.
+
+A frame carries the readings of one upload. All integers are little
+endian, varints are unsigned LEB128 and signed values are zigzag encoded:
+
+    magic         1 byte    0x54 ('T')
+    version       1 byte    1
+    station ID    varint
+    base time     4 bytes   time of the first reading, in seconds since
+                            2000-01-01 (the epoch of the board)
+    count         varint    number of readings
+    count times:
+        unitId      varint
+        sensor tag  varint    0 if untagged, see
+                              uploadformat.py
+        time delta  zigzag    seconds since the previous reading
+        value delta zigzag    in hundredths, against the previous reading
+                              of the same unitId and sensor tag, the
+                              value itself for the first one
+    CRC           2 bytes   CRC-16/CCITT-FALSE of all bytes before
+
+The encoder works on the flat (timestamp, unitId, value, sensor) readings
+of upload.BatchUploader and writes into a preallocated buffer. The
+reference decoder and a relay to the REST API are in host/.
+"""
+
+MAGIC = 0x54
+VERSION = 1
+
+# magic, version, station ID, base time, count
+MAX_HEAD_SIZE = 16
+# unitId, sensor tag, time delta, value delta
+MAX_READING_SIZE = 18
+CRC_SIZE = 2
+
+
+def frame_size(count):
+    """Return the largest size of a frame with count readings."""
+    return MAX_HEAD_SIZE + count * MAX_READING_SIZE + CRC_SIZE
+
+
+def crc16(data, length):
+    """Return the CRC-16/CCITT-FALSE of the first length bytes."""
+    crc = 0xFFFF
+    for i in range(length):
+        crc ^= data[i] << 8
+        for bit in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+
+def _varint(buf, pos, value):
+    """Write an unsigned varint at pos, return the position after it."""
+    while value > 0x7F:
+        buf[pos] = value & 0x7F | 0x80
+        value >>= 7
+        pos += 1
+    buf[pos] = value
+    return pos + 1
+
+
+def _zigzag(buf, pos, value):
+    """Write a signed varint at pos, return the position after it."""
+    if value >= 0:
+        return _varint(buf, pos, value << 1)
+    return _varint(buf, pos, ((-value) << 1) - 1)
+
+
+def encode(buf, station_id, readings, count):
+    """
+    Encode count readings into buf and return the length of the frame.
+
+    buf needs at least frame_size(count) bytes.
+    """
+    buf[0] = MAGIC
+    buf[1] = VERSION
+    pos = _varint(buf, 2, station_id)
+    base = readings[0] if count else 0
+    for shift in (0, 8, 16, 24):
+        buf[pos] = (base >> shift) & 0xFF
+        pos += 1
+    pos = _varint(buf, pos, count)
+    previous_time = base
+    for i in range(0, 4 * count, 4):
+        unit_id = readings[i + 1]
+        tag = readings[i + 3]
+        pos = _varint(buf, pos, unit_id)
+        pos = _varint(buf, pos, tag)
+        pos = _zigzag(buf, pos, readings[i] - previous_time)
+        previous_time = readings[i]
+        # Find the previous reading of the same series.
+        previous = 0
+        for j in range(i - 4, -1, -4):
+            if readings[j + 1] == unit_id and readings[j + 3] == tag:
+                previous = readings[j + 2]
+                break
+        pos = _zigzag(buf, pos, readings[i + 2] - previous)
+    crc = crc16(buf, pos)
+    buf[pos] = crc & 0xFF
+    buf[pos + 1] = crc >> 8
+    return pos + CRC_SIZE
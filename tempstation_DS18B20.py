@@ -0,0 +1,7 @@
+"""A tempstation for DS18B20 probes on a 1-Wire bus posting to an API."""
+import station
+
+
+def main():
+    """Starter function."""
+    station.main('ds18b20')
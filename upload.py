@@ -0,0 +1,392 @@
+"""Batched upload of measured values to the Tempstation API."""
+import credentials
+import metrics
+
+from array import array
+from httpclient import client
+from uploadformat import EPOCH_OFFSET, format_tag
+from utime import ticks_us, time
+
+# Times before 2023-01-01 come from a clock which was never set, e.g. after
+# a power loss the RTC starts at 2000-01-01 again.
+CLOCK_VALID = 725846400
+NTP_HOST = 'pool.ntp.org'
+
+HEADERS = {'Content-Type': 'application/json'}
+FRAME_HEADERS = {'Content-Type': 'application/octet-stream'}
+
+
+def format_hundredths(value):
+    """Return a value in hundredths as a decimal number string."""
+    sign = '-' if value < 0 else ''
+    value = abs(value)
+    return '{}{}.{:02d}'.format(sign, value // 100, value % 100)
+
+
+def _sensor_field(tag):
+    """Return the JSON sensor field of a reading, if it is tagged."""
+    if not tag:
+        return ''
+    return ',"sensor":"{}"'.format(format_tag(tag))
+
+
+def _timestamp_field(timestamp):
+    """Return the JSON timestamp field of a reading, if its clock was set."""
+    if timestamp < CLOCK_VALID:
+        return ''
+    return ',"timestamp":{}'.format(timestamp + EPOCH_OFFSET)
+
+
+def _stamped(readings, count):
+    """Return True if the clock was set for all readings."""
+    for i in range(0, 4 * count, 4):
+        if readings[i] < CLOCK_VALID:
+            return False
+    return True
+
+
+def sync_clock():
+    """
+    Set the clock by NTP if it was never set, return the seconds it moved.
+
+    The server is credentials.ntp_host, None turns the sync off. A failed
+    sync returns 0 and is tried again with the next upload.
+    """
+    host = getattr(credentials, 'ntp_host', NTP_HOST)
+    if not host or time() >= CLOCK_VALID:
+        return 0
+    try:
+        import ntptime
+        ntptime.host = host
+        before = time()
+        ntptime.settime()
+    except (ImportError, OSError, OverflowError) as err:
+        print("Clock not synced:", err)
+        return 0
+    print("Clock synced by NTP.")
+    return time() - before
+
+
+def create_uploader(station_id, client_id=None):
+    """
+    Return an uploader configured by the credentials.
+
+    The client ID, e.g. the MAC address, identifies the station at an MQTT
+    broker if credentials.mqtt_broker is set.
+    """
+    buffer = None
+    if getattr(credentials, 'store_and_forward', False):
+        import ringbuffer
+        buffer = ringbuffer.RingBuffer()
+    transport = None
+    if getattr(credentials, 'mqtt_broker', None):
+        import mqtttransport
+        transport = mqtttransport.create_transport(station_id, client_id)
+    return BatchUploader(
+        station_id, getattr(credentials, 'batch_cycles', 1), buffer=buffer,
+        telemetry_url=getattr(credentials, 'post_telemetry', None),
+        transport=transport)
+
+
+class BatchUploader():
+    """
+    Collect readings and post them to the API in one request.
+
+    The readings of one or more measuring cycles are sent as one JSON array
+    of {value, unitId, timestamp} objects to credentials.post_batch_data.
+    If the server rejects the batch, every reading is posted on its own to
+    credentials.post_data, like the stations did before.
+
+    The clock is set by NTP before the first upload, see sync_clock. The
+    readings taken before are moved by the time the clock moved. A reading
+    still taken with an unset clock is sent without timestamp, so the
+    server stamps it on arrival instead of storing it in 2000.
+
+    Readings are integers in hundredths of their unit. They are kept as
+    (timestamp, unitId, value, sensor) records in a preallocated array and
+    only turned into JSON when they are uploaded, so measuring allocates
+    nothing. A sensor tag other than 0 is sent as "sensor" of the reading,
+    see format_tag.
+
+    Readings of aggregate.py may have the minimum and maximum of their
+    window, kept next to the records and sent as "min" and "max" of the
+    reading. They are only kept in memory: the ring buffer and the frames
+    carry the value alone.
+
+    If the API is unreachable the readings are kept and sent with the next
+    upload. With a ring buffer, every cycle is written to flash first and
+    the buffer is drained oldest first in batches of MAX_BATCH readings,
+    otherwise up to MAX_READINGS readings are kept in memory.
+
+    With a telemetry URL, e.g. of the relay in host/telemetry_bridge.py,
+    the readings are posted as one binary frame instead, see telemetry.py.
+    With a transport, e.g. mqtttransport.MQTTTransport, the JSON batch is
+    given to its publish method instead of being posted.
+    """
+
+    MAX_BATCH = 32
+    MAX_READINGS = 96
+
+    def __init__(self, station_id, cycles=1, batch_url=None, single_url=None,
+                 buffer=None, telemetry_url=None, transport=None):
+        """Prepare an uploader for the station with the given ID."""
+        if batch_url is None:
+            batch_url = getattr(credentials, 'post_batch_data', None)
+        if single_url is None:
+            single_url = credentials.post_data
+        self.batch_url = None
+        if batch_url:
+            self.batch_url = batch_url.format(station_ID=station_id)
+        self.single_url = single_url.format(station_ID=station_id)
+        self.station_id = station_id
+        self.telemetry_url = telemetry_url
+        self.transport = transport
+        self.metrics_url = getattr(credentials, 'post_metrics', None)
+        if self.metrics_url:
+            self.metrics_url = self.metrics_url.format(station_ID=station_id)
+        self._frame = None
+        self.cycles = max(1, cycles)
+        self.buffer = buffer
+        self.readings = array('i', bytes(16 * self.MAX_READINGS))
+        # minimum and maximum of every reading, allocated on first use
+        self.extremes = None
+        self.count = 0
+        self.sent = 0
+        self.pending_cycles = 0
+
+    def add(self, value, unit_id, timestamp=None, sensor=0, low=None,
+            high=None):
+        """
+        Add a reading in hundredths of its unit to the current batch.
+
+        low and high are the minimum and maximum of an aggregated value.
+        """
+        if timestamp is None:
+            timestamp = time()
+        readings = self.readings
+        if self.count >= self.MAX_READINGS:
+            # Drop the oldest reading.
+            self._forget(1)
+        i = 4 * self.count
+        readings[i] = timestamp
+        readings[i + 1] = unit_id
+        readings[i + 2] = value
+        readings[i + 3] = sensor
+        if low is not None and self.buffer is None:
+            if self.extremes is None:
+                self.extremes = array('i', bytes(8 * self.MAX_READINGS))
+            self.extremes[2 * self.count] = low
+            self.extremes[2 * self.count + 1] = high
+        elif self.extremes is not None:
+            # No extremes, shown by a minimum above the maximum.
+            self.extremes[2 * self.count] = 1
+            self.extremes[2 * self.count + 1] = 0
+        self.count += 1
+
+    def end_cycle(self):
+        """Close a measuring cycle and upload if enough cycles are pending."""
+        self.pending_cycles += 1
+        self._sync()
+        self._store()
+        if self.pending_cycles >= self.cycles:
+            self.flush()
+
+    def flush(self):
+        """Upload all pending readings, return False if the API failed."""
+        try:
+            if self.buffer is None:
+                if self.count:
+                    try:
+                        self._send(self.readings, self.count)
+                    except OSError:
+                        self._forget(self.sent)
+                        raise
+                self.count = 0
+            else:
+                self._store()
+                self._drain()
+        except OSError as err:
+            print("Upload failed, keeping the readings:", err)
+            metrics.increment(metrics.UPLOAD_FAILURES)
+            return False
+        self.pending_cycles = 0
+        return True
+
+    def _sync(self):
+        """Set the clock if needed and move the kept readings with it."""
+        if time() >= CLOCK_VALID:
+            return
+        moved = sync_clock()
+        if not moved:
+            return
+        readings = self.readings
+        for i in range(0, 4 * self.count, 4):
+            if readings[i] < CLOCK_VALID:
+                readings[i] += moved
+
+    def close(self):
+        """Save the state of the ring buffer, e.g. before a deep sleep."""
+        if self.buffer is not None:
+            self.buffer.close()
+
+    def _forget(self, count):
+        """Drop the count oldest readings of the current batch."""
+        if not count:
+            return
+        readings = self.readings
+        for i in range(4 * count, 4 * self.count):
+            readings[i - 4 * count] = readings[i]
+        extremes = self.extremes
+        if extremes is not None:
+            for i in range(2 * count, 2 * self.count):
+                extremes[i - 2 * count] = extremes[i]
+        self.count -= count
+
+    def _store(self):
+        """Move the readings into the ring buffer, if there is one."""
+        if self.buffer is not None and self.count:
+            self.buffer.append(self.readings, self.count)
+            self.count = 0
+
+    def _drain(self):
+        """Upload the ring buffer in batches, oldest readings first."""
+        # The readings array is empty while a ring buffer is used.
+        batch = self.readings
+        while len(self.buffer):
+            count, seq = self.buffer.peek(
+                batch, min(self.MAX_BATCH, self.MAX_READINGS))
+            if not count:
+                # Only damaged records are left.
+                self.buffer.ack(self.buffer.head)
+                return
+            try:
+                self._send(batch, count)
+            except OSError:
+                if self.sent:
+                    # Ack the readings posted before the failure.
+                    self.buffer.ack(self.buffer.peek(batch, self.sent)[1])
+                raise
+            self.buffer.ack(seq)
+
+    def _send(self, readings, count):
+        """
+        Send the readings with the transport, as a frame or a batch.
+
+        If it fails, sent is the number of the oldest readings which got
+        through anyway, posted one by one.
+        """
+        self.sent = 0
+        if self.transport is not None:
+            self.transport.publish(self._batch_body(readings, count))
+            print("Published batch of", count)
+        elif self.telemetry_url and _stamped(readings, count):
+            # A frame always has times, readings without go as JSON.
+            self._post_frame(readings, count)
+        elif not self.batch_url or not self._post_batch(readings, count):
+            self._post_single(readings, count)
+
+    def _post_frame(self, readings, count):
+        """Post all readings as one binary telemetry frame."""
+        import telemetry
+        if self._frame is None:
+            self._frame = bytearray(telemetry.frame_size(
+                max(self.MAX_BATCH, self.MAX_READINGS)))
+        start = ticks_us()
+        length = telemetry.encode(self._frame, self.station_id, readings,
+                                  count)
+        metrics.stop(metrics.ENCODE, start)
+        resp = client.post(
+            self.telemetry_url,
+            data=self._frame[:length],
+            headers=FRAME_HEADERS
+        )
+        status = resp.status_code
+        print("Sending frame of", count, length, "bytes", status,
+              resp.latency_ms, "ms")
+        resp.close()
+        if not 200 <= status < 300:
+            raise OSError('Telemetry relay error {}'.format(status))
+
+    def _batch_body(self, readings, count):
+        """Return the readings as a JSON array."""
+        start = ticks_us()
+        objects = []
+        for i in range(0, 4 * count, 4):
+            objects.append('{{"value":{},"unitId":{}{}{}}}'.format(
+                format_hundredths(readings[i + 2]), readings[i + 1],
+                _timestamp_field(readings[i]),
+                _sensor_field(readings[i + 3]) +
+                self._extremes_field(i // 4)))
+        body = '[' + ','.join(objects) + ']'
+        metrics.stop(metrics.ENCODE, start)
+        return body
+
+    def _extremes_field(self, index):
+        """Return the JSON min and max of a kept reading, if it has them."""
+        extremes = self.extremes
+        if extremes is None:
+            return ''
+        low = extremes[2 * index]
+        high = extremes[2 * index + 1]
+        if low > high:
+            return ''
+        return ',"min":{},"max":{}'.format(format_hundredths(low),
+                                           format_hundredths(high))
+
+    def _post_batch(self, readings, count):
+        """Post all readings in one request, return False if rejected."""
+        resp = client.post(
+            self.batch_url,
+            data=self._batch_body(readings, count),
+            headers=HEADERS
+        )
+        status = resp.status_code
+        print("Sending batch of", count, status, resp.latency_ms, "ms")
+        resp.close()
+        if 200 <= status < 300:
+            return True
+        if 400 <= status < 500:
+            # The server has no batch endpoint, don't try it again.
+            print("Batch rejected, posting readings one by one.")
+            self.batch_url = None
+        return False
+
+    def send_metrics(self, body):
+        """
+        Send a JSON summary of metrics.py, return False if it failed.
+
+        It is published to the metrics topic of the transport or posted to
+        credentials.post_metrics.
+        """
+        try:
+            if self.transport is not None:
+                self.transport.publish(body, self.transport.metrics_topic)
+                return True
+            if not self.metrics_url:
+                return False
+            resp = client.post(self.metrics_url, data=body, headers=HEADERS)
+            resp.close()
+            print("Sending metrics", resp.status_code)
+            return 200 <= resp.status_code < 300
+        except OSError as err:
+            print("Metrics not sent:", err)
+            return False
+
+    def _post_single(self, readings, count):
+        """Post every reading in its own request."""
+        for i in range(0, 4 * count, 4):
+            resp = client.post(
+                self.single_url,
+                data='{{"value":{},"unitId":{}{}{}}}'.format(
+                    format_hundredths(readings[i + 2]), readings[i + 1],
+                    _timestamp_field(readings[i]),
+                    _sensor_field(readings[i + 3]) +
+                    self._extremes_field(i // 4)),
+                headers=HEADERS
+            )
+            print("Sending", readings[i + 1], resp.status_code,
+                  resp.latency_ms, "ms", resp.text)
+            resp.close()
+            if resp.status_code >= 500:
+                raise OSError('Server error {}'.format(resp.status_code))
+            self.sent += 1
@@ -0,0 +1,26 @@
+"""
+The format of the readings in the upload, shared with the host tools.
+
+The module is plain Python without credentials, so the relay and the
+benchmarks in host/ use it as it is.
+"""
+
+# Seconds between the Unix epoch and the epoch of the board (2000-01-01).
+EPOCH_OFFSET = 946684800
+
+
+def format_tag(tag):
+    """
+    Return a sensor tag as the sensor name in the JSON upload.
+
+    The low byte of a tag is the address of the sensor, the high byte its
+    position on the bus plus one, e.g. the channel of a multiplexer. A tag
+    is formatted like 0x76 or 2:0x77. A DS18B20 has its family code 0x28
+    in the low byte and a byte of its serial number in the high byte, see
+    ds18b20.probe_tags, and is formatted like 28-3f.
+    """
+    if tag & 0xFF == 0x28:
+        return '28-{:02x}'.format(tag >> 8)
+    if tag >> 8:
+        return '{}:0x{:02x}'.format((tag >> 8) - 1, tag & 0xFF)
+    return '0x{:02x}'.format(tag)
@@ -1,26 +1,190 @@
 """A Wifi station for the ESP8266 board."""
 import credentials
 import network
+import ujson
+import uos
+
+from ubinascii import hexlify, unhexlify
+from utime import sleep_ms, ticks_diff, ticks_ms
+
+# Connection states after which waiting longer does not help.
+FAILED = tuple(getattr(network, name) for name in (
+    'STAT_WRONG_PASSWORD', 'STAT_NO_AP_FOUND', 'STAT_CONNECT_FAIL')
+    if hasattr(network, name))
 
 
 class WiFiStation():
-    """A WiFi Station for the ESP8266."""
+    """
+    A WiFi Station for the ESP8266.
+
+    The BSSID and channel of the access point and the IP configuration of
+    the last connection are cached on flash. A connection is first tried
+    with them, which skips the scan, and then with a scan for the strongest
+    access point of the SSID. Connecting gives up after
+    credentials.wifi_timeout seconds, the attempts are retried with
+    exponential backoff. credentials.wifi_static_ip = True also reuses the
+    cached IP configuration, which skips DHCP but breaks when the DHCP
+    server hands the address to another device.
+
+    The time of the last connection is kept in connect_ms, whether the
+    cache was used in fast and the number of attempts in attempts.
+    """
 
     ssid = credentials.ssid
     password = credentials.password
     station = network.WLAN(network.STA_IF)
 
-    def connect(self):
-        """Connect to WiFi."""
+    FILE = 'wifi.json'
+    TIMEOUT = 20
+    FAST_MS = 3000
+    ATTEMPT_MS = 8000
+    BACKOFF_MS = 500
+    POLL_MS = 50
+
+    def __init__(self, path=FILE):
+        """Prepare the station with the cache file at path."""
+        self.path = path
+        self.static_ip = getattr(credentials, 'wifi_static_ip', False)
+        self.connect_ms = 0
+        self.fast = False
+        self.attempts = 0
+        self.connects = 0
+        self.failures = 0
+        self._target = None
+
+    def connect(self, timeout=None):
+        """Connect to WiFi, return False if it failed within the timeout."""
         if self.station.isconnected() is True:
             print("Already connected")
-            return
+            return True
+        if timeout is None:
+            timeout = getattr(credentials, 'wifi_timeout', self.TIMEOUT)
+        timeout *= 1000
+        start = ticks_ms()
         self.station.active(True)
-        self.station.connect(self.ssid, self.password)
-        print("Connection successful")
+        self.attempts = 0
+        self.fast = False
+        cache = self._load()
+        if cache is not None:
+            self.fast = self._connect_cached(cache, min(self.FAST_MS,
+                                                        timeout))
+        connected = self.fast
+        backoff = self.BACKOFF_MS
+        while not connected:
+            left = timeout - ticks_diff(ticks_ms(), start)
+            if left <= 0:
+                break
+            self._connect_best()
+            connected = self._wait(min(self.ATTEMPT_MS, left))
+            if not connected:
+                left = timeout - ticks_diff(ticks_ms(), start)
+                sleep_ms(max(0, min(backoff, left)))
+                backoff *= 2
+        self.connect_ms = ticks_diff(ticks_ms(), start)
+        if not connected:
+            self.failures += 1
+            print("Connection failed after", self.attempts, "attempts in",
+                  self.connect_ms, "ms")
+            return False
+        self.connects += 1
+        print("Connection successful in", self.connect_ms, "ms, attempts:",
+              self.attempts, "cached:", self.fast)
+        self._save(cache)
+        return True
 
     def disconnect(self):
         """Disconnect from WiFi."""
         self.station.active(False)
 
+    def _connect_cached(self, cache, timeout_ms):
+        """Connect to the cached access point with the cached IP."""
+        self.attempts += 1
+        static = self.static_ip and cache.get('ip')
+        if static:
+            # A static configuration skips DHCP.
+            self.station.ifconfig(tuple(cache['ip']))
+        self._target = (cache['bssid'], cache['channel'])
+        self.station.connect(self.ssid, self.password,
+                             bssid=unhexlify(cache['bssid']))
+        if self._wait(timeout_ms):
+            return True
+        print("Cached access point not reached, scanning.")
+        if static:
+            self._use_dhcp()
+        return False
+
+    def _connect_best(self):
+        """Connect to the strongest access point of the SSID."""
+        self.attempts += 1
+        ssid = self.ssid.encode()
+        best = None
+        try:
+            for found in self.station.scan():
+                if found[0] == ssid and (
+                        best is None or found[3] > best[3]):
+                    best = found
+        except OSError as err:
+            print("Scan failed:", err)
+        if best is None:
+            # Leave the search to the SDK, e.g. for a hidden SSID.
+            self._target = None
+            self.station.connect(self.ssid, self.password)
+            return
+        self._target = (hexlify(best[1]).decode(), best[2])
+        self.station.connect(self.ssid, self.password, bssid=best[1])
+
+    def _wait(self, timeout_ms):
+        """Wait for an IP address, return False on failure or timeout."""
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) < timeout_ms:
+            if self.station.isconnected():
+                return True
+            if self.station.status() in FAILED:
+                return False
+            sleep_ms(self.POLL_MS)
+        return False
+
+    def _use_dhcp(self):
+        """Switch back to DHCP after a static IP configuration."""
+        try:
+            self.station.ipconfig(dhcp4=True)
+        except (AttributeError, OSError, TypeError):
+            # Older firmware has no way back until a reset. Forget the
+            # cached IP, so the next boot does not set it again.
+            print("DHCP back after the next reset.")
+            self.static_ip = False
+            try:
+                uos.remove(self.path)
+            except OSError:
+                pass
+
+    def _load(self):
+        """Return the cached connection, None if there is none."""
+        try:
+            with open(self.path) as cache:
+                data = ujson.load(cache)
+            if data['ssid'] == self.ssid:
+                return data
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def _save(self, cache):
+        """Cache the current connection on flash if it changed."""
+        if self._target is None:
+            return
+        data = {
+            'ssid': self.ssid,
+            'bssid': self._target[0],
+            'channel': self._target[1],
+        }
+        if self.static_ip:
+            data['ip'] = list(self.station.ifconfig())
+        if data == cache:
+            # Spare the flash.
+            return
+        with open(self.path + '.tmp', 'w') as cache_file:
+            ujson.dump(data, cache_file)
+        uos.rename(self.path + '.tmp', self.path)
+
 wifi_stat = WiFiStation()